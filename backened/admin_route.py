@@ -3,61 +3,20 @@ import sqlite3
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import datetime
-from contextlib import contextmanager
+from cache import query_cache
+from backup import backups
+from maintenance import scheduler
+from database import DatabaseBusy, contention, get_db_connection, pool, read_pool, write_transaction
+from replica import get_snapshot_connection, snapshot_age
+from idempotency import store as idempotency_store
+from journal import journal
+from voted import voted
 
 admin_bp = Blueprint('admin', __name__)
 
 # Configuration
 JWT_SECRET_KEY = 'your-secret-key-here'
 
-# Database context manager
-@contextmanager
-def get_db_connection():
-    conn = sqlite3.connect("garissa_voting.db")
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
-
-def init_admin_db():
-    with get_db_connection() as conn:
-        # Admin table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS admins (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Candidates table (approved delegates who can be voted for)
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS candidates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                delegate_id INTEGER,
-                faculty TEXT NOT NULL,
-                full_name TEXT NOT NULL,
-                registration_number TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (delegate_id) REFERENCES delegates (id)
-            )
-        ''')
-        
-        # Create default admin if doesn't exist
-        admin_exists = conn.execute("SELECT * FROM admins WHERE username = ?", ["admin"]).fetchone()
-        if not admin_exists:
-            conn.execute(
-                "INSERT INTO admins (username, password) VALUES (?, ?)",
-                ["admin", generate_password_hash("admin123")]
-            )
-        
-        conn.commit()
-
-# Initialize admin database
-init_admin_db()
-
 # Admin login endpoint
 @admin_bp.route("/api/admin/login", methods=["POST", "OPTIONS"])
 def admin_login():
@@ -132,7 +91,7 @@ def approve_delegate(delegate_id):
         return response, 200
         
     try:
-        with get_db_connection() as conn:
+        with write_transaction() as conn:
             # Get delegate info
             delegate = conn.execute(
                 "SELECT * FROM delegates WHERE id = ?",
@@ -160,6 +119,8 @@ def approve_delegate(delegate_id):
             conn.commit()
             
         return jsonify({"message": "Delegate approved successfully"}), 200
+    except DatabaseBusy:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -173,11 +134,13 @@ def remove_delegate(delegate_id):
         return response, 200
         
     try:
-        with get_db_connection() as conn:
+        with write_transaction() as conn:
             conn.execute("DELETE FROM delegates WHERE id = ?", [delegate_id])
             conn.commit()
             
         return jsonify({"message": "Delegate removed successfully"}), 200
+    except DatabaseBusy:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -209,16 +172,144 @@ def get_results():
         return response, 200
         
     try:
-        with get_db_connection() as conn:
+        with get_snapshot_connection() as conn:
             results = [dict(row) for row in conn.execute(
                 '''
-                SELECT c.faculty, c.full_name, c.registration_number, COUNT(v.id) as vote_count
+                SELECT c.faculty, c.full_name, c.registration_number, COALESCE(t.votes, 0) as vote_count
                 FROM candidates c
-                LEFT JOIN votes v ON c.id = v.candidate_id
-                GROUP BY c.id, c.faculty, c.full_name, c.registration_number
+                LEFT JOIN tallies t ON t.position = 'delegate' AND t.candidate_id = c.id
                 ORDER BY c.faculty, vote_count DESC
                 '''
             ).fetchall()]
-        return jsonify(results)
+            age = snapshot_age(conn)
+        response = jsonify(results)
+        response.headers["X-Snapshot-Age"] = str(age)
+        return response
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+# Write-lock contention per endpoint
+@admin_bp.route("/api/admin/db/contention", methods=["GET", "OPTIONS"])
+def get_contention():
+    if request.method == "OPTIONS":
+        response = jsonify({"status": "ok"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    return jsonify({
+        "endpoints": contention.snapshot(),
+        "pool": pool.stats(),
+        "read_pool": read_pool.stats(),
+    })
+
+# Query cache hit rates, and the Idempotency-Key store behind the ballot endpoints
+@admin_bp.route("/api/admin/db/cache", methods=["GET", "OPTIONS"])
+def get_cache_stats():
+    if request.method == "OPTIONS":
+        response = jsonify({"status": "ok"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    return jsonify(dict(query_cache.stats(), idempotency=idempotency_store.stats()))
+
+# Background maintenance: last runs, space reclaimed, integrity
+@admin_bp.route("/api/admin/db/maintenance", methods=["GET", "OPTIONS"])
+def get_maintenance():
+    if request.method == "OPTIONS":
+        response = jsonify({"status": "ok"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    return jsonify(scheduler.status())
+
+# Run maintenance now, stopping early if ballots arrive
+@admin_bp.route("/api/admin/db/maintenance/run", methods=["POST", "OPTIONS"])
+def run_maintenance():
+    if request.method == "OPTIONS":
+        response = jsonify({"status": "ok"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    if scheduler.running:
+        return jsonify({"error": "Maintenance is already running"}), 409
+    try:
+        report = scheduler.run()
+        response = jsonify(report)
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response, 200
+    except Exception as e:
+        return jsonify({"error": f"Maintenance failed: {str(e)}"}), 500
+
+# Online backups: progress, last good snapshot, snapshots on disk
+@admin_bp.route("/api/admin/db/backup", methods=["GET", "OPTIONS"])
+def get_backup_status():
+    if request.method == "OPTIONS":
+        response = jsonify({"status": "ok"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    return jsonify(backups.status())
+
+# Take a snapshot now
+@admin_bp.route("/api/admin/db/backup/run", methods=["POST", "OPTIONS"])
+def run_backup():
+    if request.method == "OPTIONS":
+        response = jsonify({"status": "ok"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    if backups.running:
+        return jsonify({"error": "A backup is already running"}), 409
+    try:
+        report = backups.run(force=True)
+        if not report["ok"]:
+            return jsonify({"error": f"Backup failed: {report['error']}"}), 500
+        response = jsonify(report)
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response, 200
+    except Exception as e:
+        return jsonify({"error": f"Backup failed: {str(e)}"}), 500
+
+# Voted-set behind the vote-status checks: size, memory footprint, syncs
+@admin_bp.route("/api/admin/voted", methods=["GET", "OPTIONS"])
+def get_voted_status():
+    if request.method == "OPTIONS":
+        response = jsonify({"status": "ok"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    return jsonify(voted.stats())
+
+# Reload the voted-set from the ballot ledgers
+@admin_bp.route("/api/admin/voted/rebuild", methods=["POST", "OPTIONS"])
+def rebuild_voted():
+    if request.method == "OPTIONS":
+        response = jsonify({"status": "ok"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    try:
+        response = jsonify(voted.rebuild())
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response, 200
+    except Exception as e:
+        return jsonify({"error": f"Rebuild failed: {str(e)}"}), 500
+
+# Ballot journal: size, batches appended, time spent in fsync
+@admin_bp.route("/api/admin/journal", methods=["GET", "OPTIONS"])
+def get_journal_status():
+    if request.method == "OPTIONS":
+        response = jsonify({"status": "ok"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    return jsonify(journal.stats())
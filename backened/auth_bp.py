@@ -3,7 +3,8 @@ import sqlite3
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import datetime
-from contextlib import contextmanager
+from database import DB_PATH, DatabaseBusy, get_db_connection, write_transaction
+from identity import normalize_reg_number
 import os
 from flask_cors import CORS
 
@@ -11,64 +12,9 @@ auth_bp = Blueprint('auth', __name__)
 
 # Configuration
 JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-strong-secret-key-here')
-DB_PATH = os.path.join(os.getcwd(), "garissa_voting.db")
 
 print(f"Database path: {DB_PATH}")
 
-# Database context manager
-@contextmanager
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
-
-def init_auth_db():
-    """Initialize authentication tables in the existing database"""
-    with get_db_connection() as conn:
-        # Create users table if it doesn't exist
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                registration_number TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                user_type TEXT NOT NULL,
-                full_name TEXT,
-                is_active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Check if sample users exist, create them if not
-        admin_exists = conn.execute(
-            "SELECT id FROM users WHERE registration_number = 'admin001'"
-        ).fetchone()
-        
-        if not admin_exists:
-            conn.execute(
-                "INSERT INTO users (registration_number, password_hash, user_type, full_name) VALUES (?, ?, ?, ?)",
-                ('admin001', generate_password_hash('admin123'), 'admin', 'System Administrator')
-            )
-            print("Created admin user: admin001/admin123")
-        
-        student_exists = conn.execute(
-            "SELECT id FROM users WHERE registration_number = 'student001'"
-        ).fetchone()
-        
-        if not student_exists:
-            conn.execute(
-                "INSERT INTO users (registration_number, password_hash, user_type, full_name) VALUES (?, ?, ?, ?)",
-                ('student001', generate_password_hash('student123'), 'student', 'John Student')
-            )
-            print("Created student user: student001/student123")
-        
-        conn.commit()
-
-# Initialize database tables
-init_auth_db()
-
 # ------------------ AUTHENTICATION ROUTES ------------------
 
 # Login user
@@ -90,7 +36,7 @@ def login_user():
         return jsonify({"error": "Registration number, password, and user type are required"}), 400
 
     try:
-        reg_number = str(data["registrationNumber"]).strip().replace(" ", "")
+        reg_number = normalize_reg_number(data["registrationNumber"])
         password = str(data["password"]).strip()
         user_type = str(data["userType"]).strip()
         
@@ -98,7 +44,7 @@ def login_user():
 
         with get_db_connection() as conn:
             user = conn.execute(
-                "SELECT * FROM users WHERE registration_number = ? AND user_type = ? AND is_active = TRUE",
+                "SELECT * FROM users WHERE reg_key = ? AND user_type = ? AND is_active = TRUE",
                 [reg_number, user_type]
             ).fetchone()
 
@@ -200,10 +146,10 @@ def create_user():
         return jsonify({"error": "Password must be at least 8 characters"}), 400
 
     try:
-        with get_db_connection() as conn:
-            clean_reg_number = str(data["registrationNumber"]).strip().upper()
+        with write_transaction() as conn:
+            clean_reg_number = normalize_reg_number(data["registrationNumber"])
             existing_user = conn.execute(
-                "SELECT * FROM users WHERE registration_number = ?",
+                "SELECT * FROM users WHERE reg_key = ?",
                 [clean_reg_number]
             ).fetchone()
             if existing_user:
@@ -230,6 +176,8 @@ def create_user():
             "user_id": user_id,
         }), 201
 
+    except DatabaseBusy:
+        raise
     except sqlite3.IntegrityError:
         return jsonify({"error": "Registration number already exists"}), 409
     except Exception as e:
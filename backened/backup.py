@@ -0,0 +1,188 @@
+"""Online backups taken while voting continues.
+
+Every BACKUP_INTERVAL_SECONDS (skipped when nothing was committed since the
+last good snapshot) the database is copied with the SQLite backup API into
+BACKUP_DIR/backup-YYYYmmdd-HHMMSS/. The copy runs BACKUP_PAGES_PER_STEP
+pages at a time with a pause between steps, inside one read transaction:
+in WAL mode that never blocks writers,
+and the copy is a consistent snapshot instead of restarting whenever a
+ballot lands. Snapshots are quick_checked before they count as good, and
+only the newest BACKUP_KEEP are kept. Take one by hand with
+`python backup.py`.
+"""
+import glob
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from cache import data_versions
+from database import DB_PATH, connect
+
+# Configuration
+BACKUP_ENABLED = os.environ.get('DB_BACKUP', '1') != '0'
+BACKUP_DIR = os.environ.get('BACKUP_DIR', os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "backups"))
+BACKUP_INTERVAL = float(os.environ.get('BACKUP_INTERVAL_SECONDS', '300'))
+BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP', '100'))
+BACKUP_STEP_SLEEP = float(os.environ.get('BACKUP_STEP_SLEEP_MS', '10')) / 1000.0
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', '24'))
+HISTORY_SIZE = 20
+
+
+def copy_database(source_path, dest_path, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP, progress=None):
+    """Copy source_path to dest_path a few pages at a time; returns the number of steps"""
+    source = connect(source_path, readonly=True)
+    source.isolation_level = None
+    dest = sqlite3.connect(dest_path)
+    steps = 0
+
+    def step(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        if progress:
+            progress(total - remaining, total)
+        # The module only sleeps between steps on SQLITE_BUSY, so pace the copy here
+        if remaining:
+            time.sleep(sleep)
+
+    try:
+        # Pin one snapshot: without an open read transaction every commit restarts the copy
+        source.execute("BEGIN")
+        source.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+        source.backup(dest, pages=pages, progress=step)
+        source.execute("COMMIT")
+        result = dest.execute("PRAGMA quick_check").fetchone()[0]
+        if result != "ok":
+            raise sqlite3.DatabaseError(f"snapshot of {os.path.basename(source_path)} failed quick_check: {result}")
+    finally:
+        dest.close()
+        source.close()
+    return steps
+
+
+class BackupService:
+    def __init__(self, path=None, directory=BACKUP_DIR, interval=BACKUP_INTERVAL, keep=BACKUP_KEEP):
+        self.path = path
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.running = False
+        self.progress = None
+        self.last_good = None
+        self.last_error = None
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self._data_version = None
+        self._run_lock = threading.Lock()
+        self._thread = None
+
+    def _set_progress(self, name, copied, total):
+        self.progress = {"file": name, "pages_copied": copied, "pages_total": total}
+
+    def run(self, force=False):
+        """Take one snapshot; returns its report, or None when nothing changed since the last one"""
+        with self._run_lock:
+            data_version = data_versions.current()
+            if not force and self.last_good is not None and data_version == self._data_version:
+                return None
+            self.running = True
+            try:
+                report = self._run()
+            finally:
+                self.running = False
+                self.progress = None
+        self.history.appendleft(report)
+        if report["ok"]:
+            self._data_version = data_version
+            self.last_good = report
+            self.last_error = None
+            self._prune()
+            print(f"Backup {report['name']}: {report['bytes']} bytes in {report['duration_ms']} ms")
+        else:
+            self.last_error = report["error"]
+            print(f"Backup {report['name']} failed: {report['error']}")
+        return report
+
+    def _run(self):
+        start = time.monotonic()
+        name = time.strftime("backup-%Y%m%d-%H%M%S")
+        if os.path.exists(os.path.join(self.directory, name)):
+            name += f"-{int(time.time() * 1000) % 1000:03d}"
+        final = os.path.join(self.directory, name)
+        partial = final + ".part"
+        report = {"name": name, "path": final, "taken_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                  "files": 0, "bytes": 0, "steps": 0, "ok": False, "error": None}
+        source_path = self.path or DB_PATH
+        relative = os.path.basename(source_path)
+        try:
+            os.makedirs(partial, exist_ok=True)
+            dest_path = os.path.join(partial, relative)
+            report["steps"] += copy_database(
+                source_path, dest_path,
+                progress=lambda copied, total: self._set_progress(relative, copied, total),
+            )
+            report["files"] += 1
+            report["bytes"] += os.path.getsize(dest_path)
+            # Only complete snapshots ever carry the final name
+            os.rename(partial, final)
+            report["ok"] = True
+        except (sqlite3.Error, OSError) as e:
+            report["error"] = str(e)
+            shutil.rmtree(partial, ignore_errors=True)
+        report["duration_ms"] = round((time.monotonic() - start) * 1000, 1)
+        return report
+
+    def _prune(self):
+        for old in self.snapshots()[self.keep:]:
+            shutil.rmtree(os.path.join(self.directory, old), ignore_errors=True)
+
+    def snapshots(self):
+        """Names of complete snapshots, newest first"""
+        paths = glob.glob(os.path.join(self.directory, "backup-*"))
+        return sorted((os.path.basename(p) for p in paths if not p.endswith(".part")), reverse=True)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Backup failed: {e}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="db-backup", daemon=True)
+            self._thread.start()
+
+    def status(self):
+        return {
+            "enabled": BACKUP_ENABLED,
+            "running": self.running,
+            "progress": self.progress,
+            "interval_seconds": self.interval,
+            "pages_per_step": BACKUP_PAGES_PER_STEP,
+            "step_sleep_ms": BACKUP_STEP_SLEEP * 1000,
+            "last_good": self.last_good,
+            "last_error": self.last_error,
+            "snapshots": self.snapshots(),
+            "history": list(self.history),
+        }
+
+
+backups = BackupService()
+
+
+def start_backups():
+    if BACKUP_ENABLED:
+        backups.start()
+
+
+__all__ = ['BackupService', 'backups', 'copy_database', 'start_backups']
+
+
+if __name__ == "__main__":
+    report = backups.run(force=True)
+    if not report["ok"]:
+        raise SystemExit(report["error"])
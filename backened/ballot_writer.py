@@ -0,0 +1,159 @@
+import os
+import queue
+import threading
+import time
+
+from database import begin_immediate, connect, write_transaction
+from journal import journal
+from replica import replica
+
+# Configuration
+WRITER_ENABLED = os.environ.get('BALLOT_WRITER', '1') != '0'
+BATCH_SIZE = int(os.environ.get('BALLOT_BATCH_SIZE', '64'))
+# Extra time the first ballot of a batch may wait for company; 0 batches whatever
+# queued up while the previous commit was running
+BATCH_WAIT_MS = float(os.environ.get('BALLOT_BATCH_WAIT_MS', '0'))
+# Batches are few, so every acknowledged ballot can afford a real fsync
+SYNCHRONOUS = os.environ.get('BALLOT_SYNCHRONOUS', 'FULL')
+
+
+class _Job:
+    __slots__ = ("fn", "done", "result", "error")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BallotWriter:
+    """Single writer thread that commits queued ballots in small batches.
+
+    A job is a callable taking the writer connection and returning
+    (payload, status). Each job runs inside its own savepoint, so a rejected
+    ballot (status >= 400) or an exception only undoes that ballot while the
+    rest of the batch still commits together. The journal entries the batch
+    staged are appended in one write just before its COMMIT, and its commit
+    marker, fsynced, right after.
+    """
+
+    def __init__(self, path=None, batch_size=BATCH_SIZE, batch_wait_ms=BATCH_WAIT_MS):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.ballots = 0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ballot-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, fn):
+        """Queue a ballot job and wait for its own (payload, status) outcome"""
+        self._ensure_started()
+        job = _Job(fn)
+        self._queue.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = connect(self.path)
+        conn.isolation_level = None
+        conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+        while True:
+            batch = self._collect()
+            try:
+                self._write_batch(conn, batch)
+            except Exception as e:
+                print(f"Ballot batch of {len(batch)} failed: {e}")
+                journal.discard()
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                for job in batch:
+                    job.result = None
+                    job.error = e
+            for job in batch:
+                job.done.set()
+
+    def _write_batch(self, conn, batch):
+        begin_immediate(conn, "ballot_writer")
+        for job in batch:
+            conn.execute("SAVEPOINT ballot")
+            mark = journal.mark()
+            try:
+                job.result = job.fn(conn)
+            except Exception as e:
+                job.error = e
+            if job.error is not None or job.result[1] >= 400:
+                conn.execute("ROLLBACK TO ballot")
+                journal.discard(mark)
+            conn.execute("RELEASE ballot")
+        # The batch's entries reach the journal before COMMIT and its fsynced commit
+        # marker after, so replay never restores a batch that rolled back
+        entries = journal.flush()
+        conn.execute("COMMIT")
+        journal.commit(entries)
+        replica.note_commits(len(batch))
+        self.batches += 1
+        self.ballots += len(batch)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "ballots": self.ballots,
+            "average_batch": round(self.ballots / self.batches, 2) if self.batches else 0,
+            "queued": self._queue.qsize(),
+        }
+
+
+writer = BallotWriter()
+
+
+def submit_ballot(fn):
+    """Record one ballot through the group-commit writer (or inline when disabled)"""
+    if WRITER_ENABLED:
+        return writer.submit(fn)
+
+    # Anything left uncommitted is rolled back when the transaction closes
+    with write_transaction() as conn:
+        try:
+            payload, status = fn(conn)
+            if status < 400:
+                batch = journal.flush()
+                conn.commit()
+                journal.commit(batch)
+                replica.note_commits()
+        finally:
+            journal.discard()
+        return payload, status
+
+
+__all__ = ['BallotWriter', 'submit_ballot', 'writer']
@@ -0,0 +1,861 @@
+"""Backend benchmarks.
+
+Every benchmark runs against a throwaway copy of garissa_voting.db, so the
+real database is never touched:
+
+    python bench.py pool --requests 500
+    python bench.py group-commit --threads 32 --requests 50
+    python bench.py backup --requests 500
+    python bench.py reset
+    python bench.py rows --requests 20
+    python bench.py tally --threads 32 --requests 50
+    python bench.py voted --requests 2000
+    python bench.py ballot --requests 500
+    python bench.py sync --requests 500
+    python bench.py journal --threads 16 --requests 50
+    python bench.py retry --requests 300
+"""
+import argparse
+import contextlib
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DB = os.path.join(HERE, "garissa_voting.db")
+
+
+def prepare_database(until=None):
+    """Copy the bundled database to a temp dir and point the app at it (migrated up to until, default all)"""
+    workdir = tempfile.mkdtemp(prefix="garissa_bench_")
+    path = os.path.join(workdir, "garissa_voting.db")
+    shutil.copyfile(SOURCE_DB, path)
+    os.environ["DATABASE_PATH"] = path
+    sys.path.insert(0, HERE)
+
+    import database
+    import migrations
+
+    conn = database.connect(path)
+    migrations.migrate(conn, until)
+    conn.close()
+    return workdir, path
+
+
+def load_app():
+    import main
+    return main.app
+
+
+def report(*args):
+    # main() silences stdout because the blueprints print on every request
+    print(*args, file=sys.__stdout__, flush=True)
+
+
+SCHOOLS = (
+    "School of Business and Economics",
+    "School of Pure and Applied Science",
+    "School of Education Arts",
+    "School of Education Sciences",
+)
+
+
+def seed_students(path, count, prefix):
+    """Insert synthetic registered students so /api/vote has voters to resolve"""
+    import sqlite3
+
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO students (full_name, email_or_phone, registration_number, password, faculty) VALUES (?, ?, ?, ?, ?)",
+        [(f"Bench Student {i}", "0700000000", f"{prefix}{i:06d}", "x", SCHOOLS[i % len(SCHOOLS)]) for i in range(count)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def first_candidate_id(path):
+    """A candidate id POST /api/vote accepts"""
+    import sqlite3
+
+    conn = sqlite3.connect(path)
+    candidate = conn.execute("SELECT id FROM candidates LIMIT 1").fetchone()[0]
+    conn.close()
+    return candidate
+
+
+def student_ballot(path):
+    """A valid POST /api/votes choice for every ballot position: the first chosen leader standing for it"""
+    import sqlite3
+
+    conn = sqlite3.connect(path)
+    ballot = dict(conn.execute(
+        "SELECT p.key, MIN(l.reg_number) FROM positions p JOIN chosen_leaders l ON l.position = p.display_name "
+        "GROUP BY p.key"
+    ).fetchall())
+    conn.close()
+    return ballot
+
+
+def timed(client, method, url, **kwargs):
+    start = time.perf_counter()
+    response = getattr(client, method)(url, **kwargs)
+    elapsed = time.perf_counter() - start
+    if response.status_code >= 500:
+        raise RuntimeError(f"{method.upper()} {url} failed: {response.get_json()}")
+    return elapsed
+
+
+def summarize(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    report(f"  {label:<34} mean {statistics.mean(samples) * 1000:7.3f} ms"
+          f"   median {statistics.median(samples) * 1000:7.3f} ms   p95 {p95 * 1000:7.3f} ms")
+    return statistics.mean(samples)
+
+
+def bench_pool(args):
+    """Connect-per-request (pool size 0) versus pooled connections on the vote paths"""
+    workdir, path = prepare_database()
+    try:
+        seed_students(path, args.requests * 2, "BENCH/")
+        ballot = student_ballot(path)
+        candidate_id = first_candidate_id(path)
+        app = load_app()
+        import ballot_writer
+        import database
+
+        # Ballots normally go through the writer's own connection; time the pooled inline path
+        ballot_writer.WRITER_ENABLED = False
+        client = app.test_client()
+        results = {}
+        voter = 0
+        for label, size in (("connect per request", 0), ("pooled", database.POOL_SIZE)):
+            database.pool.close_all()
+            database.pool.max_size = size
+            votes, vote = [], []
+            for _ in range(args.requests):
+                reg = f"BENCH/{voter:06d}"
+                voter += 1
+                votes.append(timed(client, "post", "/api/votes", json={
+                    "voter_name": "Bench", "voter_reg_number": reg,
+                    "voter_school": "School of Education Sciences", **ballot,
+                }))
+                vote.append(timed(client, "post", "/api/vote", json={
+                    "voterRegNumber": reg, "candidateId": candidate_id,
+                }))
+            report(f"{label} (pool size {size}):")
+            results[label] = (summarize("POST /api/votes", votes), summarize("POST /api/vote", vote))
+
+        for index, name in enumerate(("/api/votes", "/api/vote")):
+            before = results["connect per request"][index]
+            after = results["pooled"][index]
+            report(f"{name}: {(before - after) * 1000:.3f} ms saved per request ({before / after:.2f}x)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_concurrent(app, threads, per_thread, make_request):
+    """Fire per_thread requests from each of `threads` clients; return ballots/second"""
+    barrier = threading.Barrier(threads + 1)
+    errors = []
+
+    def worker(index):
+        client = app.test_client()
+        barrier.wait()
+        try:
+            for n in range(per_thread):
+                method, url, body = make_request(index, n)
+                timed(client, method, url, json=body)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    return threads * per_thread / elapsed
+
+
+def bench_group_commit(args):
+    """Per-request commits versus the group-commit ballot writer under a voting rush"""
+    workdir, path = prepare_database()
+    try:
+        total = args.threads * args.requests
+        seed_students(path, total * 2, "RUSH/")
+        ballot = student_ballot(path)
+        candidate_id = first_candidate_id(path)
+        app = load_app()
+        import ballot_writer
+
+        offsets = {"per-request commit": 0, "group commit": total}
+        for label, enabled in (("per-request commit", False), ("group commit", True)):
+            ballot_writer.WRITER_ENABLED = enabled
+            offset = offsets[label]
+
+            def make_request(index, n):
+                reg = f"RUSH/{offset + index * args.requests + n:06d}"
+                if n % 2:
+                    return "post", "/api/vote", {"voterRegNumber": reg, "candidateId": candidate_id}
+                return "post", "/api/votes", {
+                    "voter_name": "Rush", "voter_reg_number": reg,
+                    "voter_school": "School of Business and Economics", **ballot,
+                }
+
+            rate = run_concurrent(app, args.threads, args.requests, make_request)
+            report(f"{label:<20} {rate:9.1f} ballots/s with {args.threads} concurrent voters")
+        report(f"(per-request commits use synchronous=NORMAL, the writer synchronous={ballot_writer.SYNCHRONOUS})")
+        report(f"writer stats: {ballot_writer.writer.stats()}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_backup(args):
+    """POST /api/votes latency with and without an online backup running"""
+    workdir, path = prepare_database()
+    try:
+        # A realistically sized file, so a backup takes many steps
+        seed_students(path, 20000, "FILL/")
+        seed_students(path, args.requests * 2, "BACKUP/")
+        ballot = student_ballot(path)
+        app = load_app()
+        import backup
+
+        backups = backup.BackupService(directory=os.path.join(workdir, "backups"), keep=1)
+        client = app.test_client()
+        voter = 0
+        results = {}
+        for label in ("no backup", "backup running"):
+            stop = threading.Event()
+            taken = []
+
+            def back_up_continuously():
+                while not stop.is_set():
+                    taken.append(backups.run(force=True))
+
+            runner = threading.Thread(target=back_up_continuously)
+            if label == "backup running":
+                runner.start()
+            samples = []
+            for _ in range(args.requests):
+                reg = f"BACKUP/{voter:06d}"
+                voter += 1
+                samples.append(timed(client, "post", "/api/votes", json={
+                    "voter_name": "Backup", "voter_reg_number": reg,
+                    "voter_school": "School of Education Sciences", **ballot,
+                }))
+            stop.set()
+            if runner.is_alive():
+                runner.join()
+            report(f"{label}:")
+            results[label] = summarize("POST /api/votes", samples)
+            if taken:
+                good = [t for t in taken if t["ok"]]
+                report(f"  {len(good)} snapshots of {good[-1]['bytes']} bytes, "
+                       f"{statistics.mean(t['duration_ms'] for t in good):.1f} ms and "
+                       f"{good[-1]['steps']} steps each ({backup.BACKUP_PAGES_PER_STEP} pages/step, "
+                       f"{backup.BACKUP_STEP_SLEEP * 1000:g} ms sleep)")
+        extra = results["backup running"] - results["no backup"]
+        report(f"backup adds {extra * 1000:.3f} ms to the mean ballot ({results['backup running'] / results['no backup']:.2f}x)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def fill_ballots(path, count):
+    """Insert count synthetic student ballots (one choice each) and as many voter records"""
+    import sqlite3
+
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO ballots (voter_reg_number, kind, user_type, voter_id, voter_name, voter_school) "
+        "VALUES (?, 'student', 'student', ?, 'Filler', ?)",
+        [(f"FILL/{i:07d}", i, SCHOOLS[i % len(SCHOOLS)]) for i in range(count)],
+    )
+    conn.execute(
+        "INSERT INTO ballot_choices (ballot_id, position, candidate_id) "
+        "SELECT id, 'chairperson', voter_id % 7 FROM ballots WHERE kind = 'student' AND voter_reg_number LIKE 'FILL/%'"
+    )
+    conn.executemany(
+        "INSERT INTO ballots (voter_reg_number, kind, voter_name) VALUES (?, 'delegate', 'Filler')",
+        [(f"FILL/{i:07d}",) for i in range(count)],
+    )
+    conn.commit()
+    # Start from an empty WAL so the timed step does not pay for checkpointing the fill
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def bench_reset(args):
+    """Write-lock time of a vote reset: row-by-row DELETE versus swapping in empty tables"""
+    workdir, path = prepare_database()
+    try:
+        load_app()
+        import database
+        import elections
+
+        for count in (1000, 10000, 100000):
+            fill_ballots(path, count)
+            start = time.perf_counter()
+            with database.write_transaction("bench") as conn:
+                for table in ("ballot_choices", "ballots", "tallies", "turnout"):
+                    conn.execute(f"DELETE FROM {table}")
+                conn.commit()
+            deleted = time.perf_counter() - start
+
+            fill_ballots(path, count)
+            start = time.perf_counter()
+            elections.reset_ballots()
+            swapped = time.perf_counter() - start
+            report(f"{count:>7} ballots   DELETE {deleted * 1000:9.1f} ms   swap {swapped * 1000:7.1f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def legacy_leaders(conn):
+    """/api/leaders as it was built before queries.py: Row, then dict, then a formatted dict"""
+    rows = conn.execute("SELECT * FROM leaders ORDER BY created_at DESC").fetchall()
+    leaders = []
+    for row in rows:
+        leader = dict(row)
+        leaders.append({
+            "id": leader["id"],
+            "fullName": leader["full_name"],
+            "regNumber": leader["reg_number"],
+            "school": leader["school"],
+            "position": leader["position"],
+            "phone": leader["phone"],
+            "email": leader["email"],
+            "yearOfStudy": leader["year_of_study"],
+            "photoUrl": leader["photo_url"],
+            "status": leader["status"],
+            "is_approved": bool(leader["is_approved"]),
+            "created_at": leader["created_at"],
+            "updated_at": leader["updated_at"]
+        })
+    return leaders
+
+
+def bench_rows(args):
+    """Building a 10k-row leader list: dict copies versus slotted records versus SQLite-built JSON"""
+    import sqlite3
+    import tracemalloc
+
+    workdir, path = prepare_database()
+    try:
+        conn = sqlite3.connect(path)
+        conn.executemany(
+            "INSERT INTO leaders (full_name, reg_number, school, position, phone, email, password, is_approved, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(f"Bench Leader {i}", f"BL/{i:06d}", SCHOOLS[i % len(SCHOOLS)], "chairperson", "0700000000",
+              f"leader{i}@bench.test", "x", i % 2, "pending") for i in range(10000)],
+        )
+        conn.commit()
+        conn.close()
+
+        app = load_app()
+        import database
+        from queries import ALL_LEADERS, encode_records, wrap
+
+        variants = (
+            ("Row -> dict -> dict + jsonify", lambda conn: app.json.dumps({"leaders": legacy_leaders(conn)})),
+            ("slotted records + encoder", lambda conn: wrap("leaders", encode_records(ALL_LEADERS, ALL_LEADERS.records(conn)))),
+            ("json_object rows", lambda conn: wrap("leaders", ALL_LEADERS.json(conn))),
+        )
+        with app.app_context(), database.get_db_connection() as conn:
+            rows = conn.execute("SELECT COUNT(*) FROM leaders").fetchone()[0]
+            report(f"{rows} leaders, {args.requests} builds each")
+            for label, build in variants:
+                build(conn)
+                samples = []
+                for _ in range(args.requests):
+                    start = time.perf_counter()
+                    build(conn)
+                    samples.append(time.perf_counter() - start)
+                tracemalloc.start()
+                build(conn)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                summarize(label, samples)
+                report(f"  {'':<34} peak allocations {peak / 1024 / 1024:6.1f} MiB")
+
+        client = app.test_client()
+        summarize("GET /api/leaders", [timed(client, "get", "/api/leaders") for _ in range(args.requests)])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def tally_worker(path, candidate_id, prefix, count):
+    """Process body for bench_tally: delegate ballots on an autocommit connection, no surrounding transaction"""
+    os.environ["DATABASE_PATH"] = path
+    sys.path.insert(0, HERE)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import database
+        import delegate_route
+
+        conn = database.connect(path)
+        conn.isolation_level = None
+        for n in range(count):
+            delegate_route.record_delegate_vote(conn, f"{prefix}{n:06d}", candidate_id)
+        conn.close()
+
+
+def candidate_votes(path, candidate_id):
+    import sqlite3
+
+    conn = sqlite3.connect(path)
+    votes = conn.execute(
+        "SELECT COALESCE(SUM(votes), 0) FROM tallies WHERE position = 'delegate' AND candidate_id = ?", [candidate_id]
+    ).fetchone()[0]
+    conn.close()
+    return votes
+
+
+def check_tally_adjustments(path):
+    """Votes the baseline counted without storing them survive migration 10 as tally adjustments, not voters"""
+    import sqlite3
+
+    # The app already points at path; this copy stops before the ledger to read candidates.votes
+    legacy_workdir, legacy_path = prepare_database(until=9)
+    os.environ["DATABASE_PATH"] = path
+    try:
+        legacy = sqlite3.connect(legacy_path)
+        counted = dict(legacy.execute("SELECT id, COALESCE(votes, 0) FROM candidates").fetchall())
+        legacy.close()
+        conn = sqlite3.connect(path)
+        tallied = dict(conn.execute("SELECT candidate_id, votes FROM tallies WHERE position = 'delegate'").fetchall())
+        if any(tallied.get(candidate_id, 0) != votes for candidate_id, votes in counted.items()):
+            raise RuntimeError(f"delegate tallies {tallied} do not match candidates.votes {counted}")
+        kept = conn.execute("SELECT COALESCE(SUM(votes), 0) FROM tally_adjustments").fetchone()[0]
+        conn.close()
+
+        client = load_app().test_client()
+        voters = client.get("/api/voter-records").get_json()["voter_records"]
+        unnamed = [record for record in voters if not record["full_name"] or not record["vote_time"]]
+        if unnamed:
+            raise RuntimeError(f"voter listing holds ballots with no voter: {unnamed}")
+        client.post("/api/recount-votes")
+        conn = sqlite3.connect(path)
+        recounted = dict(conn.execute("SELECT candidate_id, votes FROM tallies WHERE position = 'delegate'").fetchall())
+        conn.close()
+        if recounted != tallied:
+            raise RuntimeError(f"recount changed the delegate tallies from {tallied} to {recounted}")
+        report(f"migration 10: {kept} votes kept as tally adjustments, {len(voters)} voter records, tallies survive a recount")
+    finally:
+        shutil.rmtree(legacy_workdir, ignore_errors=True)
+
+
+def bench_tally(args):
+    """Statements per delegate ballot, and lost tally updates under parallel voting"""
+    import multiprocessing
+
+    workdir, path = prepare_database()
+    try:
+        check_tally_adjustments(path)
+        total = args.threads * args.requests
+        processes, per_process = 4, max(total // 4, 1)
+        seed_students(path, total + 1, "TALLY/")
+        for process in range(processes):
+            seed_students(path, per_process, f"TALLY/P{process}/")
+        candidate_id = first_candidate_id(path)
+        load_app()
+        import database
+        import delegate_route
+
+        # Statements one ballot sends to SQLite; each trigger that fires repeats its statement in the trace
+        statements = []
+        with database.write_transaction("bench") as conn:
+            conn.set_trace_callback(statements.append)
+            payload, status = delegate_route.record_delegate_vote(conn, f"TALLY/{total:06d}", candidate_id)
+            conn.set_trace_callback(None)
+            conn.rollback()
+        if status != 200:
+            raise RuntimeError(f"ballot failed: {payload}")
+        ballot = [sql for i, sql in enumerate(statements) if not i or sql != statements[i - 1]]
+        report(f"ballot ledger: {len(ballot)} statements per delegate ballot, tally kept by trigger")
+
+        # Every ballot through the app, from many threads at once
+        before = candidate_votes(path, candidate_id)
+
+        def make_request(index, n):
+            reg = f"TALLY/{index * args.requests + n:06d}"
+            return "post", "/api/vote", {"voterRegNumber": reg, "candidateId": candidate_id}
+
+        rate = run_concurrent(load_app(), args.threads, args.requests, make_request)
+        counted = candidate_votes(path, candidate_id) - before
+        report(f"POST /api/vote x {total} from {args.threads} threads: {rate:.1f} ballots/s, "
+               f"tally +{counted}, {total - counted} lost")
+
+        # Ballots from several processes without a surrounding transaction
+        before = candidate_votes(path, candidate_id)
+        context = multiprocessing.get_context("spawn")
+        workers = [context.Process(target=tally_worker, args=(path, candidate_id, f"TALLY/P{process}/", per_process))
+                   for process in range(processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        counted = candidate_votes(path, candidate_id) - before
+        expected = processes * per_process
+        report(f"autocommit ballots, {processes} processes x {per_process}: tally +{counted}, {expected - counted} lost")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_voted(args):
+    """Vote-status checks from SQLite versus the in-memory voted-set, its footprint, and cross-worker lag"""
+    import sqlite3
+
+    workdir, path = prepare_database()
+    try:
+        client = load_app().test_client()
+        from voted import VotedRegistry, voted
+
+        conn = sqlite3.connect(path)
+        for count in (1000, 10000, 100000):
+            # fill_ballots restarts its numbering, so empty the ledger first
+            for table in ("ballot_choices", "ballots", "tallies", "turnout"):
+                conn.execute(f"DELETE FROM {table}")
+            conn.commit()
+            fill_ballots(path, count)
+            stats = voted.rebuild()
+            report(f"{count:>7} voters: loaded in {stats['last_rebuild_ms']:7.1f} ms, "
+                   f"{stats['bytes'] / 1024 / 1024:6.2f} MiB ({stats['bytes'] / stats['voters']:.0f} bytes per voter)")
+        regs = [f"FILL/{i * 37 % count:07d}" for i in range(args.requests)]
+        start = time.perf_counter()
+        for reg in regs:
+            conn.execute("SELECT id, cast_at FROM ballots WHERE voter_reg_number = ? AND kind = 'student'", (reg,)).fetchone()
+            conn.execute("SELECT * FROM ballots WHERE voter_reg_number = ? AND kind = 'delegate'", (reg,)).fetchone()
+        queried = (time.perf_counter() - start) / len(regs)
+        start = time.perf_counter()
+        for reg in regs:
+            voted.lookup(reg)
+        looked_up = (time.perf_counter() - start) / len(regs)
+        report(f"both checks per voter: SQLite {queried * 1e6:.1f} us, voted-set {looked_up * 1e6:.2f} us")
+        summarize("GET /api/votes/check", [timed(client, "get", f"/api/votes/check/{reg}") for reg in regs])
+        summarize("GET /api/voter-records/check", [timed(client, "get", f"/api/voter-records/check/{reg}") for reg in regs])
+
+        # A second registry stands in for another worker: how long until it sees a ballot committed here
+        other = VotedRegistry(path)
+        other.refresh()
+        conn.execute("INSERT INTO ballots (voter_reg_number, kind, voter_name) VALUES ('LATE/0000001', 'delegate', 'Late')")
+        conn.commit()
+        start = time.perf_counter()
+        while other.lookup("LATE/0000001") is None:
+            time.sleep(0.001)
+        report(f"another worker sees a new ballot after {(time.perf_counter() - start) * 1000:.0f} ms "
+               f"(VOTED_SYNC_MS {other.sync_interval * 1000:.0f})")
+
+        # Each check answers for its own kind of ballot: a voter record alone is no student ballot
+        conn.execute("INSERT INTO ballots (voter_reg_number, kind, voter_name) VALUES ('DELEGATE-1', 'delegate', 'Late')")
+        conn.commit()
+        voted.refresh()
+        answers = (client.get("/api/votes/check/DELEGATE-1").get_json()["has_voted"],
+                   client.get("/api/voter-records/check/DELEGATE-1").get_json()["has_voted"])
+        if answers != (False, True):
+            raise RuntimeError(f"after a delegate ballot only, the two checks answered {answers}")
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+class CallCounter:
+    """Connection stand-in counting execute() and executemany() calls"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.calls = 0
+
+    def execute(self, *args):
+        self.calls += 1
+        return self.conn.execute(*args)
+
+    def executemany(self, *args):
+        self.calls += 1
+        return self.conn.executemany(*args)
+
+    def cursor(self):
+        # queries.Statement runs on a cursor of its own
+        import sqlite3
+
+        counter = self
+
+        class CountedCursor(sqlite3.Cursor):
+            def execute(self, *args):
+                counter.calls += 1
+                return super().execute(*args)
+
+        return self.conn.cursor(CountedCursor)
+
+
+def legacy_record_ballot(conn, data, choices):
+    """A student ballot as vote_route wrote it before the ballot ledger (schema 9): its claim, then one
+    executemany per table"""
+    claimed = conn.execute(
+        "INSERT INTO student_ballots (voter_reg_number) VALUES (?) ON CONFLICT DO NOTHING RETURNING voter_reg_number",
+        (data["voter_reg_number"],)
+    ).fetchone()
+    if not claimed:
+        return {"error": "already voted"}, 400
+    inserted = conn.executemany(
+        "INSERT INTO votes (voter_id, candidate_id, voter_reg_number, voter_school, position) "
+        "VALUES (?, ?, ?, ?, ?) ON CONFLICT DO NOTHING",
+        [(1, candidate.id, data["voter_reg_number"], data["voter_school"], position) for position, candidate in choices]
+    ).rowcount
+    if inserted < len(choices):
+        return {"error": "already voted"}, 400
+    conn.executemany(
+        "INSERT INTO vote_results (position, candidate_reg_number, candidate_name, votes) VALUES (?, ?, ?, 1) "
+        "ON CONFLICT(position, candidate_reg_number) DO UPDATE SET votes = votes + 1, last_updated = CURRENT_TIMESTAMP",
+        [(position, candidate.reg_number, candidate.full_name) for position, candidate in choices]
+    )
+    return {"message": "ok"}, 201
+
+
+def legacy_record_delegate_vote(conn, reg_key, candidate_id):
+    """A delegate ballot before the ballot ledger (schema 9): voter record, vote, then candidates.votes"""
+    from queries import VOTER
+
+    voter = VOTER.first(conn, [reg_key])
+    if not voter:
+        return {"error": "Voter not found"}, 404
+    claimed = conn.execute(
+        "INSERT INTO voter_records (full_name, registration_number) VALUES (?, ?) ON CONFLICT DO NOTHING RETURNING id",
+        (voter.full_name, reg_key)
+    ).fetchone()
+    if claimed:
+        claimed = conn.execute(
+            "INSERT INTO votes (voter_id, user_type, candidate_id) VALUES (?, ?, ?) ON CONFLICT DO NOTHING RETURNING id",
+            [voter.voter_id, voter.voter_type, candidate_id]
+        ).fetchone()
+    if not claimed:
+        return {"error": "already voted"}, 400
+    conn.execute(
+        "UPDATE candidates SET votes = COALESCE(votes, 0) + 1 WHERE id = ? RETURNING full_name, faculty, votes",
+        [candidate_id]
+    ).fetchone()
+    return {"message": "ok"}, 200
+
+
+def wal_pages(conn, path):
+    """Pages appended to the WAL since it was last truncated"""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    size = os.path.getsize(f"{path}-wal") if os.path.exists(f"{path}-wal") else 0
+    # 32-byte file header, then a 24-byte header per frame
+    return max(size - 32, 0) // (page_size + 24)
+
+
+def bench_ballot(args):
+    """Per-table ballot writes (schema 9) versus the ballot ledger: statement calls, WAL pages and ballots/s"""
+    legacy_workdir, legacy_path = prepare_database(until=9)
+    workdir, path = prepare_database()
+    try:
+        for target in (legacy_path, path):
+            seed_students(target, args.requests + 1, "BALLOT/")
+        ballot = student_ballot(path)
+        candidate_id = first_candidate_id(path)
+        load_app()
+        import database
+        import delegate_route
+        import journal
+        import positions
+        import vote_route
+
+        # Both schemas pay the same journal cost, so leave it out
+        journal.journal.enabled = False
+        # Resolved once, against the ledger database's ballot definition
+        with contextlib.closing(database.connect(path)) as conn:
+            choices = vote_route.resolve_ballot(ballot, positions.load_ballot_definition(conn))
+        for label, target, record_student, record_delegate in (
+            ("per-table writes (schema 9)", legacy_path, legacy_record_ballot, legacy_record_delegate_vote),
+            ("ballot ledger", path, vote_route.record_ballot, delegate_route.record_delegate_vote),
+        ):
+            conn = database.connect(target)
+            conn.isolation_level = None
+            # Keep every frame in the WAL so its size counts the pages written
+            conn.execute("PRAGMA wal_autocheckpoint = 0")
+
+            # Calls one ballot of each kind makes into sqlite3 while the write lock is held
+            calls = []
+            for record, voter in ((record_student, None), (record_delegate, f"BALLOT/{args.requests:06d}")):
+                conn.execute("BEGIN IMMEDIATE")
+                counted = CallCounter(conn)
+                if voter is None:
+                    data = dict(ballot, voter_name="Bench", voter_reg_number="BALLOT/CALLS", voter_school=SCHOOLS[0])
+                    payload, status = record(counted, data, choices)
+                else:
+                    payload, status = record(counted, voter, candidate_id)
+                conn.execute("ROLLBACK")
+                if status >= 400:
+                    raise RuntimeError(f"ballot failed: {payload}")
+                calls.append(counted.calls)
+
+            # One student and one delegate ballot per transaction, as the inline write path commits them
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            start = time.perf_counter()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                for n in range(args.requests):
+                    conn.execute("BEGIN IMMEDIATE")
+                    data = dict(ballot, voter_name="Bench", voter_reg_number=f"BALLOT/S{n:06d}", voter_school=SCHOOLS[n % 4])
+                    record_student(conn, data, choices)
+                    record_delegate(conn, f"BALLOT/{n:06d}", candidate_id)
+                    conn.execute("COMMIT")
+            elapsed = time.perf_counter() - start
+            pages = wal_pages(conn, target)
+            conn.close()
+            report(f"{label:<28} calls: {calls[0]} per student ballot, {calls[1]} per delegate ballot; "
+                   f"{pages / (2 * args.requests):.1f} WAL pages per ballot; {2 * args.requests / elapsed:.1f} ballots/s")
+    finally:
+        shutil.rmtree(legacy_workdir, ignore_errors=True)
+
+
+def bench_sync(args):
+    """A station's queued ballots: one POST /api/votes each versus one POST /api/votes/sync"""
+    workdir, path = prepare_database()
+    try:
+        ballot_choices = student_ballot(path)
+        os.environ.setdefault("BALLOT_SYNC_SECRET", "bench-sync-secret")
+        client = load_app().test_client()
+        import vote_route
+
+        def ballot(prefix, n):
+            body = dict(ballot_choices)
+            body.update(voter_name="Bench", voter_reg_number=f"{prefix}/{n:05d}", voter_school=SCHOOLS[n % len(SCHOOLS)])
+            return body
+
+        start = time.perf_counter()
+        for n in range(args.requests):
+            timed(client, "post", "/api/votes", json=ballot("ONLINE", n))
+        one_by_one = time.perf_counter() - start
+
+        queued = []
+        for n in range(args.requests):
+            raw = {"client_ballot_id": f"bench-{n}", "cast_at": "2025-10-14T09:00:00", "type": "student",
+                   "ballot": ballot("OFFLINE", n)}
+            raw["signature"] = vote_route.sign_ballot("bench", raw)
+            queued.append(raw)
+        start = time.perf_counter()
+        response = client.post("/api/votes/sync", json={"station_id": "bench", "ballots": queued})
+        synced = time.perf_counter() - start
+        accepted = response.get_json()["accepted"]
+        if accepted != args.requests:
+            raise RuntimeError(f"sync accepted {accepted} of {args.requests}")
+        start = time.perf_counter()
+        resent = client.post("/api/votes/sync", json={"station_id": "bench", "ballots": queued}).get_json()
+        again = time.perf_counter() - start
+
+        # A voter with only a delegate ballot still casts their student ballot, once
+        client.post("/api/voter-records/create", json={"full_name": "Bench", "registration_number": "DELEGATE/00001"})
+        mixed = []
+        for n in range(2):
+            raw = {"client_ballot_id": f"bench-mixed-{n}", "cast_at": "2025-10-14T09:00:00", "type": "student",
+                   "ballot": dict(ballot("DELEGATE", 1), voter_name=f"Bench {n}")}
+            raw["signature"] = vote_route.sign_ballot("bench", raw)
+            mixed.append(raw)
+        statuses = [result["status"] for result in client.post(
+            "/api/votes/sync", json={"station_id": "bench", "ballots": mixed}
+        ).get_json()["results"]]
+        if statuses != ["accepted", "duplicate"]:
+            raise RuntimeError(f"student ballots after a delegate ballot synced as {statuses}")
+
+        report(f"{args.requests} ballots, one POST /api/votes each: {one_by_one * 1000:8.1f} ms")
+        report(f"{args.requests} ballots, one POST /api/votes/sync:    {synced * 1000:8.1f} ms")
+        report(f"same batch re-sent:                {again * 1000:8.1f} ms, "
+               f"{sum(1 for result in resent['results'] if result['status'] == 'accepted')} accepted again")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_journal(args):
+    """Ballots/s with and without the write-ahead journal, and replay speed on 100k ballots"""
+    workdir, path = prepare_database()
+    try:
+        ballot_choices = student_ballot(path)
+        app = load_app()
+        import journal
+        from positions import DEFAULT_POSITIONS
+
+        def make_request(index, n):
+            body = dict(ballot_choices)
+            body.update(voter_name="Bench", voter_reg_number=f"{label[:3]}/{index:03d}/{n:05d}", voter_school=SCHOOLS[0])
+            return "post", "/api/votes", body
+
+        for label, enabled in (("no journal", False), ("journal", True)):
+            journal.journal.enabled = enabled
+            rate = run_concurrent(app, args.threads, args.requests, make_request)
+            report(f"{label:<12} POST /api/votes x {args.threads * args.requests}: {rate:.1f} ballots/s")
+        report(f"journal stats: {journal.journal.stats()}")
+
+        # Replay: 100k seven-position student ballots plus their voter records
+        big = journal.BallotJournal(os.path.join(workdir, "big.journal"), enabled=True, fsync=False)
+        choices = [(key, i) for i, (key, _, _, _) in enumerate(DEFAULT_POSITIONS)]
+        for chunk in range(100):
+            for n in range(1000):
+                reg = f"REPLAY/{chunk:03d}{n:03d}"
+                big.stage_ballot("student", reg, "Bench", "student", n, SCHOOLS[n % len(SCHOOLS)], choices)
+                big.stage_ballot("delegate", reg, "Bench", "student", n, SCHOOLS[n % len(SCHOOLS)], ())
+            big.commit(big.flush())
+        ledgers, entries, elapsed = journal.replay(big.path)
+        report(f"replay: {entries.records} records, {entries.valid_bytes / 1024 / 1024:.1f} MiB in {elapsed * 1000:.0f} ms: "
+               f"{ledgers.cast / elapsed:,.0f} ballots/s ({ledgers.votes()} votes rebuilt)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_retry(args):
+    """Cost of a client retry of POST /api/votes, with and without an Idempotency-Key"""
+    workdir, path = prepare_database()
+    try:
+        ballot_choices = student_ballot(path)
+        client = load_app().test_client()
+
+        for label, keyed in (("no Idempotency-Key", False), ("Idempotency-Key", True)):
+            retries = []
+            for n in range(args.requests):
+                body = dict(ballot_choices)
+                body.update(voter_name="Bench", voter_reg_number=f"RETRY/{keyed:d}/{n:05d}", voter_school=SCHOOLS[0])
+                headers = {"Idempotency-Key": f"bench-{n}"} if keyed else {}
+                client.post("/api/votes", json=body, headers=headers)
+                start = time.perf_counter()
+                response = client.post("/api/votes", json=body, headers=headers)
+                retries.append(time.perf_counter() - start)
+            summarize(f"retry, {label} ({response.status_code})", retries)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+BENCHMARKS = {
+    "pool": bench_pool,
+    "group-commit": bench_group_commit,
+    "backup": bench_backup,
+    "reset": bench_reset,
+    "rows": bench_rows,
+    "tally": bench_tally,
+    "voted": bench_voted,
+    "ballot": bench_ballot,
+    "sync": bench_sync,
+    "journal": bench_journal,
+    "retry": bench_retry,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
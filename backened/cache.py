@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from database import connect
+
+# Configuration
+CACHE_MAX_ENTRIES = int(os.environ.get('QUERY_CACHE_MAX_ENTRIES', '4096'))
+
+
+class DataVersionWatcher:
+    """Cheap "has anything changed?" probe shared by every cache in this process.
+
+    PRAGMA data_version on a dedicated connection changes whenever any other
+    connection, in this worker or another process, commits to the database.
+    It reads the WAL index only, so checking it costs no query. The
+    table_versions counters kept by triggers (migration 3) then say which
+    tables changed.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = connect(self.path, readonly=True)
+        return self._conn
+
+    def current(self):
+        """Value that differs from the previous call once anyone else has committed"""
+        with self._lock:
+            return self._connection().execute("PRAGMA data_version").fetchone()[0]
+
+    def table_versions(self, tables):
+        """Tuple of version counters for tables, or None on a database without them"""
+        with self._lock:
+            try:
+                rows = dict(self._connection().execute("SELECT table_name, version FROM table_versions").fetchall())
+            except sqlite3.OperationalError:
+                return None
+        return tuple(rows.get(table, 0) for table in tables)
+
+
+class _Entry:
+    __slots__ = ("value", "data_version", "versions")
+
+    def __init__(self, value, data_version, versions):
+        self.value = value
+        self.data_version = data_version
+        self.versions = versions
+
+
+class VersionedCache:
+    """Query-result cache that is revalidated against the database, not a TTL.
+
+    An entry is served as-is while data_version is unchanged. Once something
+    has been committed, the entry survives only if the counters of the tables
+    it was built from are unchanged; otherwise the loader runs again.
+    """
+
+    def __init__(self, watcher, max_entries=CACHE_MAX_ENTRIES):
+        self.watcher = watcher
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+
+    def get(self, key, tables, loader):
+        """Return the cached value for key, calling loader() when any of tables changed"""
+        data_version = self.watcher.current()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.data_version == data_version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+
+        # Read the counters before loading: a commit racing the loader leaves
+        # the entry tagged older than its data, so it is reloaded, never stale
+        versions = self.watcher.table_versions(tables)
+        if entry is not None and versions is not None and versions == entry.versions:
+            with self._lock:
+                entry.data_version = data_version
+                self.revalidations += 1
+            return entry.value
+
+        value = loader()
+        with self._lock:
+            self._entries[key] = _Entry(value, data_version, versions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.misses += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "revalidations": self.revalidations,
+            "misses": self.misses,
+        }
+
+
+data_versions = DataVersionWatcher()
+query_cache = VersionedCache(data_versions)
+
+
+__all__ = ['DataVersionWatcher', 'VersionedCache', 'data_versions', 'query_cache']
@@ -0,0 +1,276 @@
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import has_request_context, request
+
+# Configuration
+DB_PATH = os.environ.get('DATABASE_PATH', os.path.join(os.getcwd(), "garissa_voting.db"))
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+READ_POOL_SIZE = int(os.environ.get('DB_READ_POOL_SIZE', '16'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', '256'))
+BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', '5000'))
+# Write transactions wait on SQLite's busy handler in short slices, backing off
+# with jitter between slices, and give up once the total deadline has passed
+WRITE_ATTEMPT_MS = int(os.environ.get('DB_WRITE_ATTEMPT_MS', '100'))
+WRITE_BACKOFF_MS = float(os.environ.get('DB_WRITE_BACKOFF_MS', '5'))
+WRITE_BACKOFF_MAX_MS = float(os.environ.get('DB_WRITE_BACKOFF_MAX_MS', '200'))
+WRITE_DEADLINE_MS = float(os.environ.get('DB_WRITE_DEADLINE_MS', '10000'))
+
+# Pragma profile applied once to every new connection
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", BUSY_TIMEOUT_MS),
+    ("mmap_size", os.environ.get('DB_MMAP_SIZE', str(256 * 1024 * 1024))),
+    ("cache_size", os.environ.get('DB_CACHE_SIZE', '-16000')),
+    ("temp_store", "MEMORY"),
+)
+
+# Requests with these methods are served from the read-only pool
+SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+
+def connect(path=None, readonly=False):
+    """Open a new tuned connection (callers own it and must close it)"""
+    path = path or DB_PATH
+    if readonly:
+        # The journal mode is a property of the file, set by the read-write side
+        conn = sqlite3.connect(
+            f"file:{path}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        pragmas = [pragma for pragma in PRAGMAS if pragma[0] != "journal_mode"]
+        pragmas.append(("query_only", "ON"))
+    else:
+        conn = sqlite3.connect(
+            path,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        pragmas = PRAGMAS
+    conn.row_factory = sqlite3.Row
+    for name, value in pragmas:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of persistent connections, one checked out per thread.
+
+    A max_size of 0 disables pooling and opens a fresh connection per checkout.
+    A readonly pool hands out mode=ro, query_only connections.
+    """
+
+    def __init__(self, path=None, max_size=POOL_SIZE, timeout=POOL_TIMEOUT, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _checkout(self):
+        if self.max_size <= 0:
+            return connect(self.path, self.readonly)
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.max_size:
+                self._created += 1
+                try:
+                    return connect(self.path, self.readonly)
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a database connection")
+
+    def _release(self, conn):
+        if self.max_size <= 0:
+            conn.close()
+            return
+
+        # Discard anything the request did not commit, like closing the connection used to
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                self._discard(conn)
+                return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    @contextmanager
+    def connection(self):
+        # Nested use on the same thread shares the connection already checked out
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._checkout()
+        self._local.conn = conn
+        self._local.depth = 1
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            self._release(conn)
+
+    def close_all(self):
+        """Close every idle connection (used by tests, tools and shutdown)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        return {
+            "readonly": self.readonly,
+            "max_size": self.max_size,
+            "created": self._created,
+            "idle": self._idle.qsize(),
+        }
+
+
+pool = ConnectionPool()
+read_pool = ConnectionPool(max_size=READ_POOL_SIZE, readonly=True)
+
+
+# Database context manager shared by every blueprint; GET/HEAD/OPTIONS requests
+# get a read-only connection, so a stray write fails instead of taking the lock
+@contextmanager
+def get_db_connection():
+    readonly = has_request_context() and request.method in SAFE_METHODS
+    with (read_pool if readonly else pool).connection() as conn:
+        yield conn
+
+
+class DatabaseBusy(sqlite3.OperationalError):
+    """The write lock could not be taken before the retry deadline"""
+
+
+def is_lock_error(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+class ContentionStats:
+    """Per-endpoint counters of write-lock retries, time spent waiting and give-ups"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def record(self, name, retries, waited, gave_up):
+        with self._lock:
+            counters = self._counters.setdefault(name, {
+                "transactions": 0, "retries": 0, "wait_ms": 0.0, "max_wait_ms": 0.0, "give_ups": 0,
+            })
+            counters["transactions"] += 1
+            counters["retries"] += retries
+            counters["wait_ms"] += waited * 1000
+            counters["max_wait_ms"] = max(counters["max_wait_ms"], waited * 1000)
+            if gave_up:
+                counters["give_ups"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: dict(counters, wait_ms=round(counters["wait_ms"], 3), max_wait_ms=round(counters["max_wait_ms"], 3))
+                for name, counters in self._counters.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+contention = ContentionStats()
+
+
+def begin_immediate(conn, name, deadline_ms=WRITE_DEADLINE_MS):
+    """Take the write lock up front with BEGIN IMMEDIATE, retrying lock conflicts.
+
+    Taking the lock before the first read avoids the deadlock where two
+    readers both try to upgrade to writers. Raises DatabaseBusy after
+    deadline_ms of retries.
+    """
+    start = time.monotonic()
+    deadline = start + deadline_ms / 1000.0
+    backoff = WRITE_BACKOFF_MS / 1000.0
+    retries = 0
+    conn.execute(f"PRAGMA busy_timeout = {WRITE_ATTEMPT_MS}")
+    try:
+        while True:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                contention.record(name, retries, time.monotonic() - start, False)
+                return
+            except sqlite3.OperationalError as e:
+                if not is_lock_error(e):
+                    raise
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    contention.record(name, retries, time.monotonic() - start, True)
+                    raise DatabaseBusy(f"database is locked (gave up after {retries} retries)") from e
+            retries += 1
+            time.sleep(min(random.uniform(0, backoff), remaining))
+            backoff = min(backoff * 2, WRITE_BACKOFF_MAX_MS / 1000.0)
+    finally:
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+
+
+# Write transaction for endpoints that change data; handlers still commit explicitly
+@contextmanager
+def write_transaction(name=None):
+    if name is None:
+        name = request.endpoint if has_request_context() else "background"
+    with pool.connection() as conn:
+        if conn.in_transaction:
+            # Nested in a transaction this thread already holds
+            yield conn
+            return
+        begin_immediate(conn, name)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+
+__all__ = [
+    'DB_PATH', 'ConnectionPool', 'DatabaseBusy', 'begin_immediate', 'connect', 'contention',
+    'get_db_connection', 'pool', 'read_pool', 'write_transaction',
+]
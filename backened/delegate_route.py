@@ -4,9 +4,17 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import uuid
 import jwt
 import datetime
-from contextlib import contextmanager
+from cache import query_cache
+from database import DB_PATH, DatabaseBusy, get_db_connection, write_transaction
+from ballot_writer import submit_ballot
+from idempotency import idempotent
+from identity import normalize_reg_number
+from ledger import DELEGATE, DELEGATE_POSITION, cast_ballot, recount
+from queries import APPROVED_CANDIDATES, DELEGATES, VOTER, encode_records, json_response, map_faculty_name
+from replica import get_snapshot_connection, snapshot_age
 import os
 from flask_cors import CORS
+from voted import voted
 
 delegate_bp = Blueprint('delegate', __name__)
 
@@ -14,131 +22,9 @@ CORS(delegate_bp)
 
 # Configuration
 JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-strong-secret-key-here')
-DB_PATH = os.path.join(os.getcwd(), "garissa_voting.db")
 
 print(f"Database path: {DB_PATH}")
 
-# Database context manager
-@contextmanager
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
-
-def init_delegate_db():
-    with get_db_connection() as conn:
-        # Create delegates table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS delegates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                public_id TEXT UNIQUE,
-                full_name TEXT NOT NULL,
-                email TEXT,
-                phone TEXT,
-                registration_number TEXT UNIQUE NOT NULL,
-                faculty TEXT,
-                year_of_study INTEGER,
-                password TEXT NOT NULL,
-                is_verified BOOLEAN DEFAULT FALSE,
-                is_approved BOOLEAN DEFAULT FALSE,
-                is_active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        # Create candidates table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS candidates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                delegate_id INTEGER NOT NULL,
-                full_name TEXT NOT NULL,
-                registration_number TEXT UNIQUE NOT NULL,
-                faculty TEXT NOT NULL,
-                position TEXT DEFAULT 'Delegate',
-                votes INTEGER DEFAULT 0,
-                FOREIGN KEY (delegate_id) REFERENCES delegates (id)
-            )
-        ''')
-        # Create votes table with user_type
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS votes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                voter_id INTEGER NOT NULL,
-                user_type TEXT NOT NULL,  -- 'student', 'delegate', or 'leader'
-                candidate_id INTEGER NOT NULL,
-                voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        # Create voter_records table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS voter_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                registration_number TEXT UNIQUE NOT NULL,
-                vote_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create indexes
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_voter_records_reg_number ON voter_records(registration_number)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_voter_records_time ON voter_records(vote_time)')
-        
-        conn.commit()
-
-# Initialize database
-init_delegate_db()
-
-def map_faculty_name(faculty):
-    """Map various faculty names to consistent frontend format"""
-    if not faculty:
-        return "Unknown"
-    
-    faculty = faculty.strip()
-    
-    mapping = {
-        "Business And Economics": "School of Business and Economics",
-        "Pure and Applied Science": "School of Pure and Applied Science",
-        "Education Arts": "School of Education Arts",
-        "Education Sciences": "School of Education Sciences",
-        "Business and Economics": "School of Business and Economics",
-        "Business": "School of Business and Economics",
-        "Science": "School of Pure and Applied Science",
-        "Pure and Applied Sciences": "School of Pure and Applied Science",
-        "Education Art": "School of Education Arts",
-        "Education Science": "School of Education Sciences",
-        "Arts": "School of Education Arts",
-        "Education": "School of Education Sciences",
-        "School of Business and Economics": "School of Business and Economics",
-        "School of Pure and Applied Science": "School of Pure and Applied Science",
-        "School of Education Art": "School of Education Arts",
-        "School of Education Science": "School of Education Sciences",
-    }
-    
-    if faculty in mapping:
-        return mapping[faculty]
-    
-    faculty_lower = faculty.lower()
-    for key, value in mapping.items():
-        if key.lower() in faculty_lower or faculty_lower in key.lower():
-            return value
-    
-    if "business" in faculty_lower or "economic" in faculty_lower:
-        return "School of Business and Economics"
-    elif "pure" in faculty_lower and "applied" in faculty_lower and "science" in faculty_lower:
-        return "School of Pure and Applied Science"
-    elif "education" in faculty_lower and "art" in faculty_lower:
-        return "School of Education Arts"
-    elif "education" in faculty_lower and "science" in faculty_lower:
-        return "School of Education Sciences"
-    elif "art" in faculty_lower:
-        return "School of Education Arts"
-    elif "science" in faculty_lower and "education" not in faculty_lower:
-        return "School of Pure and Applied Science"
-    
-    return faculty
-
 # ------------------ ROUTES ------------------
 
 # Register delegate
@@ -158,10 +44,10 @@ def register_delegate():
         return jsonify({"error": "Password must be at least 8 characters"}), 400
 
     try:
-        with get_db_connection() as conn:
-            clean_reg_number = str(data["registrationNumber"]).strip().upper()
+        with write_transaction() as conn:
+            clean_reg_number = normalize_reg_number(data["registrationNumber"])
             existing_delegate = conn.execute(
-                "SELECT * FROM delegates WHERE registration_number = ?",
+                "SELECT * FROM delegates WHERE reg_key = ?",
                 [clean_reg_number]
             ).fetchone()
             if existing_delegate:
@@ -206,6 +92,8 @@ def register_delegate():
             "public_id": public_id,
         }), 201
 
+    except DatabaseBusy:
+        raise
     except sqlite3.IntegrityError:
         return jsonify({"error": "Registration number already exists"}), 409
     except ValueError:
@@ -222,12 +110,12 @@ def login_delegate():
         return jsonify({"error": "Registration number and password required"}), 400
 
     try:
-        reg_number = str(data["registrationNumber"]).strip().upper().replace(" ", "")
+        reg_number = normalize_reg_number(data["registrationNumber"])
         password = str(data["password"]).strip()
 
         with get_db_connection() as conn:
             delegate = conn.execute(
-                "SELECT * FROM delegates WHERE registration_number = ? AND is_active = TRUE",
+                "SELECT * FROM delegates WHERE reg_key = ? AND is_active = TRUE",
                 [reg_number]
             ).fetchone()
 
@@ -268,66 +156,25 @@ def login_delegate():
 def get_delegates():
     try:
         with get_db_connection() as conn:
-            delegates = []
-            rows = conn.execute(
-                "SELECT id, public_id, full_name, email, phone, registration_number, faculty, year_of_study, is_approved, created_at FROM delegates WHERE full_name != 'Voter' ORDER BY created_at DESC"
-            ).fetchall()
-            
-            for row in rows:
-                delegate = dict(row)
-                delegate_formatted = {
-                    "_id": delegate["id"],  
-                    "id": delegate["id"],
-                    "public_id": delegate["public_id"],
-                    "fullName": delegate["full_name"],  
-                    "emailOrPhone": delegate["email"] or delegate["phone"],  
-                    "registrationNumber": delegate["registration_number"],  
-                    "faculty": delegate["faculty"],
-                    "yearOfStudy": delegate["year_of_study"],  
-                    "isApproved": bool(delegate["is_approved"]), 
-                    "created_at": delegate["created_at"]
-                }
-                delegates.append(delegate_formatted)
-                
-        return jsonify(delegates)
+            delegates = DELEGATES.json(conn)
+        return json_response(delegates)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def load_candidates():
+    """Approved, active candidates ordered by votes, as served by /api/candidates: (count, JSON)"""
+    with get_db_connection() as conn:
+        candidates = APPROVED_CANDIDATES.records(conn)
+    return len(candidates), encode_records(APPROVED_CANDIDATES, candidates)
+
 # Get approved candidates for voting
 @delegate_bp.route("/api/candidates", methods=["GET"])
 def get_candidates():
     """Get all approved candidates for voting"""
     try:
-        with get_db_connection() as conn:
-            query = """
-                SELECT c.id, c.full_name, c.registration_number, c.faculty, 
-                       c.position, c.votes
-                FROM candidates c
-                JOIN delegates d ON c.delegate_id = d.id
-                WHERE d.is_approved = 1 AND d.is_active = 1
-                ORDER BY c.votes DESC
-            """
-            
-            rows = conn.execute(query).fetchall()
-            candidates = []
-            
-            for row in rows:
-                candidate = dict(row)
-                original_faculty = candidate["faculty"]
-                mapped_faculty = map_faculty_name(original_faculty)
-                
-                candidates.append({
-                    "id": candidate["id"],
-                    "full_name": candidate["full_name"],
-                    "registration_number": candidate["registration_number"],
-                    "faculty": mapped_faculty,
-                    "original_faculty": original_faculty,
-                    "position": candidate.get("position", "Delegate"),
-                    "votes": candidate.get("votes", 0)
-                })
-            
-            print(f"Returning {len(candidates)} approved candidates")
-            return jsonify(candidates)
+        count, candidates = query_cache.get("approved_candidates", ("candidates", "delegates", "ballots"), load_candidates)
+        print(f"Returning {count} approved candidates")
+        return json_response(candidates)
             
     except Exception as e:
         print(f"Error in get_candidates: {e}")
@@ -338,12 +185,13 @@ def get_candidates():
 def get_results():
     """Get voting results with mapped faculties"""
     try:
-        with get_db_connection() as conn:
+        with get_snapshot_connection() as conn:
             query = """
                 SELECT c.id, c.full_name, c.registration_number, c.faculty, 
-                       c.position, c.votes
+                       c.position, COALESCE(t.votes, 0) AS votes
                 FROM candidates c
-                ORDER BY COALESCE(votes, 0) DESC
+                LEFT JOIN tallies t ON t.position = 'delegate' AND t.candidate_id = c.id
+                ORDER BY votes DESC
             """
             
             rows = conn.execute(query).fetchall()
@@ -365,7 +213,9 @@ def get_results():
                 })
                 
             print(f"Returning {len(results)} candidates for results")
-            return jsonify(results)
+            response = jsonify(results)
+            response.headers["X-Snapshot-Age"] = str(snapshot_age(conn))
+            return response
             
     except Exception as e:
         print(f"Error in get_results: {e}")
@@ -373,6 +223,7 @@ def get_results():
 
 # Vote endpoint - PERFECTLY WORKING VERSION
 @delegate_bp.route("/api/vote", methods=["POST"])
+@idempotent("vote")
 def submit_vote():
     try:
         data = request.get_json()
@@ -381,175 +232,19 @@ def submit_vote():
         if not data or not data.get("voterRegNumber") or not data.get("candidateId"):
             return jsonify({"error": "Voter registration number and candidate ID are required"}), 400
 
-        with get_db_connection() as conn:
-            clean_reg_number = str(data["voterRegNumber"]).strip().upper()
-            candidate_id = int(data["candidateId"])
-            print(f"Looking for voter: {clean_reg_number}, voting for candidate: {candidate_id}")
-
-            voter_id = None
-            user_type = None
-            voter_name = None
-            
-            # Check students table
-            try:
-                student = conn.execute(
-                    "SELECT id, full_name FROM students WHERE registration_number = ?",
-                    [clean_reg_number]
-                ).fetchone()
-                if student:
-                    voter_id = student["id"]
-                    voter_name = student["full_name"]
-                    user_type = "student"
-                    print(f"✅ Found student: {clean_reg_number} - {voter_name}")
-            except Exception as e:
-                print(f"⚠️  Students table error: {e}")
-
-            # Check delegates table
-            if not voter_id:
-                try:
-                    delegate = conn.execute(
-                        "SELECT id, full_name FROM delegates WHERE registration_number = ? AND is_approved = 1",
-                        [clean_reg_number]
-                    ).fetchone()
-                    if delegate:
-                        voter_id = delegate["id"]
-                        voter_name = delegate["full_name"]
-                        user_type = "delegate"
-                        print(f"✅ Found delegate: {clean_reg_number} - {voter_name}")
-                except Exception as e:
-                    print(f"⚠️  Delegates table error: {e}")
-
-            # Check chosen_leaders table
-            if not voter_id:
-                try:
-                    leader = conn.execute(
-                        "SELECT id, full_name FROM chosen_leaders WHERE reg_number = ?",
-                        [clean_reg_number]
-                    ).fetchone()
-                    if leader:
-                        voter_id = leader["id"]
-                        voter_name = leader["full_name"]
-                        user_type = "leader"
-                        print(f"✅ Found leader: {clean_reg_number} - {voter_name}")
-                except Exception as e:
-                    print(f"⚠️  Leaders table error: {e}")
-
-            if not voter_id:
-                error_msg = "Voter not found. Please ensure you are registered in the system."
-                print(f"❌ {error_msg}")
-                return jsonify({"error": error_msg}), 404
-
-            # Check if voter has already voted
-            try:
-                existing_voter_record = conn.execute(
-                    "SELECT id FROM voter_records WHERE registration_number = ?",
-                    [clean_reg_number]
-                ).fetchone()
-                
-                if existing_voter_record:
-                    error_msg = "You have already voted. Each voter can only vote once."
-                    print(f"❌ {error_msg}")
-                    return jsonify({"error": error_msg}), 400
-            except Exception as e:
-                print(f"⚠️  Voter records table check failed: {e}")
-
-            # Check votes table for existing vote
-            cursor = conn.execute("PRAGMA table_info(votes)")
-            columns = [column['name'] for column in cursor.fetchall()]
-            has_user_type = 'user_type' in columns
-            
-            if not has_user_type:
-                existing_vote = conn.execute(
-                    "SELECT id FROM votes WHERE voter_id = ?",
-                    [voter_id]
-                ).fetchone()
-            else:
-                existing_vote = conn.execute(
-                    "SELECT id FROM votes WHERE voter_id = ? AND user_type = ?",
-                    [voter_id, user_type]
-                ).fetchone()
-
-            if existing_vote:
-                error_msg = "You have already voted. Each voter can only vote once."
-                print(f"❌ {error_msg}")
-                return jsonify({"error": error_msg}), 400
-
-            # Create voter record
-            try:
-                conn.execute(
-                    '''
-                    INSERT INTO voter_records (full_name, registration_number)
-                    VALUES (?, ?)
-                    ''',
-                    (voter_name, clean_reg_number)
-                )
-                print(f"✅ Voter record created: {voter_name} ({clean_reg_number})")
-            except Exception as e:
-                print(f"⚠️  Could not create voter record: {e}")
-
-            # Record the vote
-            try:
-                if has_user_type:
-                    conn.execute(
-                        "INSERT INTO votes (voter_id, user_type, candidate_id) VALUES (?, ?, ?)",
-                        [voter_id, user_type, candidate_id]
-                    )
-                    print(f"✅ Vote recorded with user_type: {user_type}")
-                else:
-                    conn.execute(
-                        "INSERT INTO votes (voter_id, candidate_id) VALUES (?, ?)",
-                        [voter_id, candidate_id]
-                    )
-                    print("✅ Vote recorded without user_type")
-            except Exception as e:
-                print(f"❌ Error recording vote: {e}")
-                return jsonify({"error": "Failed to record vote. Please try again."}), 500
-
-            # Update candidate vote count
-            try:
-                current_votes = conn.execute(
-                    "SELECT votes FROM candidates WHERE id = ?",
-                    [candidate_id]
-                ).fetchone()
-                
-                if current_votes:
-                    current_count = current_votes["votes"] or 0
-                    new_count = current_count + 1
-                    
-                    conn.execute(
-                        "UPDATE candidates SET votes = ? WHERE id = ?",
-                        [new_count, candidate_id]
-                    )
-                    
-                    print(f"✅ Candidate vote count updated: {current_count} → {new_count} for candidate ID: {candidate_id}")
-                else:
-                    print(f"❌ Candidate with ID {candidate_id} not found")
-                    return jsonify({"error": "Candidate not found"}), 404
-                    
-            except Exception as e:
-                print(f"❌ Could not update candidate votes: {e}")
-                return jsonify({"error": "Failed to update candidate vote count"}), 500
-
-            conn.commit()
-
-            # Get final candidate info to return
-            candidate_info = conn.execute(
-                "SELECT full_name, faculty, votes FROM candidates WHERE id = ?",
-                [candidate_id]
-            ).fetchone()
+        clean_reg_number = normalize_reg_number(data["voterRegNumber"])
+        candidate_id = int(data["candidateId"])
+        print(f"Looking for voter: {clean_reg_number}, voting for candidate: {candidate_id}")
 
-            success_msg = f"Vote recorded successfully for {voter_name}! Thank you for voting."
-            print(f"🎉 {success_msg}")
-
-        return jsonify({
-            "message": success_msg,
-            "candidate": {
-                "name": candidate_info["full_name"],
-                "faculty": candidate_info["faculty"],
-                "votes": candidate_info["votes"]
-            }
-        }), 200
+        payload, status = submit_ballot(
+            lambda conn: record_delegate_vote(conn, clean_reg_number, candidate_id)
+        )
+        if status < 400:
+            voted.refresh()
+        return jsonify(payload), status
 
+    except DatabaseBusy:
+        raise
     except ValueError as ve:
         error_msg = "Invalid candidate ID format. Please try again."
         print(f"❌ {error_msg}: {ve}")
@@ -559,11 +254,64 @@ def submit_vote():
         print(f"❌ {error_msg}: {e}")
         return jsonify({"error": error_msg}), 500
 
+def record_delegate_vote(conn, clean_reg_number, candidate_id, cast_at=None, station_id=None, client_ballot_id=None):
+    """Write one delegate ballot; runs inside the ballot writer's batch transaction.
+
+    A ballot synced from a polling station also passes its cast_at and ids (ledger.cast_ballot).
+    """
+    # One seek in voter_identities: students, then approved delegates, then leaders
+    voter = VOTER.first(conn, [clean_reg_number])
+    if not voter:
+        error_msg = "Voter not found. Please ensure you are registered in the system."
+        print(f"❌ {error_msg}")
+        return {"error": error_msg}, 404
+
+    voter_id = voter.voter_id
+    voter_name = voter.full_name
+    user_type = voter.voter_type
+    print(f"✅ Found {user_type}: {clean_reg_number} - {voter_name}")
+
+    candidate_info = conn.execute(
+        "SELECT full_name, faculty FROM candidates WHERE id = ?", [candidate_id]
+    ).fetchone()
+    if not candidate_info:
+        print(f"❌ Candidate with ID {candidate_id} not found")
+        return {"error": "Candidate not found"}, 404
+
+    # The ledger's unique index turns a repeat into "no ballot returned"; its triggers count the vote
+    try:
+        ballot_id = cast_ballot(
+            conn, DELEGATE, clean_reg_number, voter_name, user_type, voter_id, voter.school,
+            [(DELEGATE_POSITION, candidate_id)], cast_at, station_id, client_ballot_id
+        )
+    except Exception as e:
+        print(f"❌ Error recording vote: {e}")
+        return {"error": "Failed to record vote. Please try again."}, 500
+
+    if ballot_id is None:
+        error_msg = "You have already voted. Each voter can only vote once."
+        print(f"❌ {error_msg}")
+        return {"error": error_msg}, 400
+    votes = conn.execute(
+        "SELECT votes FROM tallies WHERE position = ? AND candidate_id = ?", (DELEGATE_POSITION, candidate_id)
+    ).fetchone()[0]
+    success_msg = f"Vote recorded successfully for {voter_name}! Thank you for voting."
+    print(f"🎉 {success_msg}")
+
+    return {
+        "message": success_msg,
+        "candidate": {
+            "name": candidate_info["full_name"],
+            "faculty": candidate_info["faculty"],
+            "votes": votes
+        }
+    }, 200
+
 # Approve delegate
 @delegate_bp.route("/api/delegates/<delegate_id>/approve", methods=["PUT"])
 def approve_delegate(delegate_id):
     try:
-        with get_db_connection() as conn:
+        with write_transaction() as conn:
             delegate = conn.execute(
                 "SELECT id, full_name, registration_number, faculty FROM delegates WHERE id = ?",
                 [delegate_id]
@@ -586,8 +334,8 @@ def approve_delegate(delegate_id):
                 print(f"Original faculty: '{original_faculty}' -> Mapped faculty: '{mapped_faculty}'")
                 
                 conn.execute(
-                    "INSERT INTO candidates (delegate_id, full_name, registration_number, faculty, position, votes) VALUES (?, ?, ?, ?, ?, ?)",
-                    [delegate["id"], delegate["full_name"], delegate["registration_number"], mapped_faculty, "Delegate", 0]
+                    "INSERT INTO candidates (delegate_id, full_name, registration_number, faculty, position) VALUES (?, ?, ?, ?, ?)",
+                    [delegate["id"], delegate["full_name"], delegate["registration_number"], mapped_faculty, "Delegate"]
                 )
                 
                 print(f"Candidate created: {delegate['full_name']} with mapped faculty: '{mapped_faculty}'")
@@ -604,6 +352,8 @@ def approve_delegate(delegate_id):
             
         return jsonify({"message": "Delegate approved and added as candidate successfully"}), 200
         
+    except DatabaseBusy:
+        raise
     except Exception as e:
         print(f"Error in approve_delegate: {e}")
         return jsonify({"error": str(e)}), 500
@@ -615,9 +365,10 @@ def get_voter_records():
     try:
         with get_db_connection() as conn:
             records = conn.execute('''
-                SELECT id, full_name, registration_number, vote_time
-                FROM voter_records 
-                ORDER BY vote_time DESC
+                SELECT id, voter_name AS full_name, voter_reg_number AS registration_number, cast_at AS vote_time
+                FROM ballots
+                WHERE kind = 'delegate'
+                ORDER BY cast_at DESC
             ''').fetchall()
             
             voter_records = []
@@ -640,26 +391,33 @@ def get_voter_records():
 def get_voting_stats():
     """Get voting statistics by user type"""
     try:
-        with get_db_connection() as conn:
+        with get_snapshot_connection() as conn:
             stats = conn.execute('''
                 SELECT 
                     user_type,
                     COUNT(*) as vote_count
-                FROM votes 
+                FROM ballots
+                WHERE kind = 'delegate' AND EXISTS (SELECT 1 FROM ballot_choices WHERE ballot_id = ballots.id)
                 GROUP BY user_type
                 ORDER BY vote_count DESC
             ''').fetchall()
             
-            total_votes = conn.execute("SELECT COUNT(*) as count FROM votes").fetchone()["count"]
-            total_voter_records = conn.execute("SELECT COUNT(*) as count FROM voter_records").fetchone()["count"]
+            total_votes = sum(row["vote_count"] for row in stats)
+            total_voter_records = conn.execute(
+                "SELECT COALESCE(SUM(voters), 0) as count FROM turnout WHERE kind = 'delegate'"
+            ).fetchone()["count"]
             
             stats_data = [{"user_type": row["user_type"], "vote_count": row["vote_count"]} for row in stats]
             
-            return jsonify({
+            age = snapshot_age(conn)
+            response = jsonify({
                 "total_votes": total_votes,
                 "total_voter_records": total_voter_records,
-                "stats_by_user_type": stats_data
-            }), 200
+                "stats_by_user_type": stats_data,
+                "snapshot_age_seconds": age
+            })
+            response.headers["X-Snapshot-Age"] = str(age)
+            return response, 200
             
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -667,35 +425,20 @@ def get_voting_stats():
 # Recount votes endpoint
 @delegate_bp.route("/api/recount-votes", methods=["POST"])
 def recount_votes():
-    """Force recount all votes from votes table to candidates table"""
+    """Force recount all tallies from the ballot ledger"""
     try:
-        with get_db_connection() as conn:
-            candidates = conn.execute("SELECT id FROM candidates").fetchall()
-            
-            updated_count = 0
-            for candidate in candidates:
-                candidate_id = candidate["id"]
-                
-                vote_count = conn.execute(
-                    "SELECT COUNT(*) as count FROM votes WHERE candidate_id = ?",
-                    [candidate_id]
-                ).fetchone()["count"]
-                
-                conn.execute(
-                    "UPDATE candidates SET votes = ? WHERE id = ?",
-                    [vote_count, candidate_id]
-                )
-                
-                print(f"Updated candidate {candidate_id}: {vote_count} votes")
-                updated_count += 1
-            
+        with write_transaction() as conn:
+            updated_count = recount(conn)
             conn.commit()
+            print(f"Recounted {updated_count} tallies from the ballot ledger")
             
             return jsonify({
-                "message": f"Successfully recounted votes for {updated_count} candidates",
+                "message": f"Successfully recounted {updated_count} candidate tallies",
                 "updated_count": updated_count
             }), 200
             
+    except DatabaseBusy:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -715,7 +458,7 @@ def get_pending_delegates():
 @delegate_bp.route("/api/delegates/<delegate_id>/reject", methods=["DELETE"])
 def reject_delegate(delegate_id):
     try:
-        with get_db_connection() as conn:
+        with write_transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "DELETE FROM delegates WHERE id = ?",
@@ -729,5 +472,7 @@ def reject_delegate(delegate_id):
             
         return jsonify({"message": "Delegate rejected successfully"}), 200
         
+    except DatabaseBusy:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
\ No newline at end of file
@@ -0,0 +1,57 @@
+from flask import Blueprint, request, jsonify
+from database import DatabaseBusy
+from elections import ElectionError, close_election, election_results, list_elections
+
+election_bp = Blueprint('election', __name__)
+
+# List elections, newest first
+@election_bp.route("/api/elections", methods=["GET", "OPTIONS"])
+def get_elections():
+    if request.method == "OPTIONS":
+        response = jsonify({"status": "ok"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    try:
+        return jsonify({"elections": list_elections()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Archive the open election and open the next one
+@election_bp.route("/api/elections/close", methods=["POST", "OPTIONS"])
+def close_current_election():
+    if request.method == "OPTIONS":
+        response = jsonify({"status": "ok"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    data = request.get_json() or {}
+
+    try:
+        closed = close_election(str(data.get("next_name", "")).strip())
+        if closed["status"] == "archived":
+            message = "Election closed and archived"
+        else:
+            message = "Election closed; archiving failed and will be retried by the next close or maintenance pass"
+        response = jsonify({"message": message, "election": closed})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response, 200
+    except DatabaseBusy:
+        raise
+    except ElectionError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Closing election failed: {e}")
+        return jsonify({"error": f"Failed to close election: {str(e)}"}), 500
+
+# Final results of an archived election
+@election_bp.route("/api/elections/<int:election_id>/results", methods=["GET"])
+def get_election_results(election_id):
+    try:
+        return jsonify(election_results(election_id))
+    except ElectionError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": f"Failed to read election results: {str(e)}"}), 500
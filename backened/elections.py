@@ -0,0 +1,502 @@
+"""Per-election database files.
+
+The open election owns the ballot ledger in the primary database (ballots,
+ballot_choices and the tallies and turnout derived from them; ledger.py).
+Closing it copies the ballots into a new election file made from a template,
+in the flat votes / vote_results / voter_records layout every archive uses,
+clears the ledger for the next election, then compacts the file and stores it gzip-compressed
+and read-only. Archived elections are queried by expanding the archive once
+into a cache directory and opening it immutable with the whole file mmapped.
+An election whose archiving failed stays 'closed' (not 'archived'); the next
+close or maintenance pass archives it again (archive_closed_elections).
+
+    python elections.py --list
+    python elections.py --close "Election 2025"   # archive the open election, open the next
+"""
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from database import DB_PATH, begin_immediate, connect, get_db_connection
+from journal import journal
+from ledger import DELEGATE_POSITION, LEDGER_TABLES
+from replica import replica
+from voted import voted
+
+# Configuration
+ELECTIONS_DIR = os.environ.get('ELECTIONS_DIR', os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "elections"))
+ARCHIVE_CACHE_SIZE = int(os.environ.get('ELECTION_ARCHIVE_CACHE', '4'))
+
+# Schema of every election file; copied from template.db rather than run per election
+TEMPLATE_SCHEMA = (
+    '''
+    CREATE TABLE election (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        opened_at TIMESTAMP,
+        closed_at TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE votes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        voter_id INTEGER NOT NULL,
+        candidate_id INTEGER NOT NULL,
+        voted_at TIMESTAMP,
+        voter_reg_number TEXT NOT NULL DEFAULT "",
+        voter_school TEXT NOT NULL DEFAULT "",
+        position TEXT,
+        user_type TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE vote_results (
+        position TEXT NOT NULL,
+        candidate_reg_number TEXT NOT NULL,
+        candidate_name TEXT NOT NULL,
+        votes INTEGER DEFAULT 0,
+        last_updated TIMESTAMP,
+        PRIMARY KEY (position, candidate_reg_number)
+    )
+    ''',
+    '''
+    CREATE TABLE voter_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        full_name TEXT NOT NULL,
+        registration_number TEXT UNIQUE NOT NULL,
+        vote_time TIMESTAMP
+    )
+    ''',
+    # Final delegate tallies, frozen with the candidate details they were cast for
+    '''
+    CREATE TABLE candidate_results (
+        candidate_id INTEGER PRIMARY KEY,
+        full_name TEXT NOT NULL,
+        registration_number TEXT NOT NULL,
+        faculty TEXT,
+        position TEXT,
+        votes INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+)
+
+# Indexes are built once the file is full, which is cheaper than maintaining them per row
+ARCHIVE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_votes_reg_voted ON votes(voter_reg_number, voted_at)",
+    "CREATE INDEX IF NOT EXISTS idx_votes_school_reg ON votes(voter_school, voter_reg_number)",
+    "CREATE INDEX IF NOT EXISTS idx_vote_results_ranked ON vote_results(position, votes DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_candidate_results_votes ON candidate_results(votes)",
+)
+
+class ElectionError(Exception):
+    """An election operation that cannot be done in the current state"""
+
+
+def template_path():
+    return os.path.join(ELECTIONS_DIR, "template.db")
+
+
+def ensure_template():
+    """Build template.db once; new election files are plain copies of it"""
+    path = template_path()
+    if os.path.exists(path):
+        return path
+    os.makedirs(ELECTIONS_DIR, exist_ok=True)
+    building = f"{path}.tmp"
+    if os.path.exists(building):
+        os.remove(building)
+    conn = sqlite3.connect(building)
+    try:
+        for statement in TEMPLATE_SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(building, path)
+    return path
+
+
+def election_file(election_id):
+    return os.path.join(ELECTIONS_DIR, f"election-{election_id}.db")
+
+
+def active_election(conn):
+    row = conn.execute("SELECT * FROM elections WHERE status = 'active'").fetchone()
+    return dict(row) if row else None
+
+
+def list_elections():
+    with get_db_connection() as conn:
+        return [dict(row) for row in conn.execute("SELECT * FROM elections ORDER BY id DESC").fetchall()]
+
+
+def _copy_ballots(archive):
+    '''Copy the ballot ledger of the primary, attached as roll, into the election file'''
+    archive.execute('''
+        INSERT INTO main.votes (voter_id, candidate_id, voted_at, voter_reg_number, voter_school, position)
+        SELECT COALESCE(b.voter_id, 0), c.candidate_id, b.cast_at, b.voter_reg_number, b.voter_school, c.position
+        FROM roll.ballots b JOIN roll.ballot_choices c ON c.ballot_id = b.id
+        WHERE b.kind = 'student'
+        ORDER BY b.id
+    ''')
+    # Delegate votes keep the archive's old shape: the voter's type and id, no registration number
+    archive.execute('''
+        INSERT INTO main.votes (voter_id, candidate_id, voted_at, user_type)
+        SELECT COALESCE(b.voter_id, 0), c.candidate_id, b.cast_at, b.user_type
+        FROM roll.ballots b JOIN roll.ballot_choices c ON c.ballot_id = b.id
+        WHERE b.kind = 'delegate'
+        ORDER BY b.id
+    ''')
+    archive.execute('''
+        INSERT INTO main.voter_records (full_name, registration_number, vote_time)
+        SELECT voter_name, voter_reg_number, cast_at FROM roll.ballots WHERE kind = 'delegate'
+        ORDER BY id
+    ''')
+    archive.execute('''
+        INSERT INTO main.vote_results (position, candidate_reg_number, candidate_name, votes, last_updated)
+        SELECT t.position, leader.reg_number, leader.full_name, t.votes, CURRENT_TIMESTAMP
+        FROM roll.tallies t JOIN roll.chosen_leaders leader ON leader.id = t.candidate_id
+        WHERE t.position != ? AND t.votes > 0
+    ''', (DELEGATE_POSITION,))
+    archive.execute('''
+        INSERT INTO main.candidate_results (candidate_id, full_name, registration_number, faculty, position, votes)
+        SELECT c.id, c.full_name, c.registration_number, c.faculty, c.position, COALESCE(t.votes, 0)
+        FROM roll.candidates c LEFT JOIN roll.tallies t ON t.position = ? AND t.candidate_id = c.id
+    ''', (DELEGATE_POSITION,))
+
+
+# Prefix of ballot tables swapped out by a reset or close; maintenance.py drops them when idle
+RETIRED_PREFIX = "retired_"
+
+# Hot ballot tables swapped out as a unit
+SWAP_TABLES = LEDGER_TABLES
+
+
+def swap_tables(conn, tables):
+    """Swap empty copies in for tables, inside the caller's write transaction.
+
+    The full tables are only renamed to retired_<stamp>_<table>, so no row is
+    read or deleted; until maintenance drops them they are a snapshot of what
+    was cleared. The new tables get the same schema, indexes, triggers and
+    AUTOINCREMENT position. SQLite cannot rename an index, so the old indexes
+    are dropped; freeing their pages is the one part of a swap that grows
+    with the number of ballots (python bench.py reset). Every index
+    and trigger goes before any table is renamed, since a rename would
+    otherwise repoint a trigger on one swapped table at another's retired
+    copy. Returns the retired table names.
+    """
+    stamp = time.strftime("%Y%m%d%H%M%S")
+    retired = []
+    # This build zeroes every freed page by default, which would write each dropped index
+    # page to the WAL; FAST leaves them to maintenance's incremental_vacuum, which truncates them away
+    secure_delete = conn.execute("PRAGMA secure_delete").fetchone()[0]
+    conn.execute("PRAGMA secure_delete = FAST")
+    try:
+        swapped = []
+        for table in tables:
+            objects = conn.execute(
+                "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL", (table,)
+            ).fetchall()
+            if objects:
+                swapped.append((table, f"{RETIRED_PREFIX}{stamp}_{table}", objects))
+        for _, _, objects in swapped:
+            for kind, name, _ in objects:
+                if kind in ("index", "trigger"):
+                    conn.execute(f'DROP {kind.upper()} "{name}"')
+        for table, old, _ in swapped:
+            conn.execute(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+        for table, old, objects in swapped:
+            conn.execute(next(sql for kind, _, sql in objects if kind == "table"))
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT ?, seq FROM sqlite_sequence WHERE name = ?", (table, old))
+            retired.append(old)
+        for _, _, objects in swapped:
+            for kind, _, sql in objects:
+                if kind != "table":
+                    conn.execute(sql)
+    finally:
+        conn.execute(f"PRAGMA secure_delete = {secure_delete}")
+    # The new tables' triggers have not fired, so bump the cache counters by hand
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='table_versions'").fetchone():
+        conn.execute(
+            f"UPDATE table_versions SET version = version + 1 WHERE table_name IN ({', '.join('?' for _ in tables)})",
+            tables
+        )
+    return retired
+
+
+def _clear_ballots(conn):
+    """Empty the ballot ledger, and the tallies derived from it; returns the retired tables"""
+    return swap_tables(conn, SWAP_TABLES)
+
+
+def reset_ballots():
+    """Clear the open election's ballots without archiving them.
+
+    Takes the write lock first, like close_election, and swaps the tables
+    rather than deleting rows, so the lock is held for milliseconds; only
+    dropping the old indexes grows with the ballot count. Returns the retired
+    tables per database file.
+    """
+    primary = connect()
+    primary.isolation_level = None
+    retired = {}
+    try:
+        begin_immediate(primary, "reset_ballots")
+        retired[os.path.basename(DB_PATH)] = _clear_ballots(primary)
+        # Replay starts over from here, once the reset has committed
+        with journal.resetting("reset"):
+            primary.execute("COMMIT")
+    finally:
+        if primary.in_transaction:
+            primary.execute("ROLLBACK")
+        primary.close()
+
+    replica.refresh()
+    voted.refresh()
+    return retired
+
+
+def close_election(next_name):
+    """Archive the open election into its own file and open next_name on empty hot tables.
+
+    Ballot writers are held off with BEGIN IMMEDIATE on the primary for the
+    copy. The election file is complete and durable before the
+    hot tables are cleared, so a crash in between leaves the election open
+    with nothing lost; closing again rebuilds the file.
+    """
+    if not next_name:
+        raise ElectionError("A name for the next election is required")
+    template = ensure_template()
+
+    primary = connect()
+    primary.isolation_level = None
+    try:
+        begin_immediate(primary, "close_election")
+        election = active_election(primary)
+        if election is None:
+            raise ElectionError("There is no open election")
+
+        building = f"{election_file(election['id'])}.tmp"
+        shutil.copyfile(template, building)
+        archive = sqlite3.connect(building, isolation_level=None)
+        try:
+            archive.execute("PRAGMA synchronous = FULL")
+            # Read through the attachment; our own write lock keeps it still
+            archive.execute("ATTACH DATABASE ? AS roll", (f"file:{os.path.abspath(DB_PATH)}?mode=ro",))
+            archive.execute("BEGIN")
+            archive.execute(
+                "INSERT INTO election (id, name, opened_at, closed_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
+                (election["id"], election["name"], election["opened_at"])
+            )
+            _copy_ballots(archive)
+            archive.execute("COMMIT")
+            voters = archive.execute(
+                "SELECT COUNT(DISTINCT voter_reg_number) FROM votes WHERE voter_reg_number != ''"
+            ).fetchone()[0]
+        finally:
+            archive.close()
+        os.replace(building, election_file(election["id"]))
+
+        _clear_ballots(primary)
+        primary.execute(
+            "UPDATE elections SET status = 'closed', closed_at = CURRENT_TIMESTAMP, voters = ? WHERE id = ?",
+            (voters, election["id"])
+        )
+        primary.execute("INSERT INTO elections (name) VALUES (?)", (next_name,))
+        with journal.resetting(f"closed election {election['id']}"):
+            primary.execute("COMMIT")
+    finally:
+        if primary.in_transaction:
+            primary.execute("ROLLBACK")
+        primary.close()
+
+    # Results endpoints should show the empty new election now, not after the next refresh
+    replica.refresh()
+    voted.refresh()
+    # The election is closed either way; one whose archiving fails stays 'closed' and is retried
+    archive_closed_elections()
+    with get_db_connection() as conn:
+        return dict(conn.execute("SELECT * FROM elections WHERE id = ?", (election["id"],)).fetchone())
+
+
+def archive_election(election_id):
+    """Index, compact and gzip a closed election's file into its read-only archive.
+
+    Safe to run again after a failure part-way: the .gz only appears once
+    complete, and the election file is removed only after that.
+    """
+    path = election_file(election_id)
+    archive = f"{path}.gz"
+    if not os.path.exists(archive):
+        if not os.path.exists(path):
+            raise ElectionError(f"Election {election_id} has neither a file nor an archive")
+        conn = sqlite3.connect(path)
+        try:
+            for statement in ARCHIVE_INDEXES:
+                conn.execute(statement)
+            conn.commit()
+            conn.execute("ANALYZE")
+            # A single-file database with no free pages, so it can be opened immutable
+            conn.execute("PRAGMA journal_mode = DELETE")
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+        with open(path, "rb") as source, gzip.open(f"{archive}.tmp", "wb", compresslevel=9) as target:
+            shutil.copyfileobj(source, target)
+        os.replace(f"{archive}.tmp", archive)
+    if os.path.exists(path):
+        os.remove(path)
+
+    with get_db_connection() as conn:
+        conn.execute(
+            "UPDATE elections SET status = 'archived', archive_file = ?, archive_bytes = ? WHERE id = ?",
+            (os.path.basename(archive), os.path.getsize(archive), election_id)
+        )
+        conn.commit()
+    print(f"Archived election {election_id} to {archive}")
+    return archive
+
+
+# One archiving pass at a time in this process (a close and a maintenance pass may overlap)
+_archive_lock = threading.Lock()
+
+
+def archive_closed_elections():
+    """Archive every election left 'closed' without its archive; returns the ids archived"""
+    with _archive_lock:
+        with get_db_connection() as conn:
+            pending = [row[0] for row in conn.execute("SELECT id FROM elections WHERE status = 'closed' ORDER BY id")]
+        archived = []
+        for election_id in pending:
+            try:
+                archive_election(election_id)
+                archived.append(election_id)
+            except (OSError, sqlite3.Error, ElectionError) as e:
+                print(f"Archiving election {election_id} failed, will retry: {e}")
+        return archived
+
+
+class ArchiveReader:
+    """Read-only connections to archived elections.
+
+    Each archive is expanded once into ELECTIONS_DIR/cache and opened with
+    immutable=1 (no locking or change detection) and an mmap covering the
+    whole file, so queries read pages straight from the page cache. A few
+    recently used archives stay open.
+    """
+
+    def __init__(self, directory=None, max_open=ARCHIVE_CACHE_SIZE):
+        self.directory = directory
+        self.max_open = max_open
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expand(self, archive_file):
+        directory = self.directory or os.path.join(ELECTIONS_DIR, "cache")
+        path = os.path.join(directory, archive_file[:-len(".gz")])
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            with gzip.open(os.path.join(ELECTIONS_DIR, archive_file), "rb") as source, open(f"{path}.tmp", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.replace(f"{path}.tmp", path)
+        return path
+
+    def _open_archive(self, election):
+        key = election["id"]
+        if key in self._open:
+            self._open.move_to_end(key)
+            return self._open[key]
+        path = self._expand(election["archive_file"])
+        conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA mmap_size = {os.path.getsize(path)}")
+        conn.execute("PRAGMA query_only = ON")
+        self._open[key] = conn
+        while len(self._open) > self.max_open:
+            self._open.popitem(last=False)[1].close()
+        return conn
+
+    @contextmanager
+    def connection(self, election):
+        """Connection to the archive of an archived election row, held for the block"""
+        if election["status"] != "archived" or not election["archive_file"]:
+            raise ElectionError(f"Election {election['id']} has not been archived")
+        with self._lock:
+            yield self._open_archive(election)
+
+
+archives = ArchiveReader()
+
+
+def election_results(election_id):
+    """Final results of an archived election, read from its archive"""
+    with get_db_connection() as conn:
+        row = conn.execute("SELECT * FROM elections WHERE id = ?", (election_id,)).fetchone()
+    if row is None:
+        raise ElectionError(f"Election {election_id} not found")
+    election = dict(row)
+    with archives.connection(election) as conn:
+        results_by_position = {}
+        for result in conn.execute(
+            "SELECT position, candidate_reg_number, candidate_name, votes FROM vote_results ORDER BY position, votes DESC"
+        ).fetchall():
+            results_by_position.setdefault(result["position"], []).append({
+                "candidate_reg_number": result["candidate_reg_number"],
+                "candidate_name": result["candidate_name"],
+                "votes": result["votes"],
+            })
+        candidates = [dict(candidate) for candidate in conn.execute(
+            "SELECT candidate_id, full_name, registration_number, faculty, position, votes FROM candidate_results ORDER BY votes DESC"
+        ).fetchall()]
+        votes_by_school = [dict(school) for school in conn.execute(
+            '''
+            SELECT voter_school as school, COUNT(DISTINCT voter_reg_number) as votes
+            FROM votes
+            GROUP BY voter_school
+            ORDER BY votes DESC
+            '''
+        ).fetchall()]
+    return {
+        "election": election,
+        "total_votes": election["voters"],
+        "results_by_position": results_by_position,
+        "candidates": candidates,
+        "votes_by_school": votes_by_school,
+    }
+
+
+__all__ = [
+    'ElectionError', 'ArchiveReader', 'RETIRED_PREFIX', 'active_election', 'archive_closed_elections',
+    'archive_election', 'archives',
+    'close_election', 'election_results', 'list_elections', 'reset_ballots', 'swap_tables',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage per-election database files")
+    parser.add_argument("--list", action="store_true", help="list elections")
+    parser.add_argument("--close", metavar="NEXT_NAME", help="archive the open election and open NEXT_NAME")
+    args = parser.parse_args()
+
+    if args.close:
+        closed = close_election(args.close)
+        if closed["status"] == "archived":
+            print(f"Closed election {closed['id']} ({closed['name']}): {closed['voters']} voters, "
+                  f"{closed['archive_bytes']} byte archive")
+        else:
+            print(f"Closed election {closed['id']} ({closed['name']}): {closed['voters']} voters, "
+                  f"archiving failed and will be retried")
+    for election in list_elections():
+        print(f"{election['id']:>4}  {election['status']:<9} {election['name']}  {election['archive_file'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,169 @@
+"""Idempotency-Key support for the ballot endpoints.
+
+A client that retries a POST after a timeout sends the same Idempotency-Key
+header. The first request with a key runs the view; its response (anything
+below 500) is kept in a bounded, expiring in-memory store, and every later
+request with that key gets the same response back without touching the
+ballot tables. A retry that arrives while the first request is still running
+waits for it. Reusing a key with a different body is rejected with 422.
+Only completed outcomes are ever dropped to make room; when every entry is
+still in flight a new key is answered with 503 rather than forgetting one.
+
+The store is per worker: a retry that lands on another worker runs the view
+and gets the usual "already voted" answer.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from itertools import islice
+
+from flask import current_app, jsonify, make_response, request
+
+# Configuration
+IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', '20000'))
+IDEMPOTENCY_TTL_S = float(os.environ.get('IDEMPOTENCY_TTL_S', '900'))
+# How long a retry waits for the original request to finish
+IDEMPOTENCY_WAIT_S = float(os.environ.get('IDEMPOTENCY_WAIT_S', '30'))
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+class _Outcome:
+    __slots__ = ("fingerprint", "expires", "done", "status", "body", "headers")
+
+    def __init__(self, fingerprint, expires):
+        self.fingerprint = fingerprint
+        self.expires = expires
+        self.done = threading.Event()
+        self.status = None
+        self.body = None
+        self.headers = None
+
+
+class IdempotencyStore:
+    """Outcomes by (scope, key), oldest first; expired or surplus completed entries are dropped on insert"""
+
+    def __init__(self, max_entries=IDEMPOTENCY_MAX_ENTRIES, ttl_s=IDEMPOTENCY_TTL_S):
+        self.max_entries = max_entries
+        self.ttl = ttl_s
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.replays = 0
+        self.stored = 0
+        self.conflicts = 0
+        self.expired = 0
+        self.evicted = 0
+        self.full = 0
+
+    def claim(self, key, fingerprint):
+        """(outcome, True) for the caller to fill in, (existing outcome, False), or (None, False) when full"""
+        now = time.monotonic()
+        with self._lock:
+            outcome = self._entries.get(key)
+            # A request still running keeps its key however old it is, or a retry would run it twice
+            if outcome is not None and (outcome.expires > now or not outcome.done.is_set()):
+                return outcome, False
+            entries = self._entries
+            # In-flight outcomes at the front, skipped rather than dropped
+            running = 0
+            while len(entries) > running:
+                oldest_key, oldest = next(islice(entries.items(), running, None))
+                if oldest.expires > now and len(entries) < self.max_entries:
+                    break
+                if not oldest.done.is_set():
+                    running += 1
+                    continue
+                del entries[oldest_key]
+                if oldest.expires > now:
+                    self.evicted += 1
+                else:
+                    self.expired += 1
+            if len(entries) >= self.max_entries:
+                self.full += 1
+                return None, False
+            entries.pop(key, None)
+            outcome = entries[key] = _Outcome(fingerprint, now + self.ttl)
+            return outcome, True
+
+    def complete(self, key, outcome, response):
+        outcome.status = response.status_code
+        outcome.body = response.get_data()
+        outcome.headers = [(name, value) for name, value in response.headers if name != "Content-Length"]
+        self.stored += 1
+        outcome.done.set()
+
+    def abandon(self, key, outcome):
+        """Forget an outcome that should not be replayed (server error), so a retry runs again"""
+        with self._lock:
+            if self._entries.get(key) is outcome:
+                del self._entries[key]
+        outcome.done.set()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "stored": self.stored,
+            "replays": self.replays,
+            "conflicts": self.conflicts,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "full": self.full,
+        }
+
+
+store = IdempotencyStore()
+
+
+def idempotent(scope):
+    """Replay the stored response for a repeated POST carrying the same Idempotency-Key"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(HEADER)
+            if request.method != "POST" or not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"}), 400
+
+            fingerprint = hashlib.sha256(request.get_data()).digest()
+            while True:
+                outcome, owner = store.claim((scope, key), fingerprint)
+                if owner:
+                    break
+                if outcome is None:
+                    response = jsonify({"error": "Too many requests in progress, please try again"})
+                    response.headers["Retry-After"] = "1"
+                    return response, 503
+                if outcome.fingerprint != fingerprint:
+                    store.conflicts += 1
+                    return jsonify({"error": f"{HEADER} was already used for a different request"}), 422
+                if not outcome.done.wait(IDEMPOTENCY_WAIT_S):
+                    return jsonify({"error": "The original request is still being processed"}), 409
+                if outcome.status is not None:
+                    store.replays += 1
+                    response = current_app.response_class(outcome.body, status=outcome.status, headers=outcome.headers)
+                    response.headers["Idempotent-Replayed"] = "true"
+                    return response
+                # The original failed with a server error; run this one instead
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                store.abandon((scope, key), outcome)
+                raise
+            if response.status_code >= 500:
+                store.abandon((scope, key), outcome)
+            else:
+                store.complete((scope, key), outcome, response)
+            return response
+        return wrapper
+    return decorator
+
+
+__all__ = ['IdempotencyStore', 'idempotent', 'store']
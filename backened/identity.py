@@ -0,0 +1,79 @@
+"""Registration-number keys.
+
+Registration numbers arrive in whatever case and spacing the user typed.
+Every identity table (students, delegates, leaders, chosen_leaders and users;
+voter_records too, until migration 10 folded it into the ballot ledger)
+carries a generated reg_key column holding the canonical form, with a unique
+index on it (migration 7), so lookups are index seeks:
+
+    conn.execute("SELECT * FROM students WHERE reg_key = ?", (normalize_reg_number(raw),))
+
+Anyone who can vote is also listed in voter_identities (migration 8), kept
+current by triggers on the source tables, so a ballot resolves its voter with
+one primary-key seek (queries.VOTER) instead of probing each table in turn.
+
+One vote per voter is a schema invariant: one ballot of each kind per
+registration number in the ballot ledger (ledger.py, migration 10).
+Ballots insert with ON CONFLICT DO NOTHING RETURNING and treat "no row
+returned" as "already voted".
+"""
+import re
+
+_WHITESPACE = re.compile(r"[ \t\r\n]")
+
+# Identity tables and the column reg_key is derived from
+REG_KEY_COLUMNS = (
+    ("students", "registration_number"),
+    ("delegates", "registration_number"),
+    ("leaders", "reg_number"),
+    ("chosen_leaders", "reg_number"),
+    ("users", "registration_number"),
+    ("voter_records", "registration_number"),
+)
+
+# Tables listed in voter_identities, in the order a voter is resolved (the
+# row's priority): voter type, school column, and when the row may vote
+VOTER_SOURCES = (
+    ("students", "student", "faculty", "1"),
+    ("delegates", "delegate", "faculty", "COALESCE(is_approved = 1, 0)"),
+    ("chosen_leaders", "leader", "school", "1"),
+)
+
+# Migration 9's claims on the pre-ledger votes table. A student ballot first
+# inserts the voter's row here, so a second ballot finds it taken even when it
+# names other positions.
+STUDENT_BALLOT_CLAIMS = (
+    "CREATE TABLE IF NOT EXISTS student_ballots ("
+    "voter_reg_number TEXT PRIMARY KEY, voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP) WITHOUT ROWID"
+)
+
+# Migration 9's indexes on the pre-ledger votes table. Student ballots: one
+# row per voter and position. Delegate ballots (no registration number on the
+# row): one row per voter. voter_records is already unique on the
+# registration number.
+BALLOT_UNIQUE_INDEXES = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_votes_voter_position ON votes(voter_reg_number, position) "
+    "WHERE voter_reg_number != ''",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_votes_voter_once ON votes(user_type, voter_id) WHERE user_type IS NOT NULL",
+)
+
+
+def normalize_reg_number(value):
+    """Canonical registration number: no whitespace, upper case. Matches reg_key_sql()."""
+    return _WHITESPACE.sub("", str(value)).upper()
+
+
+def reg_key_sql(column):
+    """SQL expression computing normalize_reg_number(column); registration numbers are ASCII"""
+    return f"upper(replace(replace(replace(replace({column}, ' ', ''), char(9), ''), char(10), ''), char(13), ''))"
+
+
+def reg_key_declaration(column):
+    """Column declaration for a table's generated reg_key"""
+    return f"TEXT GENERATED ALWAYS AS ({reg_key_sql(column)}) VIRTUAL"
+
+
+__all__ = [
+    'BALLOT_UNIQUE_INDEXES', 'REG_KEY_COLUMNS', 'STUDENT_BALLOT_CLAIMS', 'VOTER_SOURCES', 'normalize_reg_number',
+    'reg_key_declaration', 'reg_key_sql',
+]
@@ -0,0 +1,434 @@
+"""Append-only ballot journal.
+
+Every accepted ballot is also appended to BALLOT_JOURNAL_PATH (next to the
+database, `garissa_voting.journal`), so the ballot ledger (ledger.py) can be
+rebuilt if it is damaged; its tallies and turnout follow from the rebuilt
+rows. The file is
+a 4-byte magic followed by records of
+
+    <payload length: u32 LE> <CRC-32 of payload: u32 LE> <payload: compact JSON array>
+
+ledger.cast_ballot stages an entry (stage_ballot) once a ballot's rows are
+written. The ballot writer appends a batch's entries, tagged with a batch
+id, just before the batch's COMMIT, and once the COMMIT has succeeded
+appends a commit marker for that batch and fsyncs, before any ballot is
+acknowledged. Replay applies a batch only when it reaches its commit
+marker, so ballots whose transaction rolled back are never restored.
+Resets and closed elections append a reset marker right after they commit,
+holding off other appends in between, and replay starts over from the last
+one. `python journal.py checkpoint` appends the ledger as it
+stands (run it once when the journal is first enabled, since ballots cast
+before then were never journaled). Writes from several workers are
+serialized with flock on O_APPEND, and a torn record left by a crash is
+cut off before the next append.
+
+    python journal.py checkpoint            # snapshot the current ledger into the journal
+    python journal.py replay                # stream the journal, print tallies and ballots/s
+    python journal.py rebuild               # replace the ballot ledger with the journal's
+    python journal.py rebuild --into copy.db
+"""
+import argparse
+import contextlib
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+
+from database import DB_PATH, begin_immediate, connect
+
+# Configuration
+JOURNAL_ENABLED = os.environ.get('BALLOT_JOURNAL', '1') != '0'
+JOURNAL_PATH = os.environ.get('BALLOT_JOURNAL_PATH', os.path.splitext(DB_PATH)[0] + ".journal")
+# fsync each flushed batch; off only for benchmarks
+JOURNAL_FSYNC = os.environ.get('BALLOT_JOURNAL_FSYNC', '1') != '0'
+
+MAGIC = b"GVJ1"
+HEADER = struct.Struct("<II")
+
+# Entry kinds: the first element of every payload
+# ["b", at, batch, kind, reg_key, voter_name, voter_type, voter_id, school, [[position, candidate_id], ...],
+#  station_id, client_ballot_id]
+BALLOT = "b"
+COMMIT = "c"    # ["c", at, batch]: every ballot of the batch is committed
+RESET = "x"     # ["x", at, reason]
+
+
+def encode(entry):
+    payload = json.dumps(entry, separators=(",", ":"), ensure_ascii=False).encode()
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+class BallotJournal:
+    """Stages entries per thread and appends them in fsynced batches"""
+
+    def __init__(self, path=None, enabled=JOURNAL_ENABLED, fsync=JOURNAL_FSYNC):
+        self.path = path or JOURNAL_PATH
+        self.enabled = enabled
+        self.fsync = fsync
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._fd = None
+        self._batches = 0
+        self.records = 0
+        self.flushes = 0
+        self.bytes = 0
+        self.fsync_seconds = 0.0
+        self.commit_errors = 0
+
+    def _staged(self):
+        staged = getattr(self._local, "staged", None)
+        if staged is None:
+            staged = self._local.staged = []
+        return staged
+
+    def _stage(self, kind, *fields, at=None):
+        if self.enabled:
+            self._staged().append((kind, at or time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()), fields))
+
+    def _batch_id(self):
+        with self._lock:
+            self._batches += 1
+            return f"{os.getpid()}.{threading.get_ident()}.{self._batches}"
+
+    def stage_ballot(self, kind, reg_key, voter_name, voter_type, voter_id, school, choices,
+                     cast_at=None, station_id=None, client_ballot_id=None):
+        """Arguments as ledger.cast_ballot takes them; cast_at defaults to now"""
+        self._stage(BALLOT, kind, reg_key, voter_name or "", voter_type, voter_id, school or "",
+                    [[position, candidate_id] for position, candidate_id in choices], station_id, client_ballot_id,
+                    at=cast_at)
+
+    def mark(self):
+        """Position to discard back to if the ballot staged after it is rolled back"""
+        return len(self._staged())
+
+    def discard(self, mark=0):
+        del self._staged()[mark:]
+
+    def flush(self):
+        """Append this thread's staged entries as one batch; call just before their COMMIT.
+
+        Returns the batch id to pass to commit() once the COMMIT succeeds
+        (None when nothing was staged). Not fsynced: the commit marker's
+        fsync makes the batch durable.
+        """
+        staged = self._staged()
+        if not staged:
+            return None
+        batch = self._batch_id()
+        data = b"".join(encode([kind, at, batch, *fields]) for kind, at, fields in staged)
+        count = len(staged)
+        staged.clear()
+        self._append(data, sync=False)
+        self.records += count
+        self.flushes += 1
+        return batch
+
+    def commit(self, batch):
+        """Append the commit marker of a flushed batch and fsync; call after its COMMIT, before acknowledging it.
+
+        The ballots are committed whatever happens here, so a failed append is
+        reported rather than raised; the journal then lacks them until the
+        next `python journal.py checkpoint`.
+        """
+        if batch is None:
+            return
+        try:
+            self._append(encode([COMMIT, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()), batch]))
+        except OSError as e:
+            self.commit_errors += 1
+            print(f"Ballot journal: could not mark batch {batch} committed ({e}); run `python journal.py checkpoint`")
+
+    @contextlib.contextmanager
+    def resetting(self, reason):
+        """Commit a reset inside the block; its reset marker is appended once the block exits cleanly.
+
+        Appends are held off for the whole block, so no ballot that commits
+        after the reset can reach the journal ahead of its marker (replay
+        drops everything before the marker).
+        """
+        if not self.enabled:
+            yield
+            return
+        with self._locked() as fd:
+            yield
+            self._write(fd, encode([RESET, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()), reason]), sync=True)
+
+    def _open(self):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            size = os.fstat(fd).st_size
+            if size == 0:
+                os.write(fd, MAGIC)
+            else:
+                valid = Replay(self.path).valid_length()
+                if valid < size:
+                    print(f"Ballot journal: cutting a torn final record ({size - valid} bytes)")
+                    os.ftruncate(fd, valid)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        return fd
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """The journal's descriptor, with this process's and every other worker's appends held off"""
+        with self._lock:
+            if self._fd is None:
+                self._fd = self._open()
+            fd = self._fd
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield fd
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _write(self, fd, data, sync):
+        size = os.fstat(fd).st_size
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            start = time.perf_counter()
+            if sync and self.fsync:
+                os.fdatasync(fd)
+            self.fsync_seconds += time.perf_counter() - start
+        except OSError:
+            # Never leave a torn record for the next batch to follow
+            os.ftruncate(fd, size)
+            raise
+        self.bytes += len(data)
+
+    def _append(self, data, sync=True):
+        with self._locked() as fd:
+            self._write(fd, data, sync)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "size_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "records": self.records,
+            "flushes": self.flushes,
+            "average_batch": round(self.records / self.flushes, 2) if self.flushes else 0,
+            "bytes_written": self.bytes,
+            "fsync_ms": round(self.fsync_seconds * 1000, 1),
+            "commit_errors": self.commit_errors,
+        }
+
+
+journal = BallotJournal()
+
+
+class Replay:
+    """One streaming pass over a journal file through mmap"""
+
+    def __init__(self, path=None):
+        self.path = path or JOURNAL_PATH
+        self.records = 0
+        self.valid_bytes = 0
+        self.torn_bytes = 0
+
+    def valid_length(self):
+        """Bytes up to the end of the last intact record, checked without decoding"""
+        for _ in self._payloads():
+            pass
+        return self.valid_bytes
+
+    def __iter__(self):
+        for payload in self._payloads():
+            yield json.loads(payload)
+
+    def _payloads(self):
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[:len(MAGIC)] != MAGIC:
+                    raise ValueError(f"{self.path} is not a ballot journal")
+                offset = len(MAGIC)
+                while offset + HEADER.size <= size:
+                    length, crc = HEADER.unpack_from(data, offset)
+                    end = offset + HEADER.size + length
+                    if end > size:
+                        break
+                    payload = data[offset + HEADER.size:end]
+                    if zlib.crc32(payload) != crc:
+                        break
+                    self.records += 1
+                    yield payload
+                    offset = end
+                # A crash mid-append leaves a partial last record; it was never acknowledged
+                self.valid_bytes = offset
+                self.torn_bytes = size - offset
+
+
+class Ledgers:
+    """The ballot ledger rebuilt in memory from journal entries"""
+
+    def __init__(self):
+        self.clear()
+        self.resets = 0
+
+    def clear(self):
+        # (reg_key, kind) -> (cast_at, voter_type, voter_id, voter_name, school, [(position, candidate_id), ...],
+        #                     station_id, client_ballot_id)
+        self.ballots = {}
+        self.tallies = Counter()   # (position, candidate_id) -> votes
+        # batch id -> ballot entries appended but not yet marked committed
+        self.pending = {}
+        self.cast = 0
+        self.skipped = 0
+
+    def apply(self, entry):
+        kind = entry[0]
+        if kind == RESET:
+            self.clear()
+            self.resets += 1
+        elif kind == BALLOT:
+            self.pending.setdefault(entry[2], []).append(entry)
+        elif kind == COMMIT:
+            # A batch cleared by a later reset is gone from pending, as its ballots are from the ledger
+            for ballot in self.pending.pop(entry[2], ()):
+                self._cast(ballot)
+        else:
+            raise ValueError(f"Unknown journal entry kind {kind!r}")
+
+    def _cast(self, entry):
+        _, at, _, ballot_kind, reg_key, name, voter_type, voter_id, school, choices, station_id, client_id = entry
+        self.cast += 1
+        if (reg_key, ballot_kind) in self.ballots:
+            self.skipped += 1
+            return
+        self.ballots[(reg_key, ballot_kind)] = (at, voter_type, voter_id, name, school,
+                                                [tuple(choice) for choice in choices], station_id, client_id)
+        for position, candidate_id in choices:
+            self.tallies[(position, candidate_id)] += 1
+
+    def uncommitted(self):
+        """Ballots appended whose batch never reached a commit marker (rolled back, or cut off by a crash)"""
+        return sum(len(entries) for entries in self.pending.values())
+
+    def votes(self):
+        return sum(len(ballot[5]) for ballot in self.ballots.values())
+
+    def write(self, conn):
+        """Replace the ledger in conn inside the caller's transaction"""
+        for table in ("ballot_choices", "ballots", "tallies", "turnout"):
+            conn.execute(f"DELETE FROM {table}")
+        rows, choices = [], []
+        for ballot_id, ((reg_key, kind), ballot) in enumerate(self.ballots.items(), 1):
+            at, voter_type, voter_id, name, school, picked, station_id, client_id = ballot
+            rows.append((ballot_id, reg_key, kind, voter_type, voter_id, name, school, at, station_id, client_id))
+            choices += ((ballot_id, position, candidate_id) for position, candidate_id in picked)
+        # The ledger's triggers derive tallies and turnout from these rows
+        conn.executemany(
+            "INSERT INTO ballots (id, voter_reg_number, kind, user_type, voter_id, voter_name, voter_school, cast_at, "
+            "station_id, client_ballot_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        conn.executemany("INSERT INTO ballot_choices (ballot_id, position, candidate_id) VALUES (?, ?, ?)", choices)
+        # Votes kept without a ballot are never journaled; they stay in the database's tally_adjustments
+        from ledger import fold_adjustments
+        fold_adjustments(conn)
+
+
+def checkpoint(target=None):
+    """Append a reset marker and the current ledger; returns the number of records.
+
+    The write lock is held while the rows are read and appended, so no
+    ballot can land between the snapshot and the journal.
+    """
+    target = target or journal
+    now = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+    conn = connect()
+    conn.isolation_level = None
+    try:
+        begin_immediate(conn, "journal_checkpoint")
+        # The rows are committed already, so the checkpoint is one batch with its marker
+        batch = target._batch_id()
+        entries = [[RESET, now, "checkpoint"]]
+        for row in conn.execute(
+            """
+            SELECT cast_at, kind, voter_reg_number, voter_name, user_type, voter_id, voter_school,
+                   (SELECT json_group_array(json_array(position, candidate_id)) FROM ballot_choices
+                    WHERE ballot_id = ballots.id),
+                   station_id, client_ballot_id
+            FROM ballots ORDER BY id
+            """
+        ):
+            entries.append([BALLOT, row[0], batch, *row[1:7], json.loads(row[7]), row[8], row[9]])
+        entries.append([COMMIT, now, batch])
+        target._append(b"".join(encode(entry) for entry in entries))
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        conn.close()
+    return len(entries)
+
+
+def replay(path=None):
+    """Ledgers rebuilt from the journal in one pass, the pass itself, and its duration in seconds"""
+    ledgers = Ledgers()
+    entries = Replay(path)
+    start = time.perf_counter()
+    for entry in entries:
+        ledgers.apply(entry)
+    return ledgers, entries, time.perf_counter() - start
+
+
+def rebuild(path=None, into=None):
+    """Replace the ballot ledger in into (default: the primary); its triggers recount the tallies"""
+    ledgers, entries, elapsed = replay(path)
+    target = connect(into or DB_PATH)
+    target.isolation_level = None
+    try:
+        begin_immediate(target, "journal_rebuild")
+        ledgers.write(target)
+        target.execute("COMMIT")
+    finally:
+        if target.in_transaction:
+            target.execute("ROLLBACK")
+        target.close()
+    return ledgers, entries, elapsed
+
+
+__all__ = ['BallotJournal', 'Ledgers', 'Replay', 'checkpoint', 'journal', 'rebuild', 'replay']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the ballot journal")
+    parser.add_argument("command", choices=("checkpoint", "replay", "rebuild"))
+    parser.add_argument("--journal", default=JOURNAL_PATH, help="journal file (default: %(default)s)")
+    parser.add_argument("--into", help="database to rebuild instead of the primary")
+    args = parser.parse_args()
+
+    if args.command == "checkpoint":
+        count = checkpoint(BallotJournal(args.journal, enabled=True))
+        print(f"Appended a checkpoint of {count} records to {args.journal}")
+        return
+    if args.command == "rebuild":
+        ledgers, entries, elapsed = rebuild(args.journal, args.into)
+    else:
+        ledgers, entries, elapsed = replay(args.journal)
+    rate = entries.records / elapsed if elapsed else 0
+    print(f"{entries.records} records ({entries.valid_bytes} bytes) in {elapsed * 1000:.1f} ms: {rate:,.0f} records/s")
+    if entries.torn_bytes:
+        print(f"Ignored a torn final record ({entries.torn_bytes} bytes)")
+    print(f"Since the last of {ledgers.resets} resets: {ledgers.cast} ballots, {ledgers.skipped} repeats skipped, "
+          f"{len(ledgers.ballots)} voters, {ledgers.votes()} votes")
+    if ledgers.uncommitted():
+        print(f"Left out {ledgers.uncommitted()} ballots whose transaction never committed")
+    for (position, candidate_id), votes in sorted(ledgers.tallies.items(), key=lambda item: (item[0][0], -item[1])):
+        print(f"  {position:<12} candidate {candidate_id:<5} {votes}")
+    if args.command == "rebuild":
+        print(f"Rebuilt the ballot ledger in {args.into or DB_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,11 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import datetime
 import os
-from contextlib import contextmanager
+from cache import query_cache
+from database import DB_PATH, DatabaseBusy, get_db_connection, write_transaction
+from identity import normalize_reg_number
+from positions import normalize_position_name
+from queries import ALL_LEADERS, APPROVED_LEADERS, CHOSEN_LEADERS, PENDING_LEADERS, json_response, wrap
 import re
 from werkzeug.utils import secure_filename
 from flask import send_file
@@ -26,17 +30,6 @@ CORS(leader_bp, resources={
 
 # Configuration
 JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-strong-secret-key-here')
-DB_PATH = os.path.join(os.getcwd(), "garissa_voting.db")
-
-# Database context manager
-@contextmanager
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
 
 def validate_phone(phone):
     """Validate phone number format"""
@@ -66,123 +59,6 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def normalize_position_name(position):
-    """Normalize position names to handle variations consistently"""
-    if not position:
-        return position
-    
-    position_lower = position.lower().strip()
-    
-    # Handle Sports and Entertainment Director variations
-    if 'sport' in position_lower and 'entertainment' in position_lower and 'director' in position_lower:
-        return 'Sports and Entertainment Director'
-    
-    # Handle other potential variations
-    variations = {
-        'chairperson': 'ChairPerson',
-        'vice chairperson': 'Vice ChairPerson', 
-        'vice-chairperson': 'Vice ChairPerson',
-        'secretary general': 'Secretary General',
-        'finance secretary': 'Finance Secretary',
-        'academic director': 'Academic Director',
-        'welfare director': 'Welfare Director'
-    }
-    
-    for variation, standard in variations.items():
-        if variation in position_lower:
-            return standard
-    
-    # Return original if no variations matched
-    return position
-
-def init_db():
-    with get_db_connection() as conn:
-        # Check if leaders table exists and get its structure
-        cursor = conn.cursor()
-        cursor.execute("PRAGMA table_info(leaders)")
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        # Add missing photo columns if they don't exist
-        if 'photo' not in columns:
-            conn.execute('ALTER TABLE leaders ADD COLUMN photo BLOB')
-            print("Added 'photo' column to leaders table")
-        
-        if 'photo_filename' not in columns:
-            conn.execute('ALTER TABLE leaders ADD COLUMN photo_filename TEXT')
-            print("Added 'photo_filename' column to leaders table")
-        
-        if not columns:
-            # Create new leaders table with status column
-            conn.execute('''
-                CREATE TABLE leaders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    full_name TEXT NOT NULL,
-                    reg_number TEXT UNIQUE NOT NULL,
-                    school TEXT,
-                    position TEXT NOT NULL,
-                    phone TEXT NOT NULL,
-                    email TEXT,
-                    year_of_study TEXT,
-                    photo_url TEXT,
-                    password TEXT NOT NULL,
-                    status TEXT DEFAULT 'pending',
-                    is_approved BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
- 
-        
-        # Create chosen_leaders table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS chosen_leaders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                original_leader_id INTEGER NOT NULL,
-                full_name TEXT NOT NULL,
-                reg_number TEXT UNIQUE NOT NULL,
-                school TEXT,
-                position TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                email TEXT,
-                year_of_study TEXT,
-                photo_url TEXT,
-                password TEXT NOT NULL,
-                is_admin BOOLEAN DEFAULT FALSE,
-                approved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (original_leader_id) REFERENCES leaders (id)
-            )
-        ''')
-        
-        # Create indexes
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_leaders_reg_number ON leaders(reg_number)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_leaders_email ON leaders(email)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_leaders_status ON leaders(status)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_leaders_is_approved ON leaders(is_approved)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_chosen_leaders_reg_number ON chosen_leaders(reg_number)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_chosen_leaders_email ON chosen_leaders(email)')
-        
-        # Clean up existing position name variations
-        try:
-            conn.execute(
-                "UPDATE leaders SET position = ? WHERE position LIKE ?",
-                ('Sports and Entertainment Director', '%Sport%Entertainment%Director%')
-            )
-            conn.execute(
-                "UPDATE chosen_leaders SET position = ? WHERE position LIKE ?",
-                ('Sports and Entertainment Director', '%Sport%Entertainment%Director%')
-            )
-            print("Cleaned up position name variations in database")
-        except Exception as e:
-            print(f"Note: Could not clean up position names: {e}")
-        
-        conn.commit()
-        print("Database initialization completed successfully!")
-
-# Initialize database
-init_db()
-
 @leader_bp.route("/api/leaders/register", methods=["POST", "OPTIONS"])
 def register_leader():
     if request.method == "OPTIONS":
@@ -222,11 +98,11 @@ def register_leader():
         if not password:
             return jsonify({"error": "Password cannot be generated from phone number"}), 400
 
-        # Normalize position name to handle variations
+        # Positions are stored as the registry's display name (positions.py)
         normalized_position = normalize_position_name(data["position"])
         print(f"Original position: {data['position']}, Normalized: {normalized_position}")
 
-        with get_db_connection() as conn:
+        with write_transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 '''
@@ -236,7 +112,7 @@ def register_leader():
                 ''',
                 (
                     str(data["fullName"]).strip(),
-                    str(data["regNumber"]).strip().upper(),
+                    normalize_reg_number(data["regNumber"]),
                     str(data.get("school", "")).strip(),
                     normalized_position,  # Use normalized position
                     phone,
@@ -257,8 +133,10 @@ def register_leader():
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 201
 
+    except DatabaseBusy:
+        raise
     except sqlite3.IntegrityError as e:
-        if "UNIQUE constraint failed: leaders.reg_number" in str(e):
+        if "UNIQUE constraint failed: leaders.reg_" in str(e):
             return jsonify({"error": "Registration number already exists"}), 400
         if "UNIQUE constraint failed: leaders.email" in str(e):
             return jsonify({"error": "Email already exists"}), 400
@@ -305,7 +183,7 @@ def upload_leader_photo():
         print(f"Updating photo for leader {leader_id}, filename: {photo_filename}, size: {len(photo_data)} bytes")
         
         # Update leader record with photo
-        with get_db_connection() as conn:
+        with write_transaction() as conn:
             cursor = conn.cursor()
             
             # Check if leader exists
@@ -326,6 +204,8 @@ def upload_leader_photo():
         print(f"Photo uploaded successfully for leader {leader_id}")
         return jsonify({'message': 'Photo uploaded successfully'}), 200
         
+    except DatabaseBusy:
+        raise
     except Exception as e:
         print(f"Photo upload error: {str(e)}")
         return jsonify({'error': f'Photo upload failed: {str(e)}'}), 500
@@ -377,20 +257,20 @@ def login():
         return jsonify({"error": "Password is required"}), 400
 
     try:
-        reg_number = str(data["registrationNumber"]).strip().upper()
+        reg_number = normalize_reg_number(data["registrationNumber"])
         password = str(data["password"])
 
         # Check leaders table first for approved status
         with get_db_connection() as conn:
             row = conn.execute(
-                "SELECT * FROM leaders WHERE reg_number = ? COLLATE NOCASE AND is_approved = 1",
+                "SELECT * FROM leaders WHERE reg_key = ? AND is_approved = 1",
                 (reg_number,)
             ).fetchone()
 
             # If not found in leaders, check chosen_leaders
             if not row:
                 row = conn.execute(
-                    "SELECT * FROM chosen_leaders WHERE reg_number = ? COLLATE NOCASE",
+                    "SELECT * FROM chosen_leaders WHERE reg_key = ?",
                     (reg_number,)
                 ).fetchone()
 
@@ -418,11 +298,12 @@ def login():
 
             # Update last login timestamp (for chosen_leaders if applicable)
             if "chosen_leaders" in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='chosen_leaders'").fetchone():
-                conn.execute(
-                    "UPDATE chosen_leaders SET updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                    (leader["id"],)
-                )
-                conn.commit()
+                with write_transaction() as conn:
+                    conn.execute(
+                        "UPDATE chosen_leaders SET updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                        (leader["id"],)
+                    )
+                    conn.commit()
 
             response = jsonify({
                 "message": "Login successful",
@@ -443,6 +324,8 @@ def login():
             response.headers.add("Access-Control-Allow-Origin", "*")
             return response, 200
 
+    except DatabaseBusy:
+        raise
     except Exception as e:
         return jsonify({"error": f"Login error: {str(e)}"}), 500
 
@@ -519,31 +402,9 @@ def get_pending_leaders():
 
     try:
         with get_db_connection() as conn:
-            rows = conn.execute(
-                "SELECT * FROM leaders WHERE is_approved = 0 ORDER BY created_at DESC"
-            ).fetchall()
-            
-        # Format response
-        leaders = []
-        for row in rows:
-            leader = dict(row)
-            leaders.append({
-                "id": leader["id"],
-                "fullName": leader["full_name"],
-                "regNumber": leader["reg_number"],
-                "school": leader["school"],
-                "position": leader["position"],
-                "phone": leader["phone"],
-                "email": leader["email"],
-                "yearOfStudy": leader["year_of_study"],
-                "photoUrl": leader["photo_url"],
-                "status": leader["status"],
-                "is_approved": bool(leader["is_approved"]),
-                "created_at": leader["created_at"],
-                "updated_at": leader["updated_at"]
-            })
+            leaders = PENDING_LEADERS.json(conn)
         
-        response = jsonify({"leaders": leaders})
+        response = json_response(wrap("leaders", leaders))
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 200
         
@@ -590,7 +451,10 @@ def update_leader(leader_id):
         else:
             email = ""
 
-        with get_db_connection() as conn:
+        # Stored as the registry's display name, on leaders and chosen_leaders alike
+        position = normalize_position_name(str(data.get("position", "")).strip())
+
+        with write_transaction() as conn:
             # Check if leader exists
             row = conn.execute(
                 "SELECT * FROM leaders WHERE id = ?",
@@ -613,7 +477,7 @@ def update_leader(leader_id):
                 (
                     str(data.get("fullName", "")).strip(),
                     str(data.get("school", "")).strip(),
-                    str(data.get("position", "")).strip(),
+                    position,
                     phone or str(data.get("phone", "")).strip(),
                     email,
                     str(data.get("yearOfStudy", "")).strip(),
@@ -633,7 +497,7 @@ def update_leader(leader_id):
                     (
                         str(data.get("fullName", "")).strip(),
                         str(data.get("school", "")).strip(),
-                        str(data.get("position", "")).strip(),
+                        position,
                         phone or str(data.get("phone", "")).strip(),
                         email,
                         str(data.get("yearOfStudy", "")).strip(),
@@ -650,6 +514,8 @@ def update_leader(leader_id):
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 200
 
+    except DatabaseBusy:
+        raise
     except sqlite3.IntegrityError as e:
         if "UNIQUE constraint failed: leaders.reg_number" in str(e):
             response = jsonify({"error": "Registration number already exists"})
@@ -673,7 +539,7 @@ def approve_leader(leader_id):
         return response, 200
 
     try:
-        with get_db_connection() as conn:
+        with write_transaction() as conn:
             # Begin transaction
             cursor = conn.cursor()
             
@@ -701,8 +567,8 @@ def approve_leader(leader_id):
             
             # Check for duplicates in chosen_leaders
             existing = cursor.execute(
-                "SELECT id FROM chosen_leaders WHERE reg_number = ?",
-                (leader["reg_number"],)
+                "SELECT id FROM chosen_leaders WHERE reg_key = ?",
+                (normalize_reg_number(leader["reg_number"]),)
             ).fetchone()
             
             if existing:
@@ -766,11 +632,13 @@ def approve_leader(leader_id):
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 200
         
+    except DatabaseBusy:
+        raise
     except sqlite3.IntegrityError as e:
         print(f"Integrity error: {e}")
         # Try to just update the approval status
         try:
-            with get_db_connection() as conn:
+            with write_transaction() as conn:
                 conn.execute(
                     "UPDATE leaders SET status = 'approved', is_approved = 1, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
                     (leader_id,)
@@ -783,6 +651,8 @@ def approve_leader(leader_id):
             })
             response.headers.add("Access-Control-Allow-Origin", "*")
             return response, 200
+        except DatabaseBusy:
+            raise
         except Exception as inner_error:
             response = jsonify({"error": f"Failed to update approval status: {str(inner_error)}"})
             response.headers.add("Access-Control-Allow-Origin", "*")
@@ -805,7 +675,7 @@ def reject_leader(leader_id):
         return response, 200
 
     try:
-        with get_db_connection() as conn:
+        with write_transaction() as conn:
             # Check if leader exists and is pending
             row = conn.execute(
                 "SELECT * FROM leaders WHERE id = ?",
@@ -841,6 +711,8 @@ def reject_leader(leader_id):
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 200
         
+    except DatabaseBusy:
+        raise
     except Exception as e:
         response = jsonify({"error": f"Rejection failed: {str(e)}"})
         response.headers.add("Access-Control-Allow-Origin", "*")
@@ -858,31 +730,9 @@ def get_chosen_leaders():
 
     try:
         with get_db_connection() as conn:
-            rows = conn.execute(
-                "SELECT * FROM chosen_leaders ORDER BY approved_at DESC"
-            ).fetchall()
-            
-        # Format response
-        leaders = []
-        for row in rows:
-            leader = dict(row)
-            leaders.append({
-                "id": leader["id"],
-                "fullName": leader["full_name"],
-                "regNumber": leader["reg_number"],
-                "school": leader["school"],
-                "position": leader["position"],
-                "phone": leader["phone"],
-                "email": leader["email"],
-                "yearOfStudy": leader["year_of_study"],
-                "photoUrl": leader["photo_url"],
-                "is_admin": bool(leader["is_admin"]),
-                "approved_at": leader["approved_at"],
-                "created_at": leader["created_at"],
-                "updated_at": leader["updated_at"]
-            })
+            leaders = CHOSEN_LEADERS.json(conn)
         
-        response = jsonify({"leaders": leaders})
+        response = json_response(wrap("leaders", leaders))
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 200
         
@@ -901,31 +751,9 @@ def get_all_leaders():
 
     try:
         with get_db_connection() as conn:
-            rows = conn.execute(
-                "SELECT * FROM leaders ORDER BY created_at DESC"
-            ).fetchall()
-            
-        # Format response
-        leaders = []
-        for row in rows:
-            leader = dict(row)
-            leaders.append({
-                "id": leader["id"],
-                "fullName": leader["full_name"],
-                "regNumber": leader["reg_number"],
-                "school": leader["school"],
-                "position": leader["position"],
-                "phone": leader["phone"],
-                "email": leader["email"],
-                "yearOfStudy": leader["year_of_study"],
-                "photoUrl": leader["photo_url"],
-                "status": leader["status"],
-                "is_approved": bool(leader["is_approved"]),
-                "created_at": leader["created_at"],
-                "updated_at": leader["updated_at"]
-            })
+            leaders = ALL_LEADERS.json(conn)
         
-        response = jsonify({"leaders": leaders})
+        response = json_response(wrap("leaders", leaders))
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 200
         
@@ -946,10 +774,10 @@ def get_leaders_by_position(position):
 
     try:
         with get_db_connection() as conn:
-            # Get from chosen_leaders table (approved leaders)
+            # Get from chosen_leaders table (approved leaders); a position key or any spelling works
             rows = conn.execute(
                 "SELECT * FROM chosen_leaders WHERE position = ? ORDER BY full_name",
-                (position,)
+                (normalize_position_name(position),)
             ).fetchall()
             
         # Format response
@@ -977,6 +805,11 @@ def get_leaders_by_position(position):
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 500
 
+def load_approved_leaders():
+    """Approved leaders in ballot order, as served by /api/leaders/approved"""
+    with get_db_connection() as conn:
+        return wrap("candidates", APPROVED_LEADERS.json(conn))
+
 @leader_bp.route("/api/leaders/approved", methods=["GET", "OPTIONS"])
 def get_approved_leaders():
     """Get all approved leaders from chosen_leaders table"""
@@ -988,29 +821,8 @@ def get_approved_leaders():
         return response, 200
 
     try:
-        with get_db_connection() as conn:
-            rows = conn.execute(
-                "SELECT * FROM chosen_leaders ORDER BY position, full_name"
-            ).fetchall()
-            
-        # Format response
-        leaders = []
-        for row in rows:
-            leader = dict(row)
-            leaders.append({
-                "id": leader["id"],
-                "original_leader_id": leader["original_leader_id"],  # ADDED: For photo access
-                "fullName": leader["full_name"],
-                "regNumber": leader["reg_number"],
-                "school": leader["school"],
-                "position": leader["position"],
-                "phone": leader["phone"],
-                "email": leader["email"],
-                "yearOfStudy": leader["year_of_study"],
-                "photoUrl": f"/api/leaders/photo/{leader['original_leader_id']}"  # FIXED: Use original_leader_id for photos
-            })
-        
-        response = jsonify({"candidates": leaders})
+        leaders = query_cache.get("approved_leaders", ("chosen_leaders",), load_approved_leaders)
+        response = json_response(leaders)
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 200
         
@@ -1035,7 +847,7 @@ def debug_leaders():
             chosen_leaders = conn.execute("SELECT id, original_leader_id, reg_number, full_name, position, photo_url, approved_at FROM chosen_leaders").fetchall()
             
             response = jsonify({
-                "database": os.path.abspath("garissa_voting.db"),
+                "database": os.path.abspath(DB_PATH),
                 "pending_leaders": [dict(leader) for leader in pending_leaders],
                 "chosen_leaders": [dict(leader) for leader in chosen_leaders]
             })
@@ -0,0 +1,187 @@
+"""The ballot ledger.
+
+Both vote pipelines record a ballot the same way, through cast_ballot(): one
+row in ballots (who voted, as which voter type, from which school, when)
+and one row per choice in ballot_choices. Application code writes nothing
+else. Everything read back is derived from those rows by triggers, in the
+same statement, so it cannot drift from the ledger:
+
+- tallies: votes per (position, candidate). Student ballots use their
+  position keys (chairperson, ...) and chosen_leaders ids; delegate ballots
+  have one choice under the 'delegate' position with a candidates id.
+- turnout: voters per (ballot kind, school).
+
+tally_adjustments holds votes counted before the ledger without a stored
+ballot (migration 10). They belong to no voter, so they are never ballots:
+recount() and a journal rebuild fold them into tallies on top of the
+ledger's own counts.
+
+The voter ledger is ballots itself. A 'delegate' ballot is what
+voter_records used to hold (a ballot without choices is a voter record
+with no vote, from /api/voter-records/create), and a 'student' ballot is
+the voter's row for /api/votes. One ballot of each kind per voter is a
+unique index, so a repeat insert returns no row.
+"""
+from journal import journal
+
+# Ballot kinds
+STUDENT = "student"
+DELEGATE = "delegate"
+
+# Position a delegate ballot's single choice is recorded under
+DELEGATE_POSITION = "delegate"
+
+LEDGER_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS ballots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        voter_reg_number TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        user_type TEXT,
+        voter_id INTEGER,
+        voter_name TEXT NOT NULL DEFAULT '',
+        voter_school TEXT NOT NULL DEFAULT '',
+        cast_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_ballots_voter ON ballots(voter_reg_number, kind)",
+    # Voter-record listings and the recent-votes statistics
+    "CREATE INDEX IF NOT EXISTS idx_ballots_kind_cast ON ballots(kind, cast_at)",
+    '''
+    CREATE TABLE IF NOT EXISTS ballot_choices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ballot_id INTEGER NOT NULL,
+        position TEXT NOT NULL,
+        candidate_id INTEGER NOT NULL,
+        UNIQUE (ballot_id, position)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS tallies (
+        position TEXT NOT NULL,
+        candidate_id INTEGER NOT NULL,
+        votes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (position, candidate_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS tally_adjustments (
+        position TEXT NOT NULL,
+        candidate_id INTEGER NOT NULL,
+        votes INTEGER NOT NULL,
+        PRIMARY KEY (position, candidate_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS turnout (
+        kind TEXT NOT NULL,
+        school TEXT NOT NULL,
+        voters INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (kind, school)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_ballot_choices_tally_insert
+    AFTER INSERT ON ballot_choices
+    BEGIN
+        INSERT INTO tallies (position, candidate_id, votes) VALUES (NEW.position, NEW.candidate_id, 1)
+        ON CONFLICT(position, candidate_id) DO UPDATE SET votes = votes + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_ballot_choices_tally_delete
+    AFTER DELETE ON ballot_choices
+    BEGIN
+        UPDATE tallies SET votes = votes - 1 WHERE position = OLD.position AND candidate_id = OLD.candidate_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_ballots_turnout_insert
+    AFTER INSERT ON ballots
+    BEGIN
+        INSERT INTO turnout (kind, school, voters) VALUES (NEW.kind, NEW.voter_school, 1)
+        ON CONFLICT(kind, school) DO UPDATE SET voters = voters + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_ballots_turnout_delete
+    AFTER DELETE ON ballots
+    BEGIN
+        UPDATE turnout SET voters = voters - 1 WHERE kind = OLD.kind AND school = OLD.voter_school;
+        DELETE FROM ballot_choices WHERE ballot_id = OLD.id;
+    END
+    ''',
+)
+
+# The ledger and its derived tables, swapped out together by a reset or close
+LEDGER_TABLES = ("ballots", "ballot_choices", "tallies", "tally_adjustments", "turnout")
+
+# Migration 12: a ballot uploaded by an offline polling station keeps the
+# station's id for it, so a re-sent ballot is recognized as the same one
+SYNCED_BALLOT_COLUMNS = (("station_id", "TEXT"), ("client_ballot_id", "TEXT"))
+SYNCED_BALLOT_INDEX = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_ballots_client ON ballots(station_id, client_ballot_id)"
+)
+
+
+def cast_ballot(conn, kind, reg_key, voter_name, user_type, voter_id, school, choices=(),
+                cast_at=None, station_id=None, client_ballot_id=None):
+    """Record one ballot: its ledger row and a row per (position, candidate id) in choices.
+
+    A ballot synced from a polling station passes when it was cast there
+    ("YYYY-MM-DD HH:MM:SS", UTC) and the station's ids for it. Returns the
+    new ballot id, or None when the voter already has a ballot of this kind
+    (or the station already sent this one). Stages the ballot's journal
+    entry; the caller's transaction flushes it before COMMIT.
+    """
+    ballot = conn.execute(
+        '''
+        INSERT INTO ballots (voter_reg_number, kind, user_type, voter_id, voter_name, voter_school, cast_at,
+                             station_id, client_ballot_id)
+        VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?)
+        ON CONFLICT DO NOTHING RETURNING id
+        ''',
+        (reg_key, kind, user_type, voter_id, voter_name or "", school or "", cast_at, station_id, client_ballot_id)
+    ).fetchone()
+    if ballot is None:
+        return None
+    if choices:
+        conn.executemany(
+            "INSERT INTO ballot_choices (ballot_id, position, candidate_id) VALUES (?, ?, ?)",
+            [(ballot[0], position, candidate_id) for position, candidate_id in choices]
+        )
+    journal.stage_ballot(kind, reg_key, voter_name, user_type, voter_id, school, choices,
+                         cast_at, station_id, client_ballot_id)
+    return ballot[0]
+
+
+def fold_adjustments(conn):
+    """Add tally_adjustments on top of the tallies counted from the ledger rows"""
+    conn.execute('''
+        INSERT INTO tallies (position, candidate_id, votes)
+        SELECT position, candidate_id, votes FROM tally_adjustments WHERE true
+        ON CONFLICT(position, candidate_id) DO UPDATE SET votes = votes + excluded.votes
+    ''')
+
+
+def recount(conn):
+    """Recompute tallies and turnout from the ledger rows; returns the number of tally rows"""
+    conn.execute("DELETE FROM tallies")
+    conn.execute('''
+        INSERT INTO tallies (position, candidate_id, votes)
+        SELECT position, candidate_id, COUNT(*) FROM ballot_choices GROUP BY position, candidate_id
+    ''')
+    fold_adjustments(conn)
+    counted = conn.execute("SELECT COUNT(*) FROM tallies").fetchone()[0]
+    conn.execute("DELETE FROM turnout")
+    conn.execute('''
+        INSERT INTO turnout (kind, school, voters)
+        SELECT kind, voter_school, COUNT(*) FROM ballots GROUP BY kind, voter_school
+    ''')
+    return counted
+
+
+__all__ = [
+    'DELEGATE', 'DELEGATE_POSITION', 'LEDGER_SCHEMA', 'LEDGER_TABLES', 'STUDENT', 'SYNCED_BALLOT_COLUMNS',
+    'SYNCED_BALLOT_INDEX', 'cast_ballot', 'fold_adjustments', 'recount',
+]
@@ -1,18 +1,25 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_cors import CORS
+import os
 from student_routes import student_bp
 from delegate_route import delegate_bp
 from admin_route import admin_bp
 from leader_route import leader_bp 
 from vote_route import vote_bp
 from auth_bp import auth_bp
+from election_route import election_bp
+from database import DB_PATH, DatabaseBusy, WRITE_BACKOFF_MAX_MS
+from migrations import check_schema
+from maintenance import start_maintenance
+from backup import start_backups
+from voted import start_registry
 
 app = Flask(__name__)
 
 # Safe CORS configuration - applies to ALL routes
 CORS(app, origins=["http://localhost:5173"], supports_credentials=True)
 
-DATABASE = "garissa_voting.db"
+DATABASE = DB_PATH
 
 # Register Blueprints
 app.register_blueprint(student_bp)
@@ -21,6 +28,35 @@ app.register_blueprint(admin_bp)
 app.register_blueprint(leader_bp) 
 app.register_blueprint(vote_bp) 
 app.register_blueprint(auth_bp)
+app.register_blueprint(election_bp)
+
+# Write lock still held elsewhere after every retry: ask the client to try again
+@app.errorhandler(DatabaseBusy)
+def database_busy(e):
+    print(f"Write gave up waiting for the database lock: {e}")
+    response = jsonify({"error": "The server is busy, please try again"})
+    response.headers["Retry-After"] = str(max(1, round(WRITE_BACKOFF_MAX_MS / 1000)))
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response, 503
+
+# Schema changes are applied with `python migrations.py`, never at startup
+check_schema()
+
+
+def start_background_services():
+    """Background threads of a serving process; a WSGI server calls this once per worker"""
+    # ANALYZE, incremental vacuum and integrity checks during quiet spells
+    start_maintenance()
+
+    # Timestamped online snapshots under BACKUP_DIR while voting runs
+    start_backups()
+
+    # Who has voted, in memory, for the vote-status checks (lookups load it on demand otherwise)
+    start_registry()
+
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    # The debug reloader runs this file twice; only its child process serves requests
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_services()
+    app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,228 @@
+"""Background database maintenance.
+
+A daemon thread waits for a quiet spell (no commits from any process for
+MAINTENANCE_IDLE_SECONDS) and then runs, in small steps that each hold the
+write lock only briefly:
+
+    archive closed elections   ones whose archiving failed at close (elections.py)
+    DROP TABLE retired_*       ballot tables swapped out by a reset or close
+    PRAGMA optimize            statistics for the query planner (bounded by analysis_limit)
+    PRAGMA incremental_vacuum  returns free pages to the filesystem, VACUUM_STEP_PAGES at a time
+    PRAGMA quick_check(table)  one table and its indexes per step, read-only
+
+A run stops early as soon as traffic resumes and picks up on the next quiet
+spell. Run it once by hand with `python maintenance.py`.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from cache import data_versions
+from database import begin_immediate, connect
+from elections import RETIRED_PREFIX, archive_closed_elections
+
+# Configuration
+MAINTENANCE_ENABLED = os.environ.get('DB_MAINTENANCE', '1') != '0'
+MAINTENANCE_INTERVAL = float(os.environ.get('MAINTENANCE_INTERVAL_SECONDS', '900'))
+MAINTENANCE_IDLE_SECONDS = float(os.environ.get('MAINTENANCE_IDLE_SECONDS', '30'))
+VACUUM_STEP_PAGES = int(os.environ.get('MAINTENANCE_VACUUM_STEP_PAGES', '64'))
+ANALYSIS_LIMIT = int(os.environ.get('MAINTENANCE_ANALYSIS_LIMIT', '1000'))
+# Pause between steps; longer than SQLite's busy-handler sleeps within WRITE_ATTEMPT_MS,
+# so a ballot waiting on the lock always gets it before the next step
+STEP_PAUSE_SECONDS = float(os.environ.get('MAINTENANCE_STEP_PAUSE_MS', '50')) / 1000.0
+HISTORY_SIZE = 20
+
+
+class MaintenanceScheduler:
+    def __init__(self, path=None, interval=MAINTENANCE_INTERVAL, idle_seconds=MAINTENANCE_IDLE_SECONDS):
+        self.path = path
+        self.interval = interval
+        self.idle_seconds = idle_seconds
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.running = False
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self._last_version = None
+        self._last_activity = time.monotonic()
+
+    def _poll_activity(self):
+        version = data_versions.current()
+        if version != self._last_version:
+            self._last_version = version
+            self._last_activity = time.monotonic()
+
+    def idle(self):
+        self._poll_activity()
+        return time.monotonic() - self._last_activity >= self.idle_seconds
+
+    def _traffic(self, conn, seen):
+        """Someone else committed since data_version was seen on conn.
+
+        data_version on the maintenance connection ignores its own commits,
+        so only ballots and other writers count.
+        """
+        return conn.execute("PRAGMA data_version").fetchone()[0] != seen
+
+    def _drop_retired(self, conn, force, report):
+        """Drop the retired_* tables in conn's database, one per step"""
+        seen = conn.execute("PRAGMA data_version").fetchone()[0]
+        retired = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name GLOB ? ORDER BY name",
+            (RETIRED_PREFIX + "*",)
+        ).fetchall()]
+        for table in retired:
+            if not force and self._traffic(conn, seen):
+                report["interrupted"] = True
+                return
+            begin_immediate(conn, "maintenance")
+            conn.execute(f'DROP TABLE "{table}"')
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+            conn.execute("COMMIT")
+            report["tables_dropped"].append(table)
+            time.sleep(STEP_PAUSE_SECONDS)
+
+    def run(self, force=False):
+        """One maintenance pass; returns its report. force keeps going through traffic."""
+        with self._run_lock:
+            self.running = True
+            try:
+                report = self._run(force)
+            finally:
+                self.running = False
+                # Our own commits moved the shared watcher; they are not traffic
+                self._last_version = data_versions.current()
+        self.history.appendleft(report)
+        print(f"Maintenance: reclaimed {report['bytes_reclaimed']} bytes, "
+              f"checked {report['tables_checked']} tables in {report['duration_ms']} ms"
+              f"{' (stopped early: traffic)' if report['interrupted'] else ''}")
+        return report
+
+    def _run(self, force):
+        start = time.monotonic()
+        conn = connect(self.path)
+        conn.isolation_level = None
+        report = {
+            "started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "elections_archived": [],
+            "tables_dropped": [],
+            "optimized": False,
+            "pages_freed": 0,
+            "bytes_reclaimed": 0,
+            "tables_checked": 0,
+            "integrity": "not checked",
+            "problems": [],
+            "interrupted": False,
+        }
+        try:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            size_before = conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+            seen = conn.execute("PRAGMA data_version").fetchone()[0]
+
+            # Closed elections still without an archive; each failure is logged and retried next pass
+            report["elections_archived"] = archive_closed_elections()
+
+            # Ballot tables retired by a reset or close; dropping them frees their pages for the vacuum below
+            self._drop_retired(conn, force, report)
+
+            # Planner statistics; analysis_limit keeps ANALYZE to a sample per index
+            if not report["interrupted"]:
+                conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+                begin_immediate(conn, "maintenance")
+                has_stats = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name='sqlite_stat1'"
+                ).fetchone()
+                conn.execute("PRAGMA optimize" if has_stats else "ANALYZE")
+                conn.execute("COMMIT")
+                report["optimized"] = True
+                time.sleep(STEP_PAUSE_SECONDS)
+
+            # Free pages, a few at a time; needs auto_vacuum=INCREMENTAL (migration 6)
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                while not report["interrupted"] and conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+                    if not force and self._traffic(conn, seen):
+                        report["interrupted"] = True
+                        break
+                    begin_immediate(conn, "maintenance")
+                    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                    # The module steps a PRAGMA once, and each step of incremental_vacuum frees one page
+                    for _ in range(min(before, VACUUM_STEP_PAGES)):
+                        conn.execute("PRAGMA incremental_vacuum(1)")
+                    report["pages_freed"] += before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+                    conn.execute("COMMIT")
+                    time.sleep(STEP_PAUSE_SECONDS)
+
+            # Integrity, table by table; a read transaction never blocks writers in WAL mode
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            ).fetchall()]
+            for table in tables:
+                if report["interrupted"] or (not force and self._traffic(conn, seen)):
+                    report["interrupted"] = True
+                    break
+                result = [row[0] for row in conn.execute(f'PRAGMA quick_check("{table}")').fetchall()]
+                if result != ["ok"]:
+                    report["problems"].extend(f"{table}: {line}" for line in result)
+                report["tables_checked"] += 1
+                time.sleep(STEP_PAUSE_SECONDS)
+
+            if report["problems"]:
+                report["integrity"] = "problems found"
+            elif report["tables_checked"]:
+                report["integrity"] = "ok" if report["tables_checked"] == len(tables) else "ok so far"
+
+            size_after = conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+            report["bytes_reclaimed"] = size_before - size_after
+        except sqlite3.Error as e:
+            report["problems"].append(f"maintenance error: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        finally:
+            conn.close()
+        report["duration_ms"] = round((time.monotonic() - start) * 1000, 1)
+        return report
+
+    def _loop(self):
+        next_run = time.monotonic() + self.interval
+        while True:
+            time.sleep(1)
+            self._poll_activity()
+            if time.monotonic() >= next_run and self.idle():
+                try:
+                    self.run()
+                except Exception as e:
+                    print(f"Maintenance run failed: {e}")
+                next_run = time.monotonic() + self.interval
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="db-maintenance", daemon=True)
+            self._thread.start()
+
+    def status(self):
+        return {
+            "enabled": MAINTENANCE_ENABLED,
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "idle_seconds": self.idle_seconds,
+            "last_run": self.history[0] if self.history else None,
+            "history": list(self.history),
+        }
+
+
+scheduler = MaintenanceScheduler()
+
+
+def start_maintenance():
+    if MAINTENANCE_ENABLED:
+        scheduler.start()
+
+
+__all__ = ['MaintenanceScheduler', 'scheduler', 'start_maintenance']
+
+
+if __name__ == "__main__":
+    report = scheduler.run(force=True)
+    for problem in report["problems"]:
+        print(f"  {problem}")
@@ -0,0 +1,746 @@
+"""Versioned schema migrations.
+
+The app never runs DDL at startup. Apply pending migrations explicitly:
+
+    python migrations.py            # apply everything pending
+    python migrations.py --status   # list applied and pending versions
+    python migrations.py --db other.db
+    python migrations.py --to 9     # stop after version 9 (benchmarks compare old schemas)
+"""
+import argparse
+import sqlite3
+
+from werkzeug.security import generate_password_hash
+
+import database
+from identity import (
+    BALLOT_UNIQUE_INDEXES, REG_KEY_COLUMNS, STUDENT_BALLOT_CLAIMS, VOTER_SOURCES, reg_key_declaration, reg_key_sql,
+)
+from ledger import LEDGER_SCHEMA, SYNCED_BALLOT_COLUMNS, SYNCED_BALLOT_INDEX, fold_adjustments
+from positions import DEFAULT_POSITIONS, POSITIONS_SCHEMA, normalize_position_name
+
+MIGRATIONS = []
+
+
+def migration(version, name, transactional=True):
+    """Register a migration; versions must be unique and are applied in order.
+
+    Non-transactional migrations (e.g. VACUUM) run outside BEGIN/COMMIT and
+    must be safe to re-run if interrupted.
+    """
+    def register(fn):
+        if any(existing[0] == version for existing in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        fn.transactional = transactional
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return fn
+    return register
+
+
+def table_columns(conn, table):
+    # table_xinfo also lists generated columns
+    return [row[1] for row in conn.execute(f"PRAGMA table_xinfo({table})").fetchall()]
+
+
+def add_column(conn, table, column, declaration):
+    """Add a column unless an older database already has it"""
+    if column not in table_columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def remove_duplicate_votes(conn):
+    """Delete every vote BALLOT_UNIQUE_INDEXES would reject, keeping each voter's first, and take
+    the deleted votes back out of vote_results and candidates.votes; returns how many went.
+    """
+    conn.execute("DROP TABLE IF EXISTS temp.duplicate_votes")
+    conn.execute('''
+        CREATE TEMP TABLE duplicate_votes AS
+        SELECT id, candidate_id, position, voter_reg_number FROM votes v
+        WHERE (voter_reg_number != '' AND EXISTS (
+                  SELECT 1 FROM votes f
+                  WHERE f.voter_reg_number = v.voter_reg_number AND f.position = v.position AND f.id < v.id))
+           OR (user_type IS NOT NULL AND EXISTS (
+                  SELECT 1 FROM votes f WHERE f.user_type = v.user_type AND f.voter_id = v.voter_id AND f.id < v.id))
+    ''')
+    removed = conn.execute("SELECT COUNT(*) FROM temp.duplicate_votes").fetchone()[0]
+    if removed:
+        conn.execute('''
+            UPDATE vote_results SET votes = MAX(votes - (
+                SELECT COUNT(*) FROM temp.duplicate_votes d JOIN chosen_leaders c ON c.id = d.candidate_id
+                WHERE d.voter_reg_number != '' AND d.position = vote_results.position
+                  AND c.reg_number = vote_results.candidate_reg_number
+            ), 0)
+        ''')
+        conn.execute('''
+            UPDATE candidates SET votes = MAX(COALESCE(votes, 0) - (
+                SELECT COUNT(*) FROM temp.duplicate_votes d
+                WHERE d.voter_reg_number = '' AND d.candidate_id = candidates.id
+            ), 0)
+            WHERE id IN (SELECT candidate_id FROM temp.duplicate_votes WHERE voter_reg_number = '')
+        ''')
+        conn.execute("DELETE FROM votes WHERE id IN (SELECT id FROM temp.duplicate_votes)")
+    conn.execute("DROP TABLE temp.duplicate_votes")
+    return removed
+
+
+def convert_legacy_ballots(conn):
+    """Copy the pre-ledger votes and voter_records rows into the ballot ledger; returns (ballots, choices).
+
+    Student votes become one 'student' ballot per registration number with a
+    choice per position. Delegate votes only stored the voter's id, and its
+    type once the column existed, so their registration number comes from
+    that voter's row. A vote without a type is matched the way the baseline
+    resolved it: students first, then delegates, then chosen leaders. They
+    become 'delegate' ballots, as does every voter record. The first row wins
+    wherever the old tables held repeats. The ledger's triggers count
+    tallies and turnout from the copied rows, so vote_results is recomputed,
+    not carried over; migration 10 then checks the delegate tallies against
+    candidates.votes (reconcile_delegate_tallies).
+    """
+    before = conn.execute("SELECT COUNT(*) FROM ballots").fetchone()[0]
+    conn.execute('''
+        INSERT OR IGNORE INTO ballots (voter_reg_number, kind, voter_school, cast_at)
+        SELECT voter_reg_number, 'student', voter_school, MIN(voted_at) FROM votes
+        WHERE voter_reg_number != '' AND position IS NOT NULL
+        GROUP BY voter_reg_number
+    ''')
+    conn.execute('''
+        UPDATE ballots SET user_type = voter.voter_type, voter_id = voter.voter_id, voter_name = voter.full_name
+        FROM (SELECT reg_key, voter_type, voter_id, full_name, MIN(priority) FROM voter_identities
+              WHERE eligible = 1 GROUP BY reg_key) AS voter
+        WHERE ballots.kind = 'student' AND voter.reg_key = ballots.voter_reg_number
+    ''')
+
+    conn.execute("DROP TABLE IF EXISTS temp.legacy_delegate_votes")
+    conn.execute('''
+        CREATE TEMP TABLE legacy_delegate_votes AS
+        SELECT id, user_type, voter_id, candidate_id, voted_at, NULL AS reg_key, '' AS full_name, '' AS school
+        FROM votes WHERE voter_reg_number = '' AND (user_type IS NOT NULL OR position IS NULL)
+    ''')
+    for table, voter_type, school, _ in VOTER_SOURCES:
+        conn.execute(f'''
+            UPDATE temp.legacy_delegate_votes SET reg_key = voter.reg_key, full_name = voter.full_name,
+                                                  school = COALESCE(voter.{school}, ''), user_type = '{voter_type}'
+            FROM {table} AS voter
+            WHERE (legacy_delegate_votes.user_type = '{voter_type}'
+                   OR (legacy_delegate_votes.user_type IS NULL AND legacy_delegate_votes.reg_key IS NULL))
+              AND voter.id = legacy_delegate_votes.voter_id
+        ''')
+    # Voters since removed from every roll still hold their one ballot
+    conn.execute('''
+        UPDATE temp.legacy_delegate_votes SET reg_key = COALESCE(user_type, 'voter') || '#' || voter_id
+        WHERE reg_key IS NULL
+    ''')
+    record_key = reg_key_sql("r.registration_number")
+    conn.execute(f'''
+        INSERT OR IGNORE INTO ballots (voter_reg_number, kind, user_type, voter_id, voter_name, voter_school, cast_at)
+        SELECT {record_key}, 'delegate', d.user_type, d.voter_id, r.full_name, COALESCE(d.school, ''), r.vote_time
+        FROM voter_records r LEFT JOIN temp.legacy_delegate_votes d ON d.reg_key = {record_key}
+        ORDER BY r.id
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO ballots (voter_reg_number, kind, user_type, voter_id, voter_name, voter_school, cast_at)
+        SELECT reg_key, 'delegate', user_type, voter_id, full_name, school, voted_at
+        FROM temp.legacy_delegate_votes ORDER BY id
+    ''')
+
+    conn.execute('''
+        INSERT OR IGNORE INTO ballot_choices (ballot_id, position, candidate_id)
+        SELECT b.id, v.position, v.candidate_id FROM votes v
+        JOIN ballots b ON b.voter_reg_number = v.voter_reg_number AND b.kind = 'student'
+        WHERE v.voter_reg_number != '' AND v.position IS NOT NULL
+        ORDER BY v.id
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO ballot_choices (ballot_id, position, candidate_id)
+        SELECT b.id, 'delegate', d.candidate_id FROM temp.legacy_delegate_votes d
+        JOIN ballots b ON b.voter_reg_number = d.reg_key AND b.kind = 'delegate'
+        ORDER BY d.id
+    ''')
+    conn.execute("DROP TABLE temp.legacy_delegate_votes")
+    ballots = conn.execute("SELECT COUNT(*) FROM ballots").fetchone()[0] - before
+    choices = conn.execute("SELECT COUNT(*) FROM ballot_choices").fetchone()[0]
+    return ballots, choices
+
+
+def reconcile_delegate_tallies(conn):
+    """Check the ledger's delegate tallies against candidates.votes before that column goes; returns the votes kept.
+
+    The baseline could count a delegate vote in candidates.votes without
+    storing its row, so a candidate may have more votes than converted
+    ballots. The difference is kept as the candidate's tally_adjustments row
+    and folded into tallies, so totals and ranking survive the move without
+    inventing voters. Any other difference (more ballots than counted votes)
+    aborts the migration.
+    """
+    conn.execute('''
+        INSERT INTO tally_adjustments (position, candidate_id, votes)
+        SELECT 'delegate', c.id, COALESCE(c.votes, 0) - COALESCE(t.votes, 0) FROM candidates c
+        LEFT JOIN tallies t ON t.position = 'delegate' AND t.candidate_id = c.id
+        WHERE COALESCE(c.votes, 0) > COALESCE(t.votes, 0)
+    ''')
+    added = conn.execute("SELECT COALESCE(SUM(votes), 0) FROM tally_adjustments").fetchone()[0]
+    fold_adjustments(conn)
+    mismatched = conn.execute('''
+        SELECT c.id, COALESCE(c.votes, 0), COALESCE(t.votes, 0) FROM candidates c
+        LEFT JOIN tallies t ON t.position = 'delegate' AND t.candidate_id = c.id
+        WHERE COALESCE(c.votes, 0) != COALESCE(t.votes, 0)
+    ''').fetchall()
+    if mismatched:
+        details = ", ".join(f"candidate {cid}: {counted} counted, {tallied} ballots" for cid, counted, tallied in mismatched)
+        raise RuntimeError(f"Delegate ballots do not match candidates.votes ({details}); fix the votes table first")
+    return added
+
+
+def applied_versions(conn):
+    has_table = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='schema_version'"
+    ).fetchone()
+    if not has_table:
+        return set()
+    return {row[0] for row in conn.execute("SELECT version FROM schema_version").fetchall()}
+
+
+def pending_migrations(conn, until=None):
+    done = applied_versions(conn)
+    return [item for item in MIGRATIONS if item[0] not in done and (until is None or item[0] <= until)]
+
+
+def migrate(conn, until=None):
+    """Apply every pending migration (up to version until), each in its own transaction unless registered without one"""
+    conn.isolation_level = None
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    applied = []
+    for version, name, fn in pending_migrations(conn, until):
+        if not fn.transactional:
+            fn(conn)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            print(f"Applied migration {version}: {name}")
+            applied.append(version)
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            fn(conn)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"Applied migration {version}: {name}")
+        applied.append(version)
+    return applied
+
+
+# ------------------ MIGRATIONS ------------------
+
+@migration(1, "baseline schema")
+def baseline(conn):
+    """Everything the blueprints used to create at import time, reconciled into one schema"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS students (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            email_or_phone TEXT NOT NULL,
+            registration_number TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            is_delegate BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS delegates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            public_id TEXT UNIQUE,
+            full_name TEXT NOT NULL,
+            email TEXT,
+            phone TEXT,
+            registration_number TEXT UNIQUE NOT NULL,
+            faculty TEXT,
+            year_of_study INTEGER,
+            password TEXT NOT NULL,
+            is_verified BOOLEAN DEFAULT FALSE,
+            is_approved BOOLEAN DEFAULT FALSE,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # admin_route and delegate_route each declared candidates; this is the shape both insert into
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS candidates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            delegate_id INTEGER UNIQUE,
+            faculty TEXT NOT NULL,
+            full_name TEXT NOT NULL,
+            registration_number TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            position TEXT DEFAULT 'Delegate',
+            votes INTEGER DEFAULT 0,
+            FOREIGN KEY (delegate_id) REFERENCES delegates (id) ON DELETE CASCADE
+        )
+    ''')
+    add_column(conn, "candidates", "position", "TEXT DEFAULT 'Delegate'")
+    add_column(conn, "candidates", "votes", "INTEGER DEFAULT 0")
+
+    # Both vote pipelines share this table: vote_route fills the reg number, school and
+    # position columns, delegate_route fills user_type
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS votes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            voter_id INTEGER NOT NULL,
+            candidate_id INTEGER NOT NULL,
+            voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            voter_reg_number TEXT NOT NULL DEFAULT '',
+            voter_school TEXT NOT NULL DEFAULT '',
+            position TEXT,
+            user_type TEXT
+        )
+    ''')
+    add_column(conn, "votes", "voter_reg_number", "TEXT NOT NULL DEFAULT ''")
+    add_column(conn, "votes", "voter_school", "TEXT NOT NULL DEFAULT ''")
+    add_column(conn, "votes", "position", "TEXT")
+    add_column(conn, "votes", "user_type", "TEXT")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vote_results (
+            position TEXT NOT NULL,
+            candidate_reg_number TEXT NOT NULL,
+            candidate_name TEXT NOT NULL,
+            votes INTEGER DEFAULT 0,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (position, candidate_reg_number)
+        )
+    ''')
+
+    # student_routes and delegate_route both declared voter_records identically
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS voter_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            registration_number TEXT UNIQUE NOT NULL,
+            vote_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_voter_records_reg_number ON voter_records(registration_number)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_voter_records_time ON voter_records(vote_time)')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS admins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute(
+        "INSERT INTO admins (username, password) SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM admins WHERE username = ?)",
+        ("admin", generate_password_hash("admin123"), "admin")
+    )
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            registration_number TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            user_type TEXT NOT NULL,
+            full_name TEXT,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    for reg_number, password, user_type, full_name in (
+        ("admin001", "admin123", "admin", "System Administrator"),
+        ("student001", "student123", "student", "John Student"),
+    ):
+        conn.execute(
+            "INSERT OR IGNORE INTO users (registration_number, password_hash, user_type, full_name) VALUES (?, ?, ?, ?)",
+            (reg_number, generate_password_hash(password), user_type, full_name)
+        )
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS leaders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            reg_number TEXT UNIQUE NOT NULL,
+            school TEXT,
+            position TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            email TEXT,
+            year_of_study TEXT,
+            photo_url TEXT,
+            password TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            is_approved BOOLEAN DEFAULT FALSE,
+            is_admin BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    add_column(conn, "leaders", "status", "TEXT DEFAULT 'pending'")
+    add_column(conn, "leaders", "photo", "BLOB")
+    add_column(conn, "leaders", "photo_filename", "TEXT")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chosen_leaders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            original_leader_id INTEGER NOT NULL,
+            full_name TEXT NOT NULL,
+            reg_number TEXT UNIQUE NOT NULL,
+            school TEXT,
+            position TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            email TEXT,
+            year_of_study TEXT,
+            photo_url TEXT,
+            password TEXT NOT NULL,
+            is_admin BOOLEAN DEFAULT FALSE,
+            approved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (original_leader_id) REFERENCES leaders (id)
+        )
+    ''')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_leaders_reg_number ON leaders(reg_number)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_leaders_email ON leaders(email)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_leaders_status ON leaders(status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_leaders_is_approved ON leaders(is_approved)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_chosen_leaders_reg_number ON chosen_leaders(reg_number)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_chosen_leaders_email ON chosen_leaders(email)')
+
+    # One-off clean up of position name variations (registration normalizes new rows)
+    for table in ("leaders", "chosen_leaders"):
+        conn.execute(
+            f"UPDATE {table} SET position = ? WHERE position LIKE ?",
+            ('Sports and Entertainment Director', '%Sport%Entertainment%Director%')
+        )
+
+
+@migration(2, "indexes for every blueprint query")
+def query_indexes(conn):
+    """Index seeks or index-ordered scans for every statement query_plans.py checks"""
+    statements = (
+        # delegates: pending lists filter on is_approved, listings sort by created_at
+        "CREATE INDEX IF NOT EXISTS idx_delegates_approved_created ON delegates(is_approved, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_delegates_created_at ON delegates(created_at)",
+        # candidates: admin listing, ballot ordering and the results ordering expression
+        "CREATE INDEX IF NOT EXISTS idx_candidates_faculty_name ON candidates(faculty, full_name)",
+        "CREATE INDEX IF NOT EXISTS idx_candidates_votes ON candidates(votes)",
+        "CREATE INDEX IF NOT EXISTS idx_candidates_votes_coalesce ON candidates(COALESCE(votes, 0))",
+        # votes: duplicate checks, recounts, status checks and per-school / per-type tallies
+        "CREATE INDEX IF NOT EXISTS idx_votes_voter ON votes(voter_id, user_type)",
+        "CREATE INDEX IF NOT EXISTS idx_votes_candidate ON votes(candidate_id)",
+        "CREATE INDEX IF NOT EXISTS idx_votes_reg_voted ON votes(voter_reg_number, voted_at)",
+        "CREATE INDEX IF NOT EXISTS idx_votes_school_reg ON votes(voter_school, voter_reg_number)",
+        "CREATE INDEX IF NOT EXISTS idx_votes_user_type ON votes(user_type)",
+        "CREATE INDEX IF NOT EXISTS idx_vote_results_position_votes ON vote_results(position, votes)",
+        # leaders and chosen_leaders
+        "CREATE INDEX IF NOT EXISTS idx_leaders_created_at ON leaders(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_leaders_approved_created ON leaders(is_approved, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_chosen_leaders_original ON chosen_leaders(original_leader_id)",
+        "CREATE INDEX IF NOT EXISTS idx_chosen_leaders_approved_at ON chosen_leaders(approved_at)",
+        "CREATE INDEX IF NOT EXISTS idx_chosen_leaders_position_name ON chosen_leaders(position, full_name)",
+        # Logins compare registration numbers with COLLATE NOCASE
+        "CREATE INDEX IF NOT EXISTS idx_students_reg_nocase ON students(registration_number COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_leaders_reg_nocase ON leaders(reg_number COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_chosen_leaders_reg_nocase ON chosen_leaders(reg_number COLLATE NOCASE)",
+    )
+    for statement in statements:
+        conn.execute(statement)
+
+    # Redundant with a UNIQUE constraint or a wider index above; each one costs every write
+    for index in (
+        "idx_delegates_reg", "idx_delegates_approved", "idx_leaders_reg_number", "idx_leaders_approved",
+        "idx_leaders_is_approved", "idx_chosen_leaders_reg_number", "idx_chosen_leaders_position",
+        "idx_voter_records_reg_number", "idx_votes_reg_number", "idx_votes_school", "idx_vote_results_position",
+    ):
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+
+
+@migration(3, "per-table version counters")
+def table_versions(conn):
+    """Triggers bump table_versions on every write so caches can tell which tables changed"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    for table in (
+        "admins", "users", "students", "delegates", "candidates", "votes",
+        "vote_results", "voter_records", "leaders", "chosen_leaders",
+    ):
+        conn.execute("INSERT OR IGNORE INTO table_versions (table_name) VALUES (?)", (table,))
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';
+                END
+            ''')
+
+
+@migration(4, "elections registry")
+def elections_registry(conn):
+    """One row per election; the open one owns the hot ballot tables, closed ones live in archives"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS elections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'active',
+            opened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            closed_at TIMESTAMP,
+            archive_file TEXT,
+            voters INTEGER,
+            archive_bytes INTEGER
+        )
+    ''')
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_elections_active ON elections(status) WHERE status = 'active'")
+    conn.execute(
+        "INSERT INTO elections (name) SELECT 'Election 1' WHERE NOT EXISTS (SELECT 1 FROM elections WHERE status = 'active')"
+    )
+
+
+
+@migration(5, "drop unused tables")
+def drop_unused_tables(conn):
+    """Leftovers no blueprint reads or writes; they only cost pages and checks"""
+    for table in ("delegates_temp", "vote_summary", "vote_records", "leader_votes"):
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+@migration(6, "incremental auto-vacuum", transactional=False)
+def incremental_auto_vacuum(conn):
+    """Let maintenance.py return free pages in small incremental_vacuum steps.
+
+    Switching auto_vacuum on an existing file needs one full VACUUM.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+@migration(7, "registration-number keys")
+def registration_number_keys(conn):
+    """Canonical reg_key on every identity table, unique-indexed, replacing the NOCASE indexes.
+
+    Stops with the offending numbers if two rows of a table only differ in
+    case or spacing; merge those by hand and re-run.
+    """
+    for table, column in REG_KEY_COLUMNS:
+        duplicates = conn.execute(
+            f"SELECT {reg_key_sql(column)} AS reg_key, COUNT(*) FROM {table} GROUP BY reg_key HAVING COUNT(*) > 1"
+        ).fetchall()
+        if duplicates:
+            numbers = ", ".join(row[0] for row in duplicates)
+            raise RuntimeError(f"{table} has registration numbers that differ only in case or spacing: {numbers}")
+        add_column(conn, table, "reg_key", reg_key_declaration(column))
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_reg_key ON {table}(reg_key)")
+    for index in ("idx_students_reg_nocase", "idx_leaders_reg_nocase", "idx_chosen_leaders_reg_nocase"):
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+    # Ballots store the voter's number canonicalized from now on; bring older ones in line
+    conn.execute(
+        f"UPDATE votes SET voter_reg_number = {reg_key_sql('voter_reg_number')} "
+        f"WHERE voter_reg_number != {reg_key_sql('voter_reg_number')}"
+    )
+
+
+@migration(8, "voter identity index")
+def voter_identity_index(conn):
+    """One row per (registration key, voter type), maintained by triggers on the source tables"""
+    # Older copies of the database carry students.faculty; databases built from migration 1 lack it
+    add_column(conn, "students", "faculty", "TEXT")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS voter_identities (
+            reg_key TEXT NOT NULL,
+            priority INTEGER NOT NULL,
+            voter_type TEXT NOT NULL,
+            voter_id INTEGER NOT NULL,
+            full_name TEXT NOT NULL,
+            school TEXT,
+            eligible INTEGER NOT NULL,
+            PRIMARY KEY (reg_key, priority)
+        ) WITHOUT ROWID
+    ''')
+    for priority, (table, voter_type, school, eligible) in enumerate(VOTER_SOURCES):
+        new_eligible = eligible.replace("is_approved", "NEW.is_approved")
+        upsert = (
+            "INSERT OR REPLACE INTO voter_identities (reg_key, priority, voter_type, voter_id, full_name, school, eligible) "
+            f"VALUES (NEW.reg_key, {priority}, '{voter_type}', NEW.id, NEW.full_name, NEW.{school}, {new_eligible});"
+        )
+        remove = f"DELETE FROM voter_identities WHERE reg_key = OLD.reg_key AND priority = {priority};"
+        # Only the columns copied into voter_identities; password or tally updates leave it alone
+        watched = [dict(REG_KEY_COLUMNS)[table], "full_name", school]
+        if "is_approved" in eligible:
+            watched.append("is_approved")
+        for event, name, body in (
+            ("INSERT", "insert", [upsert]),
+            (f"UPDATE OF {', '.join(watched)}", "update", [remove, upsert]),
+            ("DELETE", "delete", [remove]),
+        ):
+            statements = "\n                    ".join(body)
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_identity_{name}
+                AFTER {event} ON {table}
+                BEGIN
+                    {statements}
+                END
+            ''')
+        conn.execute(f'''
+            INSERT OR REPLACE INTO voter_identities
+                (reg_key, priority, voter_type, voter_id, full_name, school, eligible)
+            SELECT reg_key, {priority}, '{voter_type}', id, full_name, {school}, {eligible} FROM {table}
+        ''')
+
+
+@migration(9, "one vote per voter")
+def one_vote_per_voter(conn):
+    """Unique indexes and student-ballot claims behind ON CONFLICT DO NOTHING ballots.
+
+    Repeat votes already stored are removed first. Every student who has
+    voted gets their claim, so a later ballot naming other positions is
+    turned away too.
+    """
+    removed = remove_duplicate_votes(conn)
+    if removed:
+        print(f"Removed {removed} duplicate votes")
+    for statement in BALLOT_UNIQUE_INDEXES:
+        conn.execute(statement)
+    conn.execute(STUDENT_BALLOT_CLAIMS)
+    conn.execute('''
+        INSERT OR IGNORE INTO student_ballots (voter_reg_number, voted_at)
+        SELECT voter_reg_number, MIN(voted_at) FROM votes
+        WHERE voter_reg_number != '' AND position IS NOT NULL
+        GROUP BY voter_reg_number
+    ''')
+
+
+@migration(10, "single ballot ledger")
+def single_ballot_ledger(conn):
+    """One ledger both vote pipelines write to (ledger.py), with tallies and turnout kept by its triggers.
+
+    Replaces votes, vote_results, voter_records, student_ballots and
+    candidates.votes. The other unused ballot tables (vote_summary,
+    vote_records, leader_votes) already went in migration 5.
+    """
+    for statement in LEDGER_SCHEMA:
+        conn.execute(statement)
+    ballots, choices = convert_legacy_ballots(conn)
+    if ballots:
+        print(f"Moved {ballots} ballots ({choices} choices) into the ballot ledger")
+    for table in ("votes", "vote_results", "voter_records", "student_ballots"):
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute("DELETE FROM table_versions WHERE table_name = ?", (table,))
+
+    # Caches that show counts watch the ledger; the derived tables change in the same statements
+    conn.execute("INSERT OR IGNORE INTO table_versions (table_name) VALUES ('ballots')")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_ballots_version_{event.lower()}
+            AFTER {event} ON ballots
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE table_name = 'ballots';
+            END
+        ''')
+
+    for index in ("idx_candidates_votes", "idx_candidates_votes_coalesce"):
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+    if "votes" in table_columns(conn, "candidates"):
+        unrecorded = reconcile_delegate_tallies(conn)
+        if unrecorded:
+            print(f"Kept {unrecorded} delegate votes counted in candidates.votes without a stored vote as tally adjustments")
+        conn.execute("ALTER TABLE candidates DROP COLUMN votes")
+
+
+@migration(11, "student ballot positions registry")
+def positions_registry(conn):
+    """The positions table (positions.py), seeded with the seven student-ballot positions.
+
+    Leaders and chosen leaders registered before positions were normalized on
+    every write keep free-text names ("WellFair Director", "treasurer"); they
+    are rewritten to the registry's display names so the ballot definition
+    can match them exactly.
+    """
+    for statement in POSITIONS_SCHEMA:
+        conn.execute(statement)
+    conn.executemany(
+        "INSERT OR IGNORE INTO positions (key, display_name, ordering, eligibility) VALUES (?, ?, ?, ?)",
+        DEFAULT_POSITIONS,
+    )
+    conn.execute("INSERT OR IGNORE INTO table_versions (table_name) VALUES ('positions')")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_positions_version_{event.lower()}
+            AFTER {event} ON positions
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE table_name = 'positions';
+            END
+        ''')
+
+    registry = conn.execute("SELECT key, display_name FROM positions").fetchall()
+    renamed = 0
+    for table in ("leaders", "chosen_leaders"):
+        for (position,) in conn.execute(f"SELECT DISTINCT position FROM {table}").fetchall():
+            normalized = normalize_position_name(position, registry)
+            if normalized != position:
+                renamed += conn.execute(
+                    f"UPDATE {table} SET position = ? WHERE position = ?", (normalized, position)
+                ).rowcount
+    if renamed:
+        print(f"Normalized the position of {renamed} leaders")
+
+
+@migration(12, "offline ballot ids")
+def offline_ballot_ids(conn):
+    """Store a synced ballot's station and client_ballot_id, so a re-sent ballot is answered as accepted"""
+    for column, declaration in SYNCED_BALLOT_COLUMNS:
+        add_column(conn, "ballots", column, declaration)
+    conn.execute(SYNCED_BALLOT_INDEX)
+
+
+def check_schema(path=None):
+    """Warn at startup when the database is behind; never changes the schema"""
+    conn = sqlite3.connect(path or database.DB_PATH)
+    try:
+        pending = pending_migrations(conn)
+    finally:
+        conn.close()
+    if pending:
+        versions = ", ".join(str(item[0]) for item in pending)
+        print(f"WARNING: database has pending migrations ({versions}); run `python migrations.py`")
+    return pending
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations")
+    parser.add_argument("--db", default=None, help="database file (defaults to DATABASE_PATH)")
+    parser.add_argument("--status", action="store_true", help="list migrations without applying them")
+    parser.add_argument("--to", type=int, default=None, metavar="VERSION", help="apply migrations up to VERSION only")
+    args = parser.parse_args()
+
+    conn = database.connect(args.db)
+    try:
+        if args.status:
+            done = applied_versions(conn)
+            for version, name, _ in MIGRATIONS:
+                print(f"{version:>4}  {'applied' if version in done else 'pending':<8} {name}")
+            return
+
+        applied = migrate(conn, args.to)
+        if not applied:
+            print("Database schema is up to date")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
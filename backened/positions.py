@@ -0,0 +1,186 @@
+"""Student-ballot positions and the ballot definition built from them.
+
+The positions table (migration 11) is the one vocabulary for a student
+ballot: each row has the key a ballot field and the tallies use
+(chairperson, vice_chair, ...), the display name stored on leaders and
+chosen_leaders ("ChairPerson", "Vice ChairPerson", ...), its place on the
+ballot and who may vote for it ('all', or one school's voters).
+
+Free-text positions are normalized once, on write, to a registry display
+name (normalize_position_name), so every reader can compare positions
+exactly. The ballot definition joins the registry with chosen_leaders:
+
+    definition = ballot_definition()
+    for position in definition.positions:          # in ballot order
+        definition.candidates[position.key]         # chosen leaders standing for it
+
+It is cached through the query cache and rebuilt only after positions or
+chosen_leaders change; its version is the sum of those tables' counters.
+A ballot naming no candidate at all is only valid when the definition
+allows_blank (ALLOW_BLANK_BALLOTS=1).
+"""
+import os
+import re
+
+from cache import query_cache
+from database import get_db_connection
+from identity import normalize_reg_number
+from queries import BALLOT_CANDIDATES, BALLOT_POSITIONS
+
+# Configuration
+# Whether a voter may abstain from every position and still cast a (blank) ballot
+ALLOW_BLANK_BALLOTS = os.environ.get('ALLOW_BLANK_BALLOTS', '0') == '1'
+
+# Eligibility of a position every voter's ballot carries
+ALL_VOTERS = "all"
+
+POSITIONS_SCHEMA = (
+    f'''
+    CREATE TABLE IF NOT EXISTS positions (
+        key TEXT PRIMARY KEY,
+        display_name TEXT NOT NULL UNIQUE,
+        ordering INTEGER NOT NULL,
+        eligibility TEXT NOT NULL DEFAULT '{ALL_VOTERS}'
+    ) WITHOUT ROWID
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_positions_ordering ON positions(ordering)",
+)
+
+# (key, display name, ordering, eligibility) seeded by migration 11
+DEFAULT_POSITIONS = (
+    ("chairperson", "ChairPerson", 1, ALL_VOTERS),
+    ("vice_chair", "Vice ChairPerson", 2, ALL_VOTERS),
+    ("secretary", "Secretary General", 3, ALL_VOTERS),
+    ("treasurer", "Finance Secretary", 4, ALL_VOTERS),
+    ("academic", "Academic Director", 5, ALL_VOTERS),
+    ("welfare", "Welfare Director", 6, ALL_VOTERS),
+    ("sports", "Sports and Entertainment Director", 7, ALL_VOTERS),
+)
+
+# Other spellings seen in registrations, by position key
+POSITION_ALIASES = {
+    "chair": "chairperson",
+    "chairman": "chairperson",
+    "vice chair": "vice_chair",
+    "vice chairman": "vice_chair",
+    "deputy chairperson": "vice_chair",
+    "secretary": "secretary",
+    "general secretary": "secretary",
+    "treasurer": "treasurer",
+    "finance": "treasurer",
+    "academic": "academic",
+    "academics": "academic",
+    "welfare": "welfare",
+    "wellfair": "welfare",
+    "wellfare": "welfare",
+    "sports": "sports",
+    "entertainment": "sports",
+}
+
+_SEPARATORS = re.compile(r"[^a-z0-9]+")
+
+
+def _phrase(value):
+    """Lower case words separated by single spaces"""
+    return _SEPARATORS.sub(" ", str(value).lower()).strip()
+
+
+def normalize_position_name(position, registry=None):
+    """Registry display name for a free-text position, or the stripped text when none matches.
+
+    registry is (key, display_name) pairs; the cached registry by default.
+    An exact key, display name or alias wins; otherwise the longest of them
+    found inside the text, so "Vice Chairperson" is never read as
+    "Chairperson".
+    """
+    if not position:
+        return position
+    if registry is None:
+        registry = [(entry.key, entry.display_name) for entry in ballot_definition().positions]
+    names = dict(registry)
+    phrases = dict(POSITION_ALIASES)
+    for key, display_name in registry:
+        phrases[_phrase(key)] = key
+        phrases[_phrase(display_name)] = key
+
+    text = _phrase(position)
+    key = phrases.get(text)
+    if key is None:
+        found = [phrase for phrase in phrases if re.search(rf"\b{phrase}\b", text)]
+        if found:
+            key = phrases[max(found, key=len)]
+    if key in names:
+        return names[key]
+    return str(position).strip()
+
+
+class Position:
+    """One registry row"""
+    __slots__ = ("key", "display_name", "ordering", "eligibility")
+
+    def __init__(self, key, display_name, ordering, eligibility):
+        self.key = key
+        self.display_name = display_name
+        self.ordering = ordering
+        self.eligibility = eligibility
+
+    def open_to(self, school):
+        """Whether a voter from school (queries.map_faculty_name form) may vote for this position"""
+        return self.eligibility == ALL_VOTERS or self.eligibility == school
+
+
+class BallotDefinition:
+    """The registry plus the chosen leaders standing for each position"""
+    __slots__ = ("version", "positions", "candidates", "by_reg_key", "by_id", "allows_blank")
+
+    def __init__(self, version, positions, leaders, allows_blank=ALLOW_BLANK_BALLOTS):
+        self.version = version
+        self.allows_blank = allows_blank
+        self.positions = tuple(positions)
+        keys = {position.display_name: position.key for position in self.positions}
+        self.candidates = {position.key: [] for position in self.positions}
+        # reg_key -> (position key, leader); leaders whose position is not on the ballot are left out
+        self.by_reg_key = {}
+        self.by_id = {}
+        for leader in leaders:
+            self.by_id[leader.id] = leader
+            key = keys.get(leader.position)
+            if key is not None:
+                self.candidates[key].append(leader)
+                self.by_reg_key[leader.reg_key] = (key, leader)
+
+    def choice(self, position, candidate_reg):
+        """The chosen leader a ballot names for position, or None if they do not stand for it"""
+        found = self.by_reg_key.get(normalize_reg_number(candidate_reg))
+        if found is None or found[0] != position.key:
+            return None
+        return found[1]
+
+    def named(self, data):
+        """Number of positions a ballot body names a candidate for"""
+        return sum(1 for position in self.positions if data.get(position.key))
+
+
+def load_ballot_definition(conn):
+    """Build the ballot definition from the registry and chosen_leaders"""
+    version = conn.execute(
+        "SELECT COALESCE(SUM(version), 0) FROM table_versions WHERE table_name IN ('positions', 'chosen_leaders')"
+    ).fetchone()[0]
+    positions = [Position(*row) for row in BALLOT_POSITIONS.records(conn)]
+    return BallotDefinition(version, positions, BALLOT_CANDIDATES.records(conn))
+
+
+def _load():
+    with get_db_connection() as conn:
+        return load_ballot_definition(conn)
+
+
+def ballot_definition():
+    """The current ballot definition; reloaded only after positions or chosen_leaders change"""
+    return query_cache.get("ballot_definition", ("positions", "chosen_leaders"), _load)
+
+
+__all__ = [
+    'ALLOW_BLANK_BALLOTS', 'ALL_VOTERS', 'BallotDefinition', 'DEFAULT_POSITIONS', 'POSITIONS_SCHEMA', 'POSITION_ALIASES', 'Position',
+    'ballot_definition', 'load_ballot_definition', 'normalize_position_name',
+]
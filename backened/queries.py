@@ -0,0 +1,270 @@
+"""Named list statements and the rows they produce.
+
+The list endpoints used to fetch sqlite3.Rows, copy each one into a dict and
+then into a third, camelCase dict for jsonify. A Statement names its output
+fields once, in order, and serves them two ways:
+
+    statement.json(conn)     # the finished JSON array, as text
+    statement.records(conn)  # one __slots__ record per row
+
+json() has SQLite build every object with json_object(), so no Python object
+exists per row at all; statements with Python-side conversions (faculty
+mapping) fall back to records() plus encode_records(). Every statement is
+registered in STATEMENTS, which query_plans.py plans alongside the literal SQL
+in the route modules.
+"""
+import json
+from json.encoder import encode_basestring_ascii
+from operator import attrgetter
+
+from flask import current_app
+
+STATEMENTS = {}
+
+
+def map_faculty_name(faculty):
+    """Map various faculty names to consistent frontend format"""
+    if not faculty:
+        return "Unknown"
+    
+    faculty = faculty.strip()
+    
+    mapping = {
+        "Business And Economics": "School of Business and Economics",
+        "Pure and Applied Science": "School of Pure and Applied Science",
+        "Education Arts": "School of Education Arts",
+        "Education Sciences": "School of Education Sciences",
+        "Business and Economics": "School of Business and Economics",
+        "Business": "School of Business and Economics",
+        "Science": "School of Pure and Applied Science",
+        "Pure and Applied Sciences": "School of Pure and Applied Science",
+        "Education Art": "School of Education Arts",
+        "Education Science": "School of Education Sciences",
+        "Arts": "School of Education Arts",
+        "Education": "School of Education Sciences",
+        "School of Business and Economics": "School of Business and Economics",
+        "School of Pure and Applied Science": "School of Pure and Applied Science",
+        "School of Education Art": "School of Education Arts",
+        "School of Education Science": "School of Education Sciences",
+    }
+    
+    if faculty in mapping:
+        return mapping[faculty]
+    
+    faculty_lower = faculty.lower()
+    for key, value in mapping.items():
+        if key.lower() in faculty_lower or faculty_lower in key.lower():
+            return value
+    
+    if "business" in faculty_lower or "economic" in faculty_lower:
+        return "School of Business and Economics"
+    elif "pure" in faculty_lower and "applied" in faculty_lower and "science" in faculty_lower:
+        return "School of Pure and Applied Science"
+    elif "education" in faculty_lower and "art" in faculty_lower:
+        return "School of Education Arts"
+    elif "education" in faculty_lower and "science" in faculty_lower:
+        return "School of Education Sciences"
+    elif "art" in faculty_lower:
+        return "School of Education Arts"
+    elif "science" in faculty_lower and "education" not in faculty_lower:
+        return "School of Pure and Applied Science"
+    
+    return faculty
+
+
+class Field:
+    """One output key of a statement and the SQL expression it comes from"""
+    __slots__ = ("key", "expr", "boolean", "convert")
+
+    def __init__(self, key, expr=None, boolean=False, convert=None):
+        self.key = key
+        self.expr = expr or key
+        self.boolean = boolean
+        self.convert = convert
+
+    def json_expr(self):
+        if self.boolean:
+            return f"CASE WHEN {self.expr} THEN json('true') ELSE json('false') END"
+        return self.expr
+
+
+class Record:
+    """Base of the per-statement row types: attribute access without a per-row dict"""
+    __slots__ = ()
+
+    def __init__(self, values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+
+class Statement:
+    """A named SELECT whose columns are the output fields, in order"""
+
+    def __init__(self, name, fields, source):
+        self.name = name
+        self.fields = tuple(fields)
+        self.keys = tuple(field.key for field in self.fields)
+        self.sql = f"SELECT {', '.join(field.expr for field in self.fields)} {source}"
+        pairs = ", ".join(f"'{field.key}', {field.json_expr()}" for field in self.fields)
+        self.json_sql = f"SELECT json_object({pairs}) {source}"
+        self.record = type(name.title().replace("_", ""), (Record,), {"__slots__": self.keys})
+        self.template = "{" + ",".join(f"{encode_basestring_ascii(key)}:%s" for key in self.keys) + "}"
+        self.values = attrgetter(*self.keys)
+        converts = [bool if field.boolean else field.convert for field in self.fields]
+        if any(converts):
+            record = self.record
+            steps = tuple(enumerate(converts))
+            self.row_factory = lambda cursor, row: record([convert(row[i]) if convert else row[i] for i, convert in steps])
+        else:
+            self.row_factory = lambda cursor, row, record=self.record: record(row)
+        self.python_only = any(field.convert for field in self.fields)
+        STATEMENTS[name] = self
+
+    def records(self, conn, params=()):
+        """One record per row, built by the cursor's row factory"""
+        cursor = conn.cursor()
+        cursor.row_factory = self.row_factory
+        return cursor.execute(self.sql, params).fetchall()
+
+    def first(self, conn, params=()):
+        """The first record, or None"""
+        cursor = conn.cursor()
+        cursor.row_factory = self.row_factory
+        return cursor.execute(self.sql, params).fetchone()
+
+    def json(self, conn, params=()):
+        """The rows as a JSON array of objects, built without per-row Python objects where possible"""
+        if self.python_only:
+            return encode_records(self, self.records(conn, params))
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        return "[" + ",".join([row[0] for row in cursor.execute(self.json_sql, params)]) + "]"
+
+
+def encode_value(value):
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if type(value) is str:
+        return encode_basestring_ascii(value)
+    if type(value) is int:
+        return str(value)
+    return json.dumps(value)
+
+
+def encode_records(statement, records):
+    """JSON array of records, written straight from their slots"""
+    template, values = statement.template, statement.values
+    return "[" + ",".join([template % tuple(map(encode_value, values(record))) for record in records]) + "]"
+
+
+def wrap(key, body):
+    """{"key": body} around already-encoded JSON"""
+    return f"{{{encode_basestring_ascii(key)}:{body}}}"
+
+
+def json_response(body, status=200):
+    """Response carrying already-encoded JSON"""
+    return current_app.response_class(body, status=status, mimetype="application/json")
+
+
+# Named statements
+LEADER_FIELDS = (
+    Field("id"),
+    Field("fullName", "full_name"),
+    Field("regNumber", "reg_number"),
+    Field("school"),
+    Field("position"),
+    Field("phone"),
+    Field("email"),
+    Field("yearOfStudy", "year_of_study"),
+    Field("photoUrl", "photo_url"),
+)
+
+DELEGATES = Statement("delegates", (
+    Field("_id", "id"),
+    Field("id"),
+    Field("public_id"),
+    Field("fullName", "full_name"),
+    Field("emailOrPhone", "COALESCE(NULLIF(email, ''), phone)"),
+    Field("registrationNumber", "registration_number"),
+    Field("faculty"),
+    Field("yearOfStudy", "year_of_study"),
+    Field("isApproved", "is_approved", boolean=True),
+    Field("created_at"),
+), "FROM delegates WHERE full_name != 'Voter' ORDER BY created_at DESC")
+
+APPROVED_CANDIDATES = Statement("approved_candidates", (
+    Field("id", "c.id"),
+    Field("full_name", "c.full_name"),
+    Field("registration_number", "c.registration_number"),
+    Field("faculty", "c.faculty", convert=map_faculty_name),
+    Field("original_faculty", "c.faculty"),
+    Field("position", "c.position"),
+    Field("votes", "COALESCE(t.votes, 0)"),
+), """FROM candidates c
+            JOIN delegates d ON c.delegate_id = d.id
+            LEFT JOIN tallies t ON t.position = 'delegate' AND t.candidate_id = c.id
+            WHERE d.is_approved = 1 AND d.is_active = 1
+            ORDER BY COALESCE(t.votes, 0) DESC""")
+
+ALL_LEADERS = Statement("all_leaders", LEADER_FIELDS + (
+    Field("status"),
+    Field("is_approved", boolean=True),
+    Field("created_at"),
+    Field("updated_at"),
+), "FROM leaders ORDER BY created_at DESC")
+
+PENDING_LEADERS = Statement("pending_leaders", ALL_LEADERS.fields,
+                            "FROM leaders WHERE is_approved = 0 ORDER BY created_at DESC")
+
+CHOSEN_LEADERS = Statement("chosen_leaders", LEADER_FIELDS + (
+    Field("is_admin", boolean=True),
+    Field("approved_at"),
+    Field("created_at"),
+    Field("updated_at"),
+), "FROM chosen_leaders ORDER BY approved_at DESC")
+
+APPROVED_LEADERS = Statement("approved_leaders", (
+    Field("id"),
+    Field("original_leader_id"),
+) + LEADER_FIELDS[1:-1] + (
+    Field("photoUrl", "'/api/leaders/photo/' || original_leader_id"),
+), "FROM chosen_leaders ORDER BY position, full_name")
+
+# Chosen leaders a student ballot can name (positions.BallotDefinition)
+BALLOT_CANDIDATES = Statement("ballot_candidates", (
+    Field("reg_key"),
+    Field("id"),
+    Field("full_name"),
+    Field("reg_number"),
+    Field("position"),
+), "FROM chosen_leaders")
+
+# The student-ballot positions in ballot order (positions.py)
+BALLOT_POSITIONS = Statement("ballot_positions", (
+    Field("key"),
+    Field("display_name"),
+    Field("ordering"),
+    Field("eligibility"),
+), "FROM positions ORDER BY ordering")
+
+# Who a registration number votes as (see identity.py)
+VOTER = Statement("voter", (
+    Field("voter_type"),
+    Field("voter_id"),
+    Field("full_name"),
+    Field("school"),
+), "FROM voter_identities WHERE reg_key = ? AND eligible = 1 ORDER BY priority LIMIT 1")
+
+__all__ = ['ALL_LEADERS', 'APPROVED_CANDIDATES', 'APPROVED_LEADERS', 'BALLOT_CANDIDATES', 'BALLOT_POSITIONS', 'CHOSEN_LEADERS', 'DELEGATES', 'PENDING_LEADERS',
+           'STATEMENTS', 'VOTER', 'Field', 'Record', 'Statement', 'encode_records', 'json_response', 'map_faculty_name', 'wrap']
@@ -0,0 +1,225 @@
+"""Query-plan regression checker.
+
+Collects every SQL statement the backend modules pass to execute(),
+plus the named statements in queries.py, runs EXPLAIN QUERY PLAN for each against a migrated, populated scratch
+database and fails when a statement scans a table without an index or
+sorts rows through a temp B-tree:
+
+    python query_plans.py           # exit status 1 on any regression
+    python query_plans.py --verbose # print every plan
+"""
+import argparse
+import ast
+import contextlib
+import glob
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Tooling modules whose SQL never runs on a request path
+EXCLUDED_MODULES = {"migrations.py", "bench.py", "query_plans.py", "journal.py"}
+
+# Statements that legitimately read a whole table, keyed by a fragment of their SQL
+ALLOWED_SCANS = {
+    "FROM sqlite_master": "schema catalog lookup",
+    "FROM table_versions": "one row per tracked table, read whole by the cache",
+    "SELECT * FROM elections ORDER BY id DESC": "election listing returns every election",
+    "FROM elections WHERE status = 'closed'": "one row per election, checked for ones left unarchived",
+    "sqlite_sequence WHERE name = ?": "one row per AUTOINCREMENT table",
+    "SELECT id, reg_number, full_name, position, status, is_approved, photo_url FROM leaders":
+        "debug endpoint dumps every leader",
+    "SELECT id, original_leader_id, reg_number, full_name, position, photo_url, approved_at FROM chosen_leaders":
+        "debug endpoint dumps every chosen leader",
+    "SELECT id, registration_number, user_type, full_name, is_active, created_at FROM users":
+        "admin user listing returns every user",
+    "SELECT id, registration_number, user_type, full_name, is_active FROM users":
+        "debug user listing returns every user",
+    "reg_number, 'position', position) FROM chosen_leaders":
+        "ballot candidate map loads every chosen leader",
+    "reg_number, position FROM chosen_leaders":
+        "ballot candidate map loads every chosen leader",
+    "FROM tallies WHERE position != ?": "student results read every student-position tally",
+    "COUNT(*) as count FROM tallies": "debug endpoint counts every tally",
+    "FROM ballot_choices GROUP BY position, candidate_id": "recount rebuilds every tally from the ledger",
+    "FROM ballots GROUP BY kind, voter_school": "recount rebuilds turnout from the ledger",
+    "FROM tally_adjustments WHERE true": "votes kept without a ballot are folded into every tally",
+    "SELECT COUNT(*) FROM tallies": "recount reports the tally rows it rebuilt",
+    "GROUP BY user_type": "voting stats group the delegate ballots by voter type",
+    "ORDER BY COALESCE(t.votes, 0) DESC": "candidates ranked by their ledger tally, a join result",
+    "ORDER BY c.faculty, vote_count DESC": "admin results ranked by their ledger tally, a join result",
+    "FROM roll.candidates": "closing an election freezes every candidate's details",
+    "FROM roll.ballots": "closing an election copies every ballot",
+    "FROM roll.tallies": "closing an election copies every tally",
+    "JOIN ballot_choices c ON c.ballot_id = b.id ORDER BY b.cast_at DESC": "admin listing returns every vote",
+}
+
+PLAN_FAILURES = (
+    (re.compile(r"^SCAN (\w+)$"), "full table scan"),
+    (re.compile(r"^SCAN (\w+) \(~\d+ rows\)$"), "full table scan"),
+    (re.compile(r"USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT|RIGHT PART OF ORDER BY)"), "temp B-tree sort"),
+)
+
+SUBQUERY = re.compile(r"^(MATERIALIZE|CO-ROUTINE) (\w+)")
+
+DML = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|REPLACE)\b", re.IGNORECASE)
+
+
+def normalize(sql):
+    return " ".join(sql.split())
+
+
+def collect_statements(directory=HERE):
+    """Return [(location, sql)] for every literal SQL string passed to execute()/executemany()"""
+    statements = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        name = os.path.basename(path)
+        if name in EXCLUDED_MODULES:
+            continue
+        with open(path, encoding="utf-8") as source:
+            tree = ast.parse(source.read(), filename=name)
+        for node in ast.walk(tree):
+            if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+                continue
+            if node.func.attr not in ("execute", "executemany") or not node.args:
+                continue
+            first = node.args[0]
+            if isinstance(first, ast.Constant) and isinstance(first.value, str) and DML.match(first.value):
+                statements.append((f"{name}:{node.lineno}", normalize(first.value)))
+    sys.path.insert(0, directory)
+    import queries
+    for name, statement in queries.STATEMENTS.items():
+        statements.append((f"queries.py:{name}", normalize(statement.sql)))
+        statements.append((f"queries.py:{name} (json)", normalize(statement.json_sql)))
+    return statements
+
+
+def populate(conn, rows):
+    """Fill every table with synthetic rows so the planner sees realistic statistics"""
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name != 'schema_version'"
+    ).fetchall()]
+    for table in tables:
+        columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+        unique = set()
+        for index in conn.execute(f"PRAGMA index_list({table})").fetchall():
+            if index[2]:
+                info = conn.execute(f"PRAGMA index_info('{index[1]}')").fetchall()
+                if len(info) == 1:
+                    unique.add(info[0][2])
+        names, makers = [], []
+        for _, column, declared, _, _, pk in columns:
+            declared = (declared or "").upper()
+            if pk == 1 and "INT" in declared:
+                continue
+            names.append(column)
+            if "BOOL" in declared:
+                makers.append(lambda i: i % 2)
+            elif "INT" in declared:
+                makers.append(lambda i: i)
+            elif "TIMESTAMP" in declared:
+                makers.append(lambda i: f"2025-01-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00")
+            elif "BLOB" in declared:
+                makers.append(lambda i: None)
+            elif column in unique or pk:
+                makers.append(lambda i, column=column: f"{column}-{i}")
+            else:
+                makers.append(lambda i, column=column: f"{column}-{i % 7}")
+        placeholders = ", ".join("?" for _ in names)
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {table} ({', '.join(names)}) VALUES ({placeholders})",
+            [tuple(make(i) for make in makers) for i in range(rows)],
+        )
+    conn.commit()
+    conn.execute("ANALYZE")
+
+
+def build_database(directory, rows):
+    sys.path.insert(0, HERE)
+    import database
+    import elections
+    import migrations
+
+    path = os.path.join(directory, "plans.db")
+    conn = database.connect(path)
+    migrations.migrate(conn)
+    # Archive-only tables and indexes for elections.py; ones the primary already has are kept
+    for statement in elections.TEMPLATE_SCHEMA + elections.ARCHIVE_INDEXES:
+        try:
+            conn.execute(statement)
+        except sqlite3.OperationalError:
+            pass
+    conn.isolation_level = ""
+    populate(conn, rows)
+    # Closing an election reads names from the primary attached as roll
+    conn.execute("ATTACH DATABASE ? AS roll", (path,))
+    return conn
+
+
+def check_statement(conn, sql):
+    """Return (plan lines, problems) for one statement"""
+    params = (None,) * sql.count("?")
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+    allowed = next((reason for fragment, reason in ALLOWED_SCANS.items() if fragment in sql), None)
+    # Scanning a materialized subquery reads its (already aggregated) rows, not a table
+    subqueries = {match.group(2) for match in map(SUBQUERY.match, plan) if match}
+    problems = []
+    for detail in plan:
+        for pattern, label in PLAN_FAILURES:
+            match = pattern.search(detail)
+            if not match:
+                continue
+            if label == "full table scan" and match.group(1) in subqueries:
+                continue
+            # Sorting the groups of an aggregate is bounded by the number of groups, not rows
+            if label == "temp B-tree sort" and "GROUP BY" in sql.upper() and "FOR ORDER BY" in detail:
+                continue
+            if allowed is None:
+                problems.append(f"{label}: {detail}")
+    return plan, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail on SQL statements that scan or sort whole tables")
+    parser.add_argument("--rows", type=int, default=2000, help="synthetic rows per table")
+    parser.add_argument("--verbose", action="store_true", help="print the plan of every statement")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="garissa_plans_")
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            conn = build_database(workdir, args.rows)
+
+        statements = collect_statements()
+        seen, failures = set(), 0
+        for location, sql in statements:
+            if sql in seen:
+                continue
+            seen.add(sql)
+            try:
+                plan, problems = check_statement(conn, sql)
+            except sqlite3.Error as e:
+                plan, problems = [], [f"cannot plan statement: {e}"]
+            if problems:
+                failures += 1
+                print(f"FAIL {location}\n     {sql}")
+                for problem in problems:
+                    print(f"       - {problem}")
+            elif args.verbose:
+                print(f"ok   {location}\n     {sql}")
+                for detail in plan:
+                    print(f"       {detail}")
+        conn.close()
+
+        print(f"{len(seen)} statements checked, {failures} with plan regressions")
+        return 1 if failures else 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
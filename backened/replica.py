@@ -0,0 +1,170 @@
+import itertools
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from cache import data_versions
+from database import connect
+
+# Configuration
+REFRESH_SECONDS = float(os.environ.get('REPLICA_REFRESH_SECONDS', '2'))
+REFRESH_AFTER_COMMITS = int(os.environ.get('REPLICA_REFRESH_COMMITS', '50'))
+
+
+class SnapshotConnection(sqlite3.Connection):
+    """Reader connection on a snapshot; taken_at is when that snapshot was copied"""
+
+    snapshot = None
+
+    @property
+    def taken_at(self):
+        return self.snapshot.taken_at
+
+
+class Snapshot:
+    """One in-memory copy of the primary, shared by a pool of reader connections.
+
+    The copy is a named shared-cache in-memory database: the holder connection
+    keeps it alive and every reader opens its own query_only connection to it,
+    so readers never wait on each other. Idle readers are kept for reuse and
+    closed with the snapshot once its last reference goes.
+    """
+
+    _names = itertools.count()
+
+    def __init__(self, source):
+        self.uri = f"file:replica-{os.getpid()}-{next(self._names)}?mode=memory&cache=shared"
+        self._holder = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        source.backup(self._holder)
+        self.taken_at = time.time()
+        self._idle = queue.LifoQueue()
+
+    def _open_reader(self):
+        conn = sqlite3.connect(self.uri, uri=True, factory=SnapshotConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def reader(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open_reader()
+        # Only a checked-out reader points back at its snapshot, so idle ones never keep it alive
+        conn.snapshot = self
+        try:
+            yield conn
+        finally:
+            conn.snapshot = None
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def __del__(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._holder.close()
+
+
+class SnapshotReplica:
+    """Read-side replica for results and dashboard endpoints.
+
+    The primary is copied into a fresh in-memory database with the SQLite
+    backup API, then swapped in for readers, each on its own connection. A background thread refreshes it
+    every REFRESH_SECONDS, or sooner once REFRESH_AFTER_COMMITS ballot commits
+    have been reported through note_commits().
+    """
+
+    def __init__(self, path=None, refresh_seconds=REFRESH_SECONDS, refresh_after_commits=REFRESH_AFTER_COMMITS):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.refresh_after_commits = refresh_after_commits
+        # Current Snapshot, swapped as a single reference
+        self._current = None
+        self._data_version = None
+        self._pending_commits = 0
+        self._wake = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self.refreshes = 0
+
+    def _take_snapshot(self):
+        source = connect(self.path)
+        try:
+            return Snapshot(source)
+        finally:
+            source.close()
+
+    def refresh(self):
+        """Copy the primary now and swap the new snapshot in for readers"""
+        # Read before copying: a commit racing the copy only causes one extra refresh
+        data_version = data_versions.current()
+        current = self._current
+        if current is not None and data_version == self._data_version:
+            # Nothing committed anywhere since the last copy, so it is still current
+            current.taken_at = time.time()
+            return
+        snapshot = self._take_snapshot()
+        self._data_version = data_version
+        # Readers still holding the old snapshot finish on it; it is freed with its last reference
+        self._current = snapshot
+        self.refreshes += 1
+
+    def _run(self):
+        while True:
+            with self._wake:
+                if self._pending_commits < self.refresh_after_commits:
+                    self._wake.wait(self.refresh_seconds)
+                self._pending_commits = 0
+            try:
+                self.refresh()
+            except sqlite3.Error as e:
+                print(f"Replica refresh failed: {e}")
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._current is None:
+                self.refresh()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="snapshot-replica", daemon=True)
+                self._thread.start()
+
+    def note_commits(self, count=1):
+        """Called by writers after a commit; wakes the refresher once enough have piled up"""
+        with self._wake:
+            self._pending_commits += count
+            if self._pending_commits >= self.refresh_after_commits:
+                self._wake.notify()
+
+    @contextmanager
+    def connection(self):
+        self._ensure_started()
+        with self._current.reader() as conn:
+            yield conn
+
+
+replica = SnapshotReplica()
+
+
+# Read-only connection for results endpoints, served from the in-memory snapshot
+@contextmanager
+def get_snapshot_connection():
+    with replica.connection() as conn:
+        yield conn
+
+
+def snapshot_age(conn):
+    """Seconds since the snapshot behind conn was copied from the primary"""
+    return round(max(time.time() - conn.taken_at, 0.0), 3)
+
+
+__all__ = ['Snapshot', 'SnapshotReplica', 'get_snapshot_connection', 'replica', 'snapshot_age']
@@ -5,7 +5,13 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import datetime
 import os
-from contextlib import contextmanager
+from database import DB_PATH, DatabaseBusy, get_db_connection, write_transaction
+from identity import normalize_reg_number
+from journal import journal
+from ledger import DELEGATE, cast_ballot
+from queries import VOTER
+from replica import get_snapshot_connection, snapshot_age
+from voted import voted
 
 # Create the Blueprint instance
 student_bp = Blueprint('student', __name__)
@@ -22,50 +28,6 @@ CORS(student_bp, resources={
 # Configuration
 JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-strong-secret-key-here')
 
-# Database context manager
-@contextmanager
-def get_db_connection():
-    conn = sqlite3.connect("garissa_voting.db")
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
-
-def init_db():
-    with get_db_connection() as conn:
-        # Students table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS students (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                email_or_phone TEXT NOT NULL,
-                registration_number TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                is_delegate BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # SIMPLIFIED VOTER RECORDS TABLE - ONLY NAME, REG NUMBER & TIME
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS voter_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                registration_number TEXT UNIQUE NOT NULL,
-                vote_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create indexes for faster queries
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_voter_records_reg_number ON voter_records(registration_number)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_voter_records_time ON voter_records(vote_time)')
-        
-        conn.commit()
-
-# Initialize database
-init_db()
-
 @student_bp.route("/api/students/register", methods=["POST", "OPTIONS"])
 def register_student():
     if request.method == "OPTIONS":
@@ -88,7 +50,7 @@ def register_student():
         if len(password) < 8:
             return jsonify({"error": "Password must be at least 8 characters"}), 400
 
-        with get_db_connection() as conn:
+        with write_transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 '''
@@ -98,7 +60,7 @@ def register_student():
                 (
                     str(data["full_name"]).strip(),
                     str(data["email_or_phone"]).strip(),
-                    str(data["registration_number"]).strip().upper(),
+                    normalize_reg_number(data["registration_number"]),
                     generate_password_hash(password),
                 ),
             )
@@ -113,6 +75,8 @@ def register_student():
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 201
 
+    except DatabaseBusy:
+        raise
     except sqlite3.IntegrityError as e:
         if "UNIQUE constraint failed" in str(e):
             return jsonify({"error": "Registration number already exists"}), 400
@@ -139,7 +103,7 @@ def login():
 
     try:
         # Standardize inputs
-        reg_number = str(data["registration_number"]).strip().upper()
+        reg_number = normalize_reg_number(data["registration_number"])
         password = str(data["password"])
 
         print(f"Login attempt for: {reg_number}")  # Debug logging
@@ -147,7 +111,7 @@ def login():
         # Fetch student row
         with get_db_connection() as conn:
             row = conn.execute(
-                "SELECT * FROM students WHERE registration_number = ? COLLATE NOCASE",
+                "SELECT * FROM students WHERE reg_key = ?",
                 (reg_number,)
             ).fetchone()
 
@@ -196,9 +160,9 @@ def debug_students():
     try:
         with get_db_connection() as conn:
             students = conn.execute("SELECT id, registration_number FROM students").fetchall()
-            voter_records = conn.execute("SELECT COUNT(*) as count FROM voter_records").fetchone()
+            voter_records = conn.execute("SELECT COUNT(*) as count FROM ballots WHERE kind = 'delegate'").fetchone()
             response = jsonify({
-                "database": os.path.abspath("garissa_voting.db"),
+                "database": os.path.abspath(DB_PATH),
                 "students": [dict(student) for student in students],
                 "voter_records_count": voter_records["count"]
             })
@@ -216,11 +180,12 @@ def get_voter_records():
             records = conn.execute('''
                 SELECT 
                     id,
-                    full_name,
-                    registration_number,
-                    vote_time
-                FROM voter_records 
-                ORDER BY vote_time DESC
+                    voter_name AS full_name,
+                    voter_reg_number AS registration_number,
+                    cast_at AS vote_time
+                FROM ballots
+                WHERE kind = 'delegate'
+                ORDER BY cast_at DESC
             ''').fetchall()
             
             voter_records = []
@@ -252,36 +217,21 @@ def create_voter_record():
             if field not in data or not data[field]:
                 return jsonify({"error": f"{field} is required"}), 400
         
-        with get_db_connection() as conn:
-            # Check if voter has already voted
-            existing_record = conn.execute(
-                "SELECT id FROM voter_records WHERE registration_number = ?",
-                (data["registration_number"].upper(),)
-            ).fetchone()
-            
-            if existing_record:
-                return jsonify({"error": "Voter has already cast a vote"}), 400
-            
-            cursor = conn.cursor()
-            cursor.execute(
-                '''
-                INSERT INTO voter_records 
-                (full_name, registration_number)
-                VALUES (?, ?)
-                ''',
-                (
-                    data["full_name"],
-                    data["registration_number"].upper()
-                )
+        with write_transaction() as conn:
+            # A delegate-kind ballot without choices; the ledger's unique index makes a repeat return no id
+            reg_key = normalize_reg_number(data["registration_number"])
+            voter = VOTER.first(conn, [reg_key])
+            record_id = cast_ballot(
+                conn, DELEGATE, reg_key, data["full_name"],
+                voter.voter_type if voter else None, voter.voter_id if voter else None, voter.school if voter else ""
             )
+            if record_id is None:
+                return jsonify({"error": "Voter has already cast a vote"}), 400
+            new_record = conn.execute("SELECT cast_at AS vote_time FROM ballots WHERE id = ?", (record_id,)).fetchone()
+            batch = journal.flush()
             conn.commit()
-            record_id = cursor.lastrowid
-            
-            # Get the created record with timestamp
-            new_record = conn.execute(
-                "SELECT * FROM voter_records WHERE id = ?",
-                (record_id,)
-            ).fetchone()
+            journal.commit(batch)
+        voted.refresh()
             
         return jsonify({
             "message": "Voter record created successfully",
@@ -289,6 +239,8 @@ def create_voter_record():
             "vote_time": new_record["vote_time"]
         }), 201
         
+    except DatabaseBusy:
+        raise
     except sqlite3.IntegrityError as e:
         if "UNIQUE constraint failed" in str(e):
             return jsonify({"error": "Voter has already cast a vote"}), 400
@@ -301,23 +253,20 @@ def create_voter_record():
 def check_voter_status(registration_number):
     """Check if a voter has already voted"""
     try:
-        with get_db_connection() as conn:
-            record = conn.execute(
-                "SELECT * FROM voter_records WHERE registration_number = ?",
-                (registration_number.upper(),)
-            ).fetchone()
+        # Answered from the in-memory voted-set (voted.py), not SQLite; only a voter record counts here
+        record = voted.lookup(normalize_reg_number(registration_number))
+
+        if record is not None and record.vote_time is not None:
+            return jsonify({
+                "has_voted": True,
+                "vote_time": record.vote_time,
+                "full_name": record.full_name
+            }), 200
+        else:
+            return jsonify({
+                "has_voted": False
+            }), 200
             
-            if record:
-                return jsonify({
-                    "has_voted": True,
-                    "vote_time": record["vote_time"],
-                    "full_name": record["full_name"]
-                }), 200
-            else:
-                return jsonify({
-                    "has_voted": False
-                }), 200
-                
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -326,31 +275,36 @@ def check_voter_status(registration_number):
 def get_voting_statistics():
     """Get voting statistics"""
     try:
-        with get_db_connection() as conn:
+        with get_snapshot_connection() as conn:
             # Total votes
-            total_votes = conn.execute("SELECT COUNT(*) as count FROM voter_records").fetchone()["count"]
+            total_votes = conn.execute(
+                "SELECT COALESCE(SUM(voters), 0) as count FROM turnout WHERE kind = 'delegate'"
+            ).fetchone()["count"]
             
             # Recent votes (last 24 hours)
             recent_votes = conn.execute('''
                 SELECT COUNT(*) as count 
-                FROM voter_records 
-                WHERE vote_time >= datetime('now', '-1 day')
+                FROM ballots
+                WHERE kind = 'delegate' AND cast_at >= datetime('now', '-1 day')
             ''').fetchone()["count"]
             
             # Votes today
             votes_today = conn.execute('''
                 SELECT COUNT(*) as count 
-                FROM voter_records 
-                WHERE date(vote_time) = date('now')
+                FROM ballots
+                WHERE kind = 'delegate' AND cast_at >= date('now') AND cast_at < date('now', '+1 day')
             ''').fetchone()["count"]
             
             statistics = {
                 "total_votes": total_votes,
                 "recent_votes_24h": recent_votes,
-                "votes_today": votes_today
+                "votes_today": votes_today,
+                "snapshot_age_seconds": snapshot_age(conn)
             }
             
-            return jsonify(statistics), 200
+            response = jsonify(statistics)
+            response.headers["X-Snapshot-Age"] = str(statistics["snapshot_age_seconds"])
+            return response, 200
             
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1,77 +1,51 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import CORS
+import hashlib
+import hmac
+import json
+import os
 import sqlite3
-from contextlib import contextmanager
+from cache import query_cache
+from database import DatabaseBusy, get_db_connection
+from ballot_writer import submit_ballot
+from delegate_route import map_faculty_name, record_delegate_vote
+from elections import reset_ballots
+from idempotency import idempotent
+from identity import normalize_reg_number
+from journal import journal
+from ledger import DELEGATE_POSITION, STUDENT, cast_ballot
+from positions import ballot_definition
+from queries import VOTER
+from voted import voted
+from replica import get_snapshot_connection, snapshot_age
 import datetime
 
 # Create the Blueprint instance
 vote_bp = Blueprint('vote', __name__)
 
+# Configuration
+# No default: a secret anyone can read in the repository would let anyone sign ballots
+SYNC_SECRET = os.environ.get('BALLOT_SYNC_SECRET')
+SYNC_MAX_BALLOTS = int(os.environ.get('BALLOT_SYNC_MAX', '500'))
+# How far ahead of the server clock a station's cast_at may be
+SYNC_CLOCK_SKEW_S = int(os.environ.get('BALLOT_SYNC_CLOCK_SKEW_S', '300'))
+
 # Enable CORS for this blueprint
 CORS(vote_bp, resources={
     r"/api/votes/*": {
         "origins": "*",
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"]
     }
 })
 
-# Database context manager
-@contextmanager
-def get_db_connection():
-    conn = sqlite3.connect("garissa_voting.db")
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
-
-def init_vote_db():
-    """Initialize the votes database tables"""
-    with get_db_connection() as conn:
-        # Check if votes table exists with the correct structure
-        cursor = conn.cursor()
-        cursor.execute("PRAGMA table_info(votes)")
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        # Add position column if it doesn't exist
-        if 'position' not in columns:
-            try:
-                conn.execute('ALTER TABLE votes ADD COLUMN position TEXT')
-                print("Added position column to votes table")
-            except sqlite3.OperationalError as e:
-                print(f"Could not add position column: {e}")
-        
-        # Ensure vote_results table exists
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name='vote_results'
-        """)
-        if not cursor.fetchone():
-            conn.execute('''
-                CREATE TABLE vote_results (
-                    position TEXT NOT NULL,
-                    candidate_reg_number TEXT NOT NULL,
-                    candidate_name TEXT NOT NULL,
-                    votes INTEGER DEFAULT 0,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (position, candidate_reg_number)
-                )
-            ''')
-            print("Created vote_results table")
-        
-        conn.commit()
-        print("Vote database initialization completed successfully!")
-
-# Initialize vote database
-init_vote_db()
-
 @vote_bp.route("/api/votes", methods=["POST", "OPTIONS"])
+@idempotent("votes")
 def submit_vote():
     if request.method == "OPTIONS":
         response = jsonify({"status": "ok"})
         response.headers.add("Access-Control-Allow-Origin", "*")
-        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type, Idempotency-Key")
         return response, 200
 
     data = request.get_json()
@@ -82,66 +56,27 @@ def submit_vote():
     for field in required_fields:
         if field not in data or not data[field]:
             return jsonify({"error": f"{field} is required"}), 400
+    # Ballots store the canonical registration number
+    data["voter_reg_number"] = normalize_reg_number(data["voter_reg_number"])
 
     try:
-        with get_db_connection() as conn:
-            # Check if this student has already voted
-            existing_vote = conn.execute(
-                "SELECT id FROM votes WHERE voter_reg_number = ?",
-                (data["voter_reg_number"],)
-            ).fetchone()
-            
-            if existing_vote:
-                return jsonify({"error": "You have already voted. Each student can only vote once."}), 400
-
-            # Insert votes for each position
-            positions = [
-                ("chairperson", data.get("chairperson", "")),
-                ("vice_chair", data.get("vice_chair", "")),
-                ("secretary", data.get("secretary", "")),
-                ("treasurer", data.get("treasurer", "")),
-                ("academic", data.get("academic", "")),
-                ("welfare", data.get("welfare", "")),
-                ("sports", data.get("sports", ""))
-            ]
-            
-            for position, candidate_reg in positions:
-                if candidate_reg:  # Only insert if a candidate was selected
-                    # Get candidate info from chosen_leaders
-                    candidate = conn.execute(
-                        "SELECT id, full_name, reg_number FROM chosen_leaders WHERE reg_number = ?",
-                        (candidate_reg,)
-                    ).fetchone()
-                    
-                    if candidate:
-                        # Insert the vote with position
-                        conn.execute(
-                            "INSERT INTO votes (voter_id, candidate_id, voter_reg_number, voter_school, position) VALUES (?, ?, ?, ?, ?)",
-                            (1, candidate["id"], data["voter_reg_number"], data["voter_school"], position)
-                        )
-                        
-                        # Update vote results
-                        conn.execute(
-                            '''
-                            INSERT INTO vote_results (position, candidate_reg_number, candidate_name, votes)
-                            VALUES (?, ?, ?, 1)
-                            ON CONFLICT(position, candidate_reg_number) 
-                            DO UPDATE SET votes = votes + 1, last_updated = CURRENT_TIMESTAMP
-                            ''',
-                            (position, candidate_reg, candidate["full_name"])
-                        )
-                    else:
-                        print(f"Candidate with reg number {candidate_reg} not found in chosen_leaders")
-            
-            conn.commit()
-
-        response = jsonify({
-            "message": "Vote submitted successfully!",
-            "details": "Your vote has been recorded for all selected positions."
-        })
-        response.headers.add("Access-Control-Allow-Origin", "*")
-        return response, 201
+        # Candidates are checked against the ballot definition before the ballot queues for the write lock
+        definition = ballot_definition()
+        choices = resolve_ballot(data, definition)
+        if len(choices) < definition.named(data):
+            return jsonify({"error": "Each selected candidate must be a chosen leader standing for that position"}), 400
+        if not choices and not definition.allows_blank:
+            return jsonify({"error": "Select a candidate for at least one position"}), 400
+        payload, status = submit_ballot(lambda conn: record_ballot(conn, data, choices))
+        if status < 400:
+            voted.refresh()
+        response = jsonify(payload)
+        if status < 400:
+            response.headers.add("Access-Control-Allow-Origin", "*")
+        return response, status
 
+    except DatabaseBusy:
+        raise
     except sqlite3.IntegrityError as e:
         print("Integrity error:", str(e))
         return jsonify({"error": "Database integrity error. You may have already voted."}), 400
@@ -149,76 +84,388 @@ def submit_vote():
         print("Vote submission error:", str(e))
         return jsonify({"error": f"Vote submission failed: {str(e)}"}), 500
 
+def resolve_ballot(data, definition=None):
+    """(position key, chosen leader) for each position the ballot names a candidate standing for it"""
+    # The ballot definition is reloaded only after positions or chosen_leaders change
+    definition = definition or ballot_definition()
+    school = map_faculty_name(data.get("voter_school"))
+    choices = []
+    for position in definition.positions:
+        candidate_reg = data.get(position.key, "")
+        if candidate_reg:  # Only insert if a candidate was selected
+            candidate = definition.choice(position, candidate_reg) if position.open_to(school) else None
+            if candidate:
+                choices.append((position.key, candidate))
+            else:
+                print(f"Candidate with reg number {candidate_reg} is not standing for {position.display_name}")
+    return choices
+
+def record_ballot(conn, data, choices, cast_at=None, station_id=None, client_ballot_id=None):
+    """Write one student's ballot; runs inside the ballot writer's batch transaction.
+
+    A ballot synced from a polling station also passes its cast_at and ids (ledger.cast_ballot).
+    """
+    # The voter's type and id, when they are on a roll; anyone may cast a student ballot
+    voter = VOTER.first(conn, [data["voter_reg_number"]])
+    ballot_id = cast_ballot(
+        conn, STUDENT, data["voter_reg_number"], data["voter_name"],
+        voter.voter_type if voter else None, voter.voter_id if voter else None, data["voter_school"],
+        [(position, candidate.id) for position, candidate in choices],
+        cast_at, station_id, client_ballot_id
+    )
+    if ballot_id is None:
+        # The (voter, kind) unique index already holds this voter's ballot
+        return {"error": "You have already voted. Each student can only vote once."}, 400
+
+    return {
+        "message": "Vote submitted successfully!",
+        "details": "Your vote has been recorded for all selected positions."
+    }, 201
+
+# ------------------ OFFLINE BALLOT SYNC ------------------
+#
+# A polling station that lost its connection queues ballots and uploads them
+# later in one request:
+#
+#     {"station_id": "library-1", "ballots": [
+#         {"client_ballot_id": "library-1-000042", "cast_at": "2025-10-14T09:31:05",
+#          "type": "student", "ballot": {<body of POST /api/votes>}, "signature": "<hex>"},
+#         {"client_ballot_id": "library-1-000043", "cast_at": "2025-10-14T09:31:40",
+#          "type": "delegate", "ballot": {<body of POST /api/vote>}, "signature": "<hex>"}]}
+#
+# Each ballot is signed with sign_ballot() and the shared BALLOT_SYNC_SECRET;
+# without one the endpoint answers 503.
+# Every ballot gets an outcome: accepted, duplicate (the voter has already
+# voted), invalid_candidate, invalid or error (it could not be recorded;
+# send it again). Accepted ballots commit together in one transaction and
+# keep the station's cast_at and ids, so a ballot sent again after it was
+# accepted is answered as accepted once more.
+
+SYNC_ACCEPTED = "accepted"
+SYNC_DUPLICATE = "duplicate"
+SYNC_INVALID_CANDIDATE = "invalid_candidate"
+SYNC_INVALID = "invalid"
+SYNC_ERROR = "error"
+
+# Format of ballots.cast_at (SQLite's CURRENT_TIMESTAMP)
+CAST_AT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def sign_ballot(station_id, ballot, secret=None):
+    """Hex HMAC-SHA256 a station attaches to a queued ballot"""
+    signed = {key: ballot.get(key) for key in ("client_ballot_id", "cast_at", "type", "ballot")}
+    message = station_id + "\n" + json.dumps(signed, sort_keys=True, separators=(",", ":"))
+    return hmac.new((secret or SYNC_SECRET).encode(), message.encode(), hashlib.sha256).hexdigest()
+
+def load_synced_ids(station_id, client_ballot_ids):
+    """The client_ballot_ids among these that the station's earlier syncs already recorded"""
+    with get_db_connection() as conn:
+        return {row[0] for row in conn.execute(
+            "SELECT client_ballot_id FROM ballots WHERE station_id = ? AND client_ballot_id IN (SELECT value FROM json_each(?))",
+            (station_id, json.dumps(client_ballot_ids))
+        )}
+
+def load_candidate_ids():
+    """Ids a delegate-route ballot may name"""
+    with get_db_connection() as conn:
+        return frozenset(row[0] for row in conn.execute("SELECT id FROM candidates"))
+
+class SyncedBallot:
+    """One uploaded ballot and its outcome"""
+    __slots__ = ("client_ballot_id", "cast_at", "kind", "data", "reg_key", "school", "choices", "candidate_id",
+                 "outcome", "error")
+
+    def __init__(self, client_ballot_id):
+        self.client_ballot_id = client_ballot_id
+        self.cast_at = self.kind = self.data = self.reg_key = self.school = None
+        self.choices = self.candidate_id = None
+        self.outcome = None
+        self.error = None
+
+    def reject(self, outcome, error):
+        self.outcome = outcome
+        self.error = error
+
+    def result(self):
+        result = {"client_ballot_id": self.client_ballot_id, "status": self.outcome}
+        if self.error:
+            result["error"] = self.error
+        return result
+
+def check_synced_ballot(station_id, raw, seen, synced, candidate_ids, latest):
+    """Validate one uploaded ballot in memory: signature, fields, voter and candidates"""
+    ballot = SyncedBallot(raw.get("client_ballot_id") if isinstance(raw, dict) else None)
+    if not isinstance(ballot.client_ballot_id, str) or not ballot.client_ballot_id:
+        ballot.reject(SYNC_INVALID, "client_ballot_id is required")
+        return ballot
+    if ballot.client_ballot_id in seen:
+        ballot.reject(SYNC_DUPLICATE, "client_ballot_id repeated in this batch")
+        return ballot
+    seen.add(ballot.client_ballot_id)
+    if not hmac.compare_digest(str(raw.get("signature", "")), sign_ballot(station_id, raw)):
+        ballot.reject(SYNC_INVALID, "Bad signature")
+        return ballot
+    if ballot.client_ballot_id in synced:
+        # Recorded by an earlier sync whose answer never reached the station
+        ballot.outcome = SYNC_ACCEPTED
+        return ballot
+    try:
+        ballot.cast_at = datetime.datetime.fromisoformat(str(raw.get("cast_at")))
+    except ValueError:
+        ballot.reject(SYNC_INVALID, "cast_at must be an ISO timestamp")
+        return ballot
+    if ballot.cast_at.tzinfo is not None:
+        ballot.cast_at = ballot.cast_at.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    if ballot.cast_at > latest:
+        ballot.reject(SYNC_INVALID, "cast_at is in the future")
+        return ballot
+
+    ballot.kind, data = raw.get("type"), raw.get("ballot")
+    if not isinstance(data, dict):
+        ballot.reject(SYNC_INVALID, "ballot is required")
+        return ballot
+    ballot.data = data = dict(data)
+    if ballot.kind == "student":
+        for field in ("voter_name", "voter_reg_number", "voter_school"):
+            if not data.get(field):
+                ballot.reject(SYNC_INVALID, f"{field} is required")
+                return ballot
+        ballot.reg_key = data["voter_reg_number"] = normalize_reg_number(data["voter_reg_number"])
+        definition = ballot_definition()
+        ballot.choices = resolve_ballot(data, definition)
+        if len(ballot.choices) < definition.named(data):
+            ballot.reject(SYNC_INVALID_CANDIDATE, "Candidate not found in chosen leaders")
+            return ballot
+        if not ballot.choices and not definition.allows_blank:
+            ballot.reject(SYNC_INVALID, "Select a candidate for at least one position")
+            return ballot
+    elif ballot.kind == "delegate":
+        if not data.get("voterRegNumber") or not data.get("candidateId"):
+            ballot.reject(SYNC_INVALID, "Voter registration number and candidate ID are required")
+            return ballot
+        ballot.reg_key = normalize_reg_number(data["voterRegNumber"])
+        try:
+            ballot.candidate_id = int(data["candidateId"])
+        except (TypeError, ValueError):
+            ballot.reject(SYNC_INVALID_CANDIDATE, "Invalid candidate ID format")
+            return ballot
+        if ballot.candidate_id not in candidate_ids:
+            ballot.reject(SYNC_INVALID_CANDIDATE, "Candidate not found")
+            return ballot
+    else:
+        ballot.reject(SYNC_INVALID, "type must be student or delegate")
+        return ballot
+
+    # Ballots already committed elsewhere are turned away without touching SQLite; a voter
+    # casts one ballot of each kind, as the ledger's (voter, kind) unique index allows
+    entry = voted.lookup(ballot.reg_key)
+    if entry is not None and (entry.voted_at if ballot.kind == "student" else entry.vote_time) is not None:
+        ballot.reject(SYNC_DUPLICATE, "Voter has already voted")
+    return ballot
+
+def record_synced_ballots(conn, station_id, ballots):
+    """Write a station's ballots in one transaction; each one that fails is undone on its own"""
+    for ballot in ballots:
+        origin = (ballot.cast_at.strftime(CAST_AT_FORMAT), station_id, ballot.client_ballot_id)
+        conn.execute("SAVEPOINT synced_ballot")
+        mark = journal.mark()
+        try:
+            if ballot.kind == "student":
+                payload, status = record_ballot(conn, ballot.data, ballot.choices, *origin)
+            else:
+                payload, status = record_delegate_vote(conn, ballot.reg_key, ballot.candidate_id, *origin)
+        except DatabaseBusy:
+            raise
+        except Exception as e:
+            payload, status = {"error": f"Ballot could not be recorded: {e}"}, 500
+        if status >= 400:
+            conn.execute("ROLLBACK TO synced_ballot")
+            journal.discard(mark)
+            if status == 400 and conn.execute(
+                "SELECT 1 FROM ballots WHERE station_id = ? AND client_ballot_id = ?",
+                (station_id, ballot.client_ballot_id)
+            ).fetchone():
+                # A concurrent sync of the same batch recorded it first
+                ballot.outcome = SYNC_ACCEPTED
+            elif status == 400:
+                ballot.reject(SYNC_DUPLICATE, payload["error"])
+            elif payload["error"] == "Candidate not found":
+                ballot.reject(SYNC_INVALID_CANDIDATE, payload["error"])
+            elif status >= 500:
+                ballot.reject(SYNC_ERROR, payload["error"])
+            else:
+                ballot.reject(SYNC_INVALID, payload["error"])
+        else:
+            ballot.outcome = SYNC_ACCEPTED
+        conn.execute("RELEASE synced_ballot")
+    return {"accepted": sum(1 for ballot in ballots if ballot.outcome == SYNC_ACCEPTED)}, 200
+
+@vote_bp.route("/api/votes/sync", methods=["POST", "OPTIONS"])
+def sync_ballots():
+    """Accept a batch of ballots queued by an offline polling station"""
+    if request.method == "OPTIONS":
+        response = jsonify({"status": "ok"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        return response, 200
+
+    if not SYNC_SECRET:
+        print("Ballot sync refused: BALLOT_SYNC_SECRET is not set")
+        return jsonify({"error": "Ballot sync is not configured on this server"}), 503
+
+    data = request.get_json(silent=True) or {}
+    station_id = data.get("station_id")
+    raw_ballots = data.get("ballots")
+    if not isinstance(station_id, str) or not station_id:
+        return jsonify({"error": "station_id is required"}), 400
+    if not isinstance(raw_ballots, list) or not raw_ballots:
+        return jsonify({"error": "ballots must be a non-empty list"}), 400
+    if len(raw_ballots) > SYNC_MAX_BALLOTS:
+        return jsonify({"error": f"At most {SYNC_MAX_BALLOTS} ballots per sync"}), 413
+
+    try:
+        candidate_ids = query_cache.get("candidate_ids", ("candidates",), load_candidate_ids)
+        # Catch up with every worker's ballots once, then check the whole batch in memory
+        voted.refresh()
+        synced = load_synced_ids(station_id, [raw.get("client_ballot_id") for raw in raw_ballots if isinstance(raw, dict)])
+        # Naive UTC, as cast_at is stored
+        latest = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        latest += datetime.timedelta(seconds=SYNC_CLOCK_SKEW_S)
+        seen = set()
+        ballots = [check_synced_ballot(station_id, raw, seen, synced, candidate_ids, latest) for raw in raw_ballots]
+
+        # Earliest cast first, so when a batch holds two ballots from one voter the first one counts
+        pending = sorted((ballot for ballot in ballots if ballot.outcome is None), key=lambda ballot: ballot.cast_at)
+        if pending:
+            try:
+                submit_ballot(lambda conn: record_synced_ballots(conn, station_id, pending))
+            except DatabaseBusy:
+                raise
+            except Exception as e:
+                # The transaction rolled back, so none of them is recorded
+                print(f"Ballot sync from {station_id} failed: {e}")
+                for ballot in pending:
+                    ballot.reject(SYNC_ERROR, f"Ballots could not be recorded: {e}")
+            voted.refresh()
+
+        results = [ballot.result() for ballot in ballots]
+        accepted = sum(1 for ballot in ballots if ballot.outcome == SYNC_ACCEPTED)
+        print(f"Ballot sync from {station_id}: {accepted} of {len(ballots)} accepted")
+        response = jsonify({
+            "station_id": station_id,
+            "received": len(ballots),
+            "accepted": accepted,
+            "results": results
+        })
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response, 200
+
+    except DatabaseBusy:
+        raise
+    except Exception as e:
+        print("Ballot sync error:", str(e))
+        return jsonify({"error": f"Ballot sync failed: {str(e)}"}), 500
+
 @vote_bp.route("/api/votes/results", methods=["GET"])
 def get_vote_results():
     """Get voting results summary"""
     try:
-        with get_db_connection() as conn:
-            # Get total votes cast (count distinct voters)
-            total_votes = conn.execute(
-                "SELECT COUNT(DISTINCT voter_reg_number) as count FROM votes"
-            ).fetchone()["count"]
-            
-            # Get results by position from vote_results table
-            results_by_position = {}
-            positions = ["chairperson", "vice_chair", "secretary", "treasurer", "academic", "welfare", "sports"]
-            
-            for position in positions:
-                results = conn.execute(
-                    """
-                    SELECT candidate_reg_number, candidate_name, votes 
-                    FROM vote_results 
-                    WHERE position = ? 
-                    ORDER BY votes DESC
-                    """,
-                    (position,)
-                ).fetchall()
-                
-                results_by_position[position] = [dict(result) for result in results]
-            
-            # Get votes by school
-            votes_by_school = conn.execute(
-                """
-                SELECT voter_school as school, COUNT(DISTINCT voter_reg_number) as votes 
-                FROM votes 
-                GROUP BY voter_school 
-                ORDER BY votes DESC
-                """
-            ).fetchall()
+        definition = ballot_definition()
+        with get_snapshot_connection() as snapshot:
+            total_votes = 0
+            tallies = {position.key: [] for position in definition.positions}
+            school_votes = {}
+
+            # Voters and their schools, counted by the ledger's triggers
+            for result in snapshot.execute(
+                "SELECT school, voters FROM turnout WHERE kind = 'student' AND voters > 0"
+            ):
+                total_votes += result["voters"]
+                school_votes[result["school"]] = result["voters"]
+
+            # Student positions, sorted into the ballot definition's in memory; the
+            # 'delegate' position belongs to /api/results
+            for result in snapshot.execute(
+                "SELECT position, candidate_id, votes FROM tallies WHERE position != ? AND votes > 0",
+                (DELEGATE_POSITION,)
+            ):
+                leader = definition.by_id.get(result["candidate_id"])
+                if result["position"] not in tallies or leader is None:
+                    continue
+                tallies[result["position"]].append({
+                    "candidate_reg_number": leader.reg_number,
+                    "candidate_name": leader.full_name,
+                    "votes": result["votes"]
+                })
             
+            results_by_position = {
+                key: sorted(results, key=lambda result: result["votes"], reverse=True)
+                for key, results in tallies.items()
+            }
             response_data = {
                 "total_votes": total_votes,
                 "results_by_position": results_by_position,
-                "votes_by_school": [dict(result) for result in votes_by_school]
+                "positions": [
+                    {"key": position.key, "display_name": position.display_name} for position in definition.positions
+                ],
+                "votes_by_school": [
+                    {"school": school, "votes": votes}
+                    for school, votes in sorted(school_votes.items(), key=lambda item: item[1], reverse=True)
+                ],
+                "snapshot_age_seconds": snapshot_age(snapshot)
             }
             
         response = jsonify(response_data)
         response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers["X-Snapshot-Age"] = str(response_data["snapshot_age_seconds"])
         return response, 200
         
     except Exception as e:
         return jsonify({"error": f"Failed to fetch vote results: {str(e)}"}), 500
 
+@vote_bp.route("/api/votes/ballot", methods=["GET"])
+def get_ballot_definition():
+    """The student ballot: positions in order and the chosen leaders standing for each"""
+    try:
+        definition = ballot_definition()
+        response = jsonify({
+            "version": definition.version,
+            "positions": [
+                {
+                    "key": position.key,
+                    "displayName": position.display_name,
+                    "ordering": position.ordering,
+                    "eligibility": position.eligibility,
+                    "candidates": [
+                        {"id": leader.id, "fullName": leader.full_name, "regNumber": leader.reg_number}
+                        for leader in definition.candidates[position.key]
+                    ]
+                }
+                for position in definition.positions
+            ]
+        })
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response, 200
+
+    except Exception as e:
+        return jsonify({"error": f"Failed to fetch ballot: {str(e)}"}), 500
+
 @vote_bp.route("/api/votes/check/<reg_number>", methods=["GET"])
 def check_vote_status(reg_number):
     """Check if a student has already voted"""
     try:
-        with get_db_connection() as conn:
-            vote = conn.execute(
-                "SELECT id, voted_at FROM votes WHERE voter_reg_number = ? LIMIT 1",
-                (reg_number,)
-            ).fetchone()
+        # Answered from the in-memory voted-set (voted.py), not SQLite; only a student ballot counts here
+        vote = voted.lookup(normalize_reg_number(reg_number))
+
+        if vote is not None and vote.voted_at is not None:
+            return jsonify({
+                "has_voted": True,
+                "voted_at": vote.voted_at
+            }), 200
+        else:
+            return jsonify({
+                "has_voted": False
+            }), 200
             
-            if vote:
-                return jsonify({
-                    "has_voted": True,
-                    "voted_at": vote["voted_at"]
-                }), 200
-            else:
-                return jsonify({
-                    "has_voted": False
-                }), 200
-                
     except Exception as e:
         return jsonify({"error": f"Failed to check vote status: {str(e)}"}), 500
 
@@ -227,30 +474,24 @@ def get_all_votes():
     """Get all votes (for admin purposes)"""
     try:
         with get_db_connection() as conn:
-            # Get unique votes by voter (latest vote per voter)
+            # One row per vote (choice), student and delegate ballots alike, newest ballot first;
+            # delegate votes have no position, as in the old votes table
             votes = conn.execute(
                 """
-                SELECT v1.* 
-                FROM votes v1
-                INNER JOIN (
-                    SELECT voter_reg_number, MAX(voted_at) as latest_vote
-                    FROM votes
-                    GROUP BY voter_reg_number
-                ) v2 ON v1.voter_reg_number = v2.voter_reg_number AND v1.voted_at = v2.latest_vote
-                ORDER BY v1.voted_at DESC
+                SELECT c.id, b.voter_id, b.user_type, c.candidate_id, b.voter_reg_number, b.voter_school,
+                       CASE WHEN b.kind = 'student' THEN c.position END AS position, b.cast_at AS voted_at,
+                       b.voter_name
+                FROM ballots b
+                JOIN ballot_choices c ON c.ballot_id = b.id
+                ORDER BY b.cast_at DESC
                 """
             ).fetchall()
             
             votes_list = []
             for vote in votes:
                 vote_dict = dict(vote)
-                # Get voter name from chosen_leaders or use reg number as fallback
-                voter_info = conn.execute(
-                    "SELECT full_name FROM chosen_leaders WHERE reg_number = ?",
-                    (vote_dict["voter_reg_number"],)
-                ).fetchone()
-                
-                vote_dict["voter_name"] = voter_info["full_name"] if voter_info else vote_dict["voter_reg_number"]
+                # Ballots carry the name the voter gave; fall back to the reg number
+                vote_dict["voter_name"] = vote_dict["voter_name"] or vote_dict["voter_reg_number"]
                 votes_list.append(vote_dict)
             
         response = jsonify({"votes": votes_list})
@@ -265,12 +506,15 @@ def get_all_votes():
 def get_vote_count():
     """Get total vote count (unique voters)"""
     try:
-        with get_db_connection() as conn:
+        with get_snapshot_connection() as conn:
             count = conn.execute(
-                "SELECT COUNT(DISTINCT voter_reg_number) as count FROM votes"
+                "SELECT COALESCE(SUM(voters), 0) as count FROM turnout WHERE kind = 'student'"
             ).fetchone()["count"]
+            age = snapshot_age(conn)
             
-        return jsonify({"total_votes": count}), 200
+        response = jsonify({"total_votes": count, "snapshot_age_seconds": age})
+        response.headers["X-Snapshot-Age"] = str(age)
+        return response, 200
         
     except Exception as e:
         return jsonify({"error": f"Failed to fetch vote count: {str(e)}"}), 500
@@ -285,15 +529,15 @@ def reset_votes():
         return response, 200
 
     try:
-        with get_db_connection() as conn:
-            conn.execute("DELETE FROM votes")
-            conn.execute("DELETE FROM vote_results")
-            conn.commit()
-            
-        response = jsonify({"message": "All votes have been reset"})
+        # Swaps in an empty ballot ledger, tallies included, in one short transaction
+        retired = reset_ballots()
+
+        response = jsonify({"message": "All votes have been reset", "retired_tables": retired})
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 200
         
+    except DatabaseBusy:
+        raise
     except Exception as e:
         return jsonify({"error": f"Failed to reset votes: {str(e)}"}), 500
 
@@ -303,24 +547,26 @@ def debug_votes():
     """Debug endpoint to check database structure"""
     try:
         with get_db_connection() as conn:
-            # Check votes table structure
-            votes_columns = conn.execute("PRAGMA table_info(votes)").fetchall()
-            vote_results_columns = conn.execute("PRAGMA table_info(vote_results)").fetchall()
+            # Check ledger table structure
+            ballots_columns = conn.execute("PRAGMA table_info(ballots)").fetchall()
+            choices_columns = conn.execute("PRAGMA table_info(ballot_choices)").fetchall()
             
             # Get some sample data
-            votes_count = conn.execute("SELECT COUNT(*) as count FROM votes").fetchone()["count"]
-            unique_voters = conn.execute("SELECT COUNT(DISTINCT voter_reg_number) as count FROM votes").fetchone()["count"]
-            vote_results_count = conn.execute("SELECT COUNT(*) as count FROM vote_results").fetchone()["count"]
+            choices_count = conn.execute(
+                "SELECT COUNT(*) as count FROM ballot_choices c JOIN ballots b ON b.id = c.ballot_id WHERE b.kind = 'student'"
+            ).fetchone()["count"]
+            unique_voters = conn.execute("SELECT COUNT(*) as count FROM ballots WHERE kind = 'student'").fetchone()["count"]
+            tallies_count = conn.execute("SELECT COUNT(*) as count FROM tallies").fetchone()["count"]
             
             # Check chosen_leaders table
             chosen_leaders_count = conn.execute("SELECT COUNT(*) as count FROM chosen_leaders").fetchone()["count"]
             
             response_data = {
-                "votes_table_columns": [dict(col) for col in votes_columns],
-                "vote_results_table_columns": [dict(col) for col in vote_results_columns],
-                "votes_count": votes_count,
+                "ballots_table_columns": [dict(col) for col in ballots_columns],
+                "ballot_choices_table_columns": [dict(col) for col in choices_columns],
+                "votes_count": choices_count,
                 "unique_voters_count": unique_voters,
-                "vote_results_count": vote_results_count,
+                "tallies_count": tallies_count,
                 "chosen_leaders_count": chosen_leaders_count
             }
             
@@ -0,0 +1,197 @@
+"""In-memory registry of who has voted.
+
+/api/votes/check and /api/voter-records/check answer from one voted-set:
+a dict of canonical registration numbers (interned) to a small slotted entry
+holding the voter's student ballot time and their voter record (their
+delegate ballot). Each endpoint answers for its own kind of ballot, as the
+ledger's (voter, kind) unique index enforces one of each: /api/votes/check
+looks at voted_at and /api/voter-records/check at vote_time. It is loaded
+from the ballot ledger (ledger.py) and kept current two ways:
+
+- after each ballot this worker commits, refresh() catches up at once;
+- before answering, a lookup catches up with other workers at most every
+  VOTED_SYNC_MS, and only when PRAGMA data_version says something was
+  committed.
+
+Catching up reads rows past the highest id already seen, so it costs one
+range seek. When the ledger is replaced or shrinks (a reset swapped the
+tables) the registry is rebuilt. Rebuild by hand with POST /api/admin/voted/rebuild;
+`python voted.py` loads the registry and prints its footprint.
+"""
+import os
+import sys
+import threading
+import time
+
+from database import DB_PATH, connect
+from ledger import STUDENT
+
+# Configuration
+VOTED_SYNC_MS = float(os.environ.get('VOTED_SYNC_MS', '250'))
+
+
+class _Voted:
+    __slots__ = ("voted_at", "vote_time", "full_name")
+
+    def __init__(self):
+        self.voted_at = None
+        self.vote_time = None
+        self.full_name = None
+
+
+class _Source:
+    """The database file the registry reads ballots from"""
+    __slots__ = ("path", "conn", "data_version", "extent")
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = connect(path, readonly=True)
+        self.data_version = None
+        # (rootpage, lowest id, highest id) of the ballots loaded
+        self.extent = None
+
+
+class VotedRegistry:
+    def __init__(self, path=None, sync_ms=VOTED_SYNC_MS):
+        self.path = path
+        self.sync_interval = sync_ms / 1000.0
+        self._voters = {}
+        self._source = None
+        self._lock = threading.Lock()
+        self._last_sync = 0.0
+        self.loaded = False
+        self.checks = 0
+        self.syncs = 0
+        self.rebuilds = 0
+        self.last_rebuild_ms = None
+        self.last_error = None
+
+    @staticmethod
+    def _add(voters, rows):
+        for _, reg_key, at, full_name, kind in rows:
+            # Ballots cast in the same second share one timestamp string
+            at = sys.intern(at) if at else at
+            entry = voters.get(reg_key)
+            if entry is None:
+                entry = voters[sys.intern(reg_key)] = _Voted()
+            if kind == STUDENT:
+                entry.voted_at = at
+            else:
+                entry.vote_time = at
+                entry.full_name = full_name
+
+    def _catch_up(self, source, voters):
+        """Load ballots committed to source since the last call; False when the ledger was replaced or shrank"""
+        data_version = source.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == source.data_version:
+            return True
+        # The table's root page changes when a reset swaps the table
+        rootpage, low, high = source.conn.execute(
+            "SELECT (SELECT rootpage FROM sqlite_master WHERE type = 'table' AND name = 'ballots'), MIN(id), MAX(id) "
+            "FROM ballots"
+        ).fetchone()
+        seen = source.extent
+        if seen is not None and ((rootpage, low) != seen[:2] or (high or 0) < seen[2]):
+            return False
+        after = seen[2] if seen else 0
+        if high is not None and high > after:
+            # (id, reg_key, time, full_name, ballot kind)
+            self._add(voters, source.conn.execute(
+                "SELECT id, voter_reg_number, cast_at, voter_name, kind FROM ballots WHERE id > ?", (after,)
+            ).fetchall())
+        source.extent = (rootpage, low, max(high or 0, after))
+        source.data_version = data_version
+        return True
+
+    def _sync(self):
+        if not self._catch_up(self._source, self._voters):
+            self._rebuild()
+            return
+        self._last_sync = time.monotonic()
+        self.syncs += 1
+
+    def _rebuild(self):
+        start = time.monotonic()
+        if self._source is not None:
+            self._source.conn.close()
+        # Lookups keep answering from the old set until the new one is complete
+        source, voters = _Source(self.path or DB_PATH), {}
+        self._catch_up(source, voters)
+        self._source, self._voters = source, voters
+        self._last_sync = time.monotonic()
+        self.loaded = True
+        self.rebuilds += 1
+        self.last_rebuild_ms = round((time.monotonic() - start) * 1000, 1)
+
+    def rebuild(self):
+        """Reload every voter from the ledgers"""
+        with self._lock:
+            self._rebuild()
+            return self.stats()
+
+    def refresh(self):
+        """Catch up now, e.g. right after this worker committed a ballot"""
+        with self._lock:
+            try:
+                if self.loaded:
+                    self._sync()
+                else:
+                    self._rebuild()
+                self.last_error = None
+            except Exception as e:
+                # Answers stay as of the last good sync; the next lookup retries
+                self.last_error = str(e)
+                print(f"Voted registry sync failed: {e}")
+
+    def lookup(self, reg_key):
+        """Entry for a canonical registration number (voted_at, vote_time, full_name), or None before they vote"""
+        self.checks += 1
+        if not self.loaded or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.refresh()
+        return self._voters.get(reg_key)
+
+    def footprint(self):
+        """Approximate bytes held: the dict, its keys, entries and the strings they point to"""
+        voters = self._voters
+        total = sys.getsizeof(voters)
+        strings = set()
+        for key, entry in voters.items():
+            total += sys.getsizeof(key) + sys.getsizeof(entry)
+            for value in (entry.voted_at, entry.vote_time, entry.full_name):
+                if value is not None and id(value) not in strings:
+                    strings.add(id(value))
+                    total += sys.getsizeof(value)
+        return total
+
+    def stats(self):
+        voters = list(self._voters.values())
+        return {
+            "loaded": self.loaded,
+            "voters": len(voters),
+            "student_ballots": sum(1 for entry in voters if entry.voted_at is not None),
+            "voter_records": sum(1 for entry in voters if entry.vote_time is not None),
+            "bytes": self.footprint(),
+            "checks": self.checks,
+            "syncs": self.syncs,
+            "rebuilds": self.rebuilds,
+            "last_rebuild_ms": self.last_rebuild_ms,
+            "sync_interval_ms": self.sync_interval * 1000,
+            "last_error": self.last_error,
+        }
+
+
+voted = VotedRegistry()
+
+
+def start_registry():
+    voted.refresh()
+
+
+__all__ = ['VotedRegistry', 'start_registry', 'voted']
+
+
+if __name__ == "__main__":
+    stats = voted.rebuild()
+    print(f"{stats['voters']} voters ({stats['student_ballots']} student ballots, "
+          f"{stats['voter_records']} voter records) in {stats['bytes'] / 1024:.1f} KiB, "
+          f"loaded in {stats['last_rebuild_ms']} ms")
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 
 function CVote() {
   // State for form data
@@ -15,6 +15,9 @@ function CVote() {
     sports: "",
   });
 
+  // Idempotency key for the ballot being submitted; a retry of the same ballot reuses it
+  const submission = useRef({ body: null, key: null });
+
   // State for candidates by position - will be populated dynamically
   const [candidates, setCandidates] = useState({});
   const [availablePositions, setAvailablePositions] = useState([]);
@@ -33,7 +36,7 @@ function CVote() {
     secretary: "Secretary General",
     treasurer: "Finance Secretary",
     academic: "Academic Director",
-    welfare: "WellFair Director",
+    welfare: "Welfare Director",
     sports: "Sports and Entertainment Director", // FIXED: Match backend normalization
   };
 
@@ -162,12 +165,18 @@ function CVote() {
       console.log("🚀 Submitting vote data:", voteData);
       setDebugInfo(JSON.stringify(voteData, null, 2));
 
+      const body = JSON.stringify(voteData);
+      if (submission.current.body !== body) {
+        submission.current = { body, key: crypto.randomUUID() };
+      }
+
       const response = await fetch("http://localhost:5000/api/votes", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
+          "Idempotency-Key": submission.current.key,
         },
-        body: JSON.stringify(voteData),
+        body,
       });
 
       if (!response.ok) {
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { useNavigate } from "react-router-dom";
 
 const Delegates = () => {
@@ -12,6 +12,8 @@ const Delegates = () => {
   const [success, setSuccess] = useState(false);
   const [isLoading, setIsLoading] = useState(true);
   const navigate = useNavigate();
+  // Idempotency key for the ballot being submitted; a retry of the same ballot reuses it
+  const submission = useRef({ body: null, key: null });
 
   // STRICT SCHOOL MAPPING - No flexible matching
   const schoolMapping = {
@@ -116,15 +118,21 @@ const Delegates = () => {
         candidateName: selectedCandidate.full_name,
       });
 
+      const body = JSON.stringify({
+        voterRegNumber: voterData.registrationNumber,
+        candidateId: selectedCandidate.id,
+      });
+      if (submission.current.body !== body) {
+        submission.current = { body, key: crypto.randomUUID() };
+      }
+
       const response = await fetch("http://localhost:5000/api/vote", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
+          "Idempotency-Key": submission.current.key,
         },
-        body: JSON.stringify({
-          voterRegNumber: voterData.registrationNumber,
-          candidateId: selectedCandidate.id,
-        }),
+        body,
       });
 
       const responseData = await response.json();